@@ -0,0 +1,102 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+
+from sqlalchemy import create_engine as create_engine_
+from sqlalchemy.ext.automap import AutomapBase
+from sqlalchemy.orm import sessionmaker
+
+from src.config.db_setup import get_engine, pool_stats, session_factory
+from src.config.schema_cache import load_base
+from src.sql.base_sql_query import BaseSQLQuery
+from src.sql.datasets import QUERY_CLASSES
+
+
+@dataclass
+class ReportRun:
+    report: str
+    latency_ms: float
+    rows: int | None = None
+    error: str | None = None
+
+
+def run_report(
+        query_cls: type[BaseSQLQuery],
+        base: AutomapBase,
+        factory: sessionmaker,
+        name: str
+) -> ReportRun:
+    start = time.perf_counter()
+    try:
+        with factory() as session:
+            result = getattr(query_cls(base=base, session=session), name)()
+    except Exception as error:
+        return ReportRun(
+            report=name,
+            latency_ms=(time.perf_counter() - start) * 1000,
+            error=f'{type(error).__name__}: {error}'
+        )
+    rows = len(result) if isinstance(result, list) else int(result is not None)
+    return ReportRun(report=name, latency_ms=(time.perf_counter() - start) * 1000, rows=rows)
+
+
+def run_reports(
+        query_cls: type[BaseSQLQuery],
+        base: AutomapBase,
+        factory: sessionmaker,
+        names: list[str] | None = None,
+        workers: int = 4
+) -> list[ReportRun]:
+    """
+    Run reports of a query class on a thread pool, each one on its own session from the engine's pool.
+    Every registered report is run when no names are given.
+    """
+    names = names or query_cls.reports()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda name: run_report(query_cls, base, factory, name), names))
+
+
+def summarize(dataset: str, workers: int, wall_ms: float, runs: list[ReportRun]) -> dict:
+    return {
+        'dataset': dataset,
+        'workers': workers,
+        'wall_ms': round(wall_ms, 3),
+        'reports': len(runs),
+        'errors': sum(run.error is not None for run in runs),
+        'total_rows': sum(run.rows or 0 for run in runs),
+        'runs': [asdict(run) | {'latency_ms': round(run.latency_ms, 3)} for run in runs],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run every report of a dataset on a thread pool.')
+    parser.add_argument('dataset', choices=QUERY_CLASSES)
+    parser.add_argument('--url', help='database URL, defaults to the dataset\'s configured database')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--output', help='write the JSON timing report to this file instead of stdout')
+    parser.add_argument('reports', nargs='*', help='reports to run, defaults to all of them')
+    args = parser.parse_args()
+
+    engine = create_engine_(args.url) if args.url else get_engine(args.dataset)
+    base = load_base(engine)
+
+    start = time.perf_counter()
+    runs = run_reports(
+        QUERY_CLASSES[args.dataset], base, session_factory(engine), names=args.reports, workers=args.workers
+    )
+    summary = summarize(args.dataset, args.workers, (time.perf_counter() - start) * 1000, runs)
+    summary['pool'] = pool_stats(engine)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(summary, file, indent=2)
+    else:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import create_engine as create_engine_
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.config.db_setup import EngineSettings, async_session_factory, build_session, get_async_engine, get_engine
+from src.config.schema_cache import load_base, load_base_async
+from src.sql.async_sql_query import AsyncSQLQueryChinook, run_concurrently
+from src.sql.sql_query_chinook import SQLQueryChinook
+
+
+async def run_sequentially(base, session_factory, names: list[str]) -> dict:
+    results = {}
+    async with session_factory() as session:
+        sql_obj = AsyncSQLQueryChinook(base=base, session=session)
+        for name in names:
+            results[name] = await getattr(sql_obj, name)()
+    return results
+
+
+async def benchmark(engine, rounds: int) -> tuple[float, float, dict]:
+    base = await load_base_async(engine)
+    session_factory = async_session_factory(engine)
+    names = AsyncSQLQueryChinook.reports()
+
+    await run_concurrently(AsyncSQLQueryChinook, base, session_factory, names)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        sequential = await run_sequentially(base, session_factory, names)
+    sequential_ms = (time.perf_counter() - start) / rounds * 1000
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        concurrent = await run_concurrently(AsyncSQLQueryChinook, base, session_factory, names)
+    concurrent_ms = (time.perf_counter() - start) / rounds * 1000
+
+    results = {name: plain(rows) for name, rows in concurrent.items()}
+    await engine.dispose()
+    return sequential_ms, concurrent_ms, results
+
+
+def plain(result) -> list[tuple]:
+    """
+    Rows as plain tuples, mapped objects replaced by their column values, to compare both paths.
+    """
+    rows = result if isinstance(result, list) else [result]
+    return [
+        tuple(
+            tuple(getattr(value, column.key) for column in value.__table__.columns)
+            if hasattr(value, '__table__') else value
+            for value in row
+        )
+        for row in rows
+    ]
+
+
+def sync_results(engine) -> dict:
+    sql_obj = SQLQueryChinook(base=load_base(engine), session=build_session(engine=engine))
+    return {name: plain(getattr(sql_obj, name)()) for name in sql_obj.reports()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='All Chinook reports: asyncio.gather vs one after another.')
+    parser.add_argument('--url', help='database URL, defaults to the configured Chinook database')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.url:
+        engine = create_engine_(args.url)
+        async_engine = create_async_engine(EngineSettings(url=args.url).async_url)
+    else:
+        engine, async_engine = get_engine('chinook'), get_async_engine('chinook')
+    sequential_ms, concurrent_ms, results = asyncio.run(benchmark(async_engine, args.rounds))
+
+    expected = sync_results(engine)
+    mismatched = [name for name, rows in results.items() if rows != expected[name]]
+
+    print(f'{len(results)} reports, {args.rounds} rounds')
+    print(f'sequential: {sequential_ms:8.2f} ms per round')
+    print(f'concurrent: {concurrent_ms:8.2f} ms per round')
+    print('results match the sync path' if not mismatched else f'mismatched reports: {", ".join(mismatched)}')
+
+
+if __name__ == '__main__':
+    main()
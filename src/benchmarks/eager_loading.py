@@ -0,0 +1,89 @@
+import argparse
+import time
+import warnings
+
+from sqlalchemy import create_engine as create_engine_
+
+from src.config.db_setup import build_session, get_engine
+from src.config.schema_cache import load_base
+from src.sql.base_sql_query import BaseSQLQuery
+from src.sql.datasets import QUERY_CLASSES
+from src.sql.instrumentation import NPlusOneDetector, NPlusOneWarning
+from src.sql.loading import LoadingProfile
+
+
+def walk(objects, path: list[str]) -> int:
+    """
+    Touch the relationships of a path from each object, the way a template rendering them does.
+    """
+    if not path:
+        return len(objects)
+    touched = 0
+    for obj in objects:
+        value = getattr(obj, path[0])
+        related = value if isinstance(value, list) else [] if value is None else [value]
+        touched += walk(related, path[1:])
+    return touched
+
+
+def render(sql_obj: BaseSQLQuery, name: str, profile: LoadingProfile, rows: list) -> int:
+    statement = sql_obj.statement(name)
+    root = profile.root(statement)
+    index = next(
+        index for index, description in enumerate(statement.column_descriptions) if description['expr'] is root
+    )
+    entities = [row[index] for row in rows]
+    return sum(walk(entities, load.path.split('.')) for load in profile.loads if load.strategy != 'raise')
+
+
+def measure(sql_obj: BaseSQLQuery, detector: NPlusOneDetector, name: str, profile_name: str, lazy: bool) -> dict:
+    profile = sql_obj.loading_profiles(name)[profile_name]
+    sql_obj.session.expunge_all()
+    label = f'{name}:{profile_name}:{"lazy" if lazy else "profile"}'
+    start = time.perf_counter()
+    with detector.watch(label) as log:
+        rows = sql_obj.run_report(name) if lazy else sql_obj.load_report(name, profile_name)
+        touched = render(sql_obj, name, profile, rows)
+    return {
+        'rows': len(rows),
+        'touched': touched,
+        'statements': log.total,
+        'total_ms': (time.perf_counter() - start) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Statements and time of walking report entities with lazy loads vs their loading profiles.'
+    )
+    parser.add_argument('dataset', choices=QUERY_CLASSES)
+    parser.add_argument('--url', help='database URL, defaults to the dataset\'s configured database')
+    parser.add_argument('--threshold', type=int, default=10, help='statements per walk before warning of N+1')
+    args = parser.parse_args()
+
+    engine = create_engine_(args.url) if args.url else get_engine(args.dataset)
+    detector = NPlusOneDetector(engine, threshold=args.threshold)
+    sql_obj = QUERY_CLASSES[args.dataset](base=load_base(engine), session=build_session(engine=engine))
+
+    print(f'{"report":<30} {"profile":<12} {"mode":<8} {"rows":>6} {"touched":>8} {"statements":>11} {"total ms":>10}')
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', NPlusOneWarning)
+        for name in sql_obj.reports():
+            for profile_name, profile in sql_obj.loading_profiles(name).items():
+                if not profile.loads:
+                    continue
+                # Warm the statement and compiled caches so both modes pay only for execution and loading
+                measure(sql_obj, detector, name, profile_name, lazy=False)
+                for lazy in (True, False):
+                    stats = measure(sql_obj, detector, name, profile_name, lazy)
+                    print(
+                        f'{name:<30} {profile_name:<12} {"lazy" if lazy else "profile":<8} {stats["rows"]:>6} '
+                        f'{stats["touched"]:>8} {stats["statements"]:>11} {stats["total_ms"]:>10.2f}'
+                    )
+    for warning in caught:
+        print(f'warning: {warning.message}')
+    detector.remove()
+
+
+if __name__ == '__main__':
+    main()
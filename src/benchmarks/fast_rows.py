@@ -0,0 +1,62 @@
+import argparse
+import gc
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine as create_engine_
+
+from src.config.db_setup import build_session, get_engine
+from src.config.schema_cache import load_base
+from src.sql.base_sql_query import BaseSQLQuery
+from src.sql.datasets import QUERY_CLASSES
+
+DEFAULT_REPORTS = {
+    'northwind': ['alphabetical_list_of_products', 'order_details_extended', 'quarterly_orders_by_product'],
+    'chinook': ['line_item_track', 'brazil_customers', 'tracks_no_id'],
+}
+
+
+def measure(func, sql_obj: BaseSQLQuery) -> dict:
+    """
+    Time and memory of building a whole result; ``retained_kib`` is what the result keeps alive
+    (records, or ORM instances held by the session's identity map), ``peak_kib`` the high-water mark.
+    """
+    sql_obj.session.expunge_all()
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    total = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rows = len(result) if isinstance(result, list) else int(result is not None)
+    del result
+    sql_obj.session.expunge_all()
+    return {'rows': rows, 'total_ms': total * 1000, 'retained_kib': retained / 1024, 'peak_kib': peak / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ORM rows vs fast-row records: time, retained and peak memory.')
+    parser.add_argument('--dataset', choices=QUERY_CLASSES, default='chinook')
+    parser.add_argument('--url', help='database URL, defaults to the dataset\'s configured database')
+    parser.add_argument('reports', nargs='*', help='reports to measure, defaults to the entity-heavy ones')
+    args = parser.parse_args()
+
+    engine = create_engine_(args.url) if args.url else get_engine(args.dataset)
+    sql_obj = QUERY_CLASSES[args.dataset](base=load_base(engine), session=build_session(engine=engine))
+
+    print(f'{"report":<30} {"mode":<6} {"rows":>8} {"total ms":>10} {"retained KiB":>13} {"peak KiB":>10}')
+    for name in args.reports or DEFAULT_REPORTS[args.dataset]:
+        # Warm the statement and compiled caches so both modes pay only for execution and row handling
+        sql_obj.run_report(name)
+        sql_obj.fast_report(name)
+        for mode, func in (('orm', sql_obj.run_report), ('fast', sql_obj.fast_report)):
+            stats = measure(lambda: func(name), sql_obj)
+            print(
+                f'{name:<30} {mode:<6} {stats["rows"]:>8} {stats["total_ms"]:>10.2f} '
+                f'{stats["retained_kib"]:>13.1f} {stats["peak_kib"]:>10.1f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import statistics
+import time
+
+from sqlalchemy import Engine, MetaData, create_engine as create_engine_
+from sqlalchemy.ext.automap import automap_base
+
+from src.config.db_setup import build_session, get_engine
+from src.config.schema_cache import invalidate, load_base
+from src.sql.datasets import QUERY_CLASSES
+
+
+def uncached_start(engine: Engine, query_cls: type) -> None:
+    metadata = MetaData()
+    metadata.reflect(engine)
+    base = automap_base(metadata=metadata)
+    base.prepare()
+    query_cls(base=base, session=build_session(engine=engine))
+
+
+def cold_start(engine: Engine, query_cls: type) -> None:
+    invalidate(engine)
+    query_cls(base=load_base(engine), session=build_session(engine=engine))
+
+
+def warm_start(engine: Engine, query_cls: type) -> None:
+    query_cls(base=load_base(engine), session=build_session(engine=engine))
+
+
+def measure(func, engine: Engine, query_cls: type, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        engine.dispose()
+        start = time.perf_counter()
+        func(engine, query_cls)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare startup time with and without the schema snapshot.')
+    parser.add_argument('--dataset', choices=QUERY_CLASSES, default='northwind')
+    parser.add_argument('--url', help='database URL, defaults to the dataset\'s configured database')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    engine = create_engine_(args.url) if args.url else get_engine(args.dataset)
+    query_cls = QUERY_CLASSES[args.dataset]
+
+    for name, func in (('uncached', uncached_start), ('cold', cold_start), ('warm', warm_start)):
+        timings = measure(func, engine, query_cls, args.runs)
+        print(
+            f'{name:>8}: median {statistics.median(timings):8.2f} ms, '
+            f'min {min(timings):8.2f} ms, max {max(timings):8.2f} ms'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import time
+
+from sqlalchemy import create_engine as create_engine_
+
+from src.config.db_setup import build_session, get_engine
+from src.config.schema_cache import load_base
+from src.sql.base_sql_query import BaseSQLQuery
+from src.sql.datasets import QUERY_CLASSES
+
+
+def rebuilt_call(sql_obj: BaseSQLQuery, name: str) -> None:
+    """
+    The old behaviour: a new select() construct on every call.
+    """
+    statement = getattr(type(sql_obj), name).report_builder(sql_obj)
+    sql_obj.session.execute(statement).fetchall()
+
+
+def registered_call(sql_obj: BaseSQLQuery, name: str) -> None:
+    sql_obj.session.execute(sql_obj.statement(name)).fetchall()
+
+
+def per_call_us(func, sql_obj: BaseSQLQuery, name: str, calls: int) -> float:
+    func(sql_obj, name)
+    start = time.perf_counter()
+    for _ in range(calls):
+        func(sql_obj, name)
+    return (time.perf_counter() - start) / calls * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-call overhead of rebuilt vs registered report statements.')
+    parser.add_argument('--dataset', choices=QUERY_CLASSES, default='northwind')
+    parser.add_argument('--url', help='database URL, defaults to the dataset\'s configured database')
+    parser.add_argument('--calls', type=int, default=200)
+    args = parser.parse_args()
+
+    engine = create_engine_(args.url) if args.url else get_engine(args.dataset)
+    sql_obj = QUERY_CLASSES[args.dataset](base=load_base(engine), session=build_session(engine=engine))
+
+    total_before = total_after = 0.0
+    print(f'{"report":<32} {"rebuilt us":>12} {"registered us":>14} {"saved us":>10}')
+    for name in sql_obj.reports():
+        before = per_call_us(rebuilt_call, sql_obj, name, args.calls)
+        after = per_call_us(registered_call, sql_obj, name, args.calls)
+        total_before += before
+        total_after += after
+        print(f'{name:<32} {before:>12.1f} {after:>14.1f} {before - after:>10.1f}')
+    print(f'{"total":<32} {total_before:>12.1f} {total_after:>14.1f} {total_before - total_after:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
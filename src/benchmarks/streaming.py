@@ -0,0 +1,70 @@
+import argparse
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine as create_engine_
+
+from src.config.db_setup import build_session, get_engine
+from src.config.schema_cache import load_base
+from src.sql.base_sql_query import BaseSQLQuery
+from src.sql.datasets import QUERY_CLASSES
+
+DEFAULT_REPORTS = {
+    'northwind': ['quarterly_orders_by_product', 'order_details_extended', 'employee_sales_by_country'],
+    'chinook': ['line_item_track', 'tracks_no_id', 'line_item_track_artist'],
+}
+
+
+def measure(rows_iterator) -> dict:
+    """
+    Consume an iterator of rows, recording time to first row, total time and peak traced memory.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_row = None
+    count = 0
+    for _ in rows_iterator():
+        if first_row is None:
+            first_row = time.perf_counter() - start
+        count += 1
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'rows': count,
+        'first_row_ms': (first_row or total) * 1000,
+        'total_ms': total * 1000,
+        'peak_kib': peak / 1024,
+    }
+
+
+def compare(sql_obj: BaseSQLQuery, name: str, batch_size: int) -> tuple[dict, dict]:
+    fetchall = measure(lambda: iter(sql_obj.run_report(name)))
+    sql_obj.session.expunge_all()
+    streamed = measure(lambda: sql_obj.stream(name, batch_size=batch_size))
+    sql_obj.session.expunge_all()
+    return fetchall, streamed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak memory and time to first row: fetchall() vs streaming.')
+    parser.add_argument('--dataset', choices=QUERY_CLASSES, default='chinook')
+    parser.add_argument('--url', help='database URL, defaults to the dataset\'s configured database')
+    parser.add_argument('--batch-size', type=int, default=BaseSQLQuery.stream_batch_size)
+    parser.add_argument('reports', nargs='*', help='reports to measure, defaults to the largest ones')
+    args = parser.parse_args()
+
+    engine = create_engine_(args.url) if args.url else get_engine(args.dataset)
+    sql_obj = QUERY_CLASSES[args.dataset](base=load_base(engine), session=build_session(engine=engine))
+
+    print(f'{"report":<30} {"mode":<9} {"rows":>8} {"first row ms":>13} {"total ms":>10} {"peak KiB":>10}')
+    for name in args.reports or DEFAULT_REPORTS[args.dataset]:
+        for mode, stats in zip(('fetchall', 'stream'), compare(sql_obj, name, args.batch_size)):
+            print(
+                f'{name:<30} {mode:<9} {stats["rows"]:>8} {stats["first_row_ms"]:>13.2f} '
+                f'{stats["total_ms"]:>10.2f} {stats["peak_kib"]:>10.1f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import sqlalchemy
+from sqlalchemy import Engine, create_engine as create_engine_
+
+from src.config.db_setup import build_session, get_engine
+from src.config.embedded import scaled_sqlite_file
+from src.config.schema_cache import load_base
+from src.sql.base_sql_query import BaseSQLQuery
+from src.sql.datasets import QUERY_CLASSES
+
+# Public methods that are not registered reports
+EXTRA_METHODS = {
+    'northwind': [],
+    'chinook': [],
+}
+
+
+def sqlite_copy(dataset: str, factor: int = 1) -> Engine:
+    """
+    Engine for a local SQLite copy of a dataset: the embedded backend's copy of the bundled dump,
+    scaled on first use and rebuilt when the dump changes.
+    """
+    return create_engine_(f'sqlite:///{scaled_sqlite_file(dataset, factor)}')
+
+
+def _rows(result) -> int:
+    if isinstance(result, list):
+        return len(result)
+    return int(result is not None)
+
+
+def percentile(samples: list[float], percent: int) -> float:
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[percent - 1]
+
+
+def benchmark(sql_obj: BaseSQLQuery, name: str, runs: int, warmup: int) -> dict:
+    method = getattr(sql_obj, name)
+    for _ in range(warmup):
+        method()
+        sql_obj.session.expunge_all()
+
+    samples = []
+    rows = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        rows = _rows(method())
+        samples.append((time.perf_counter() - start) * 1000)
+        sql_obj.session.expunge_all()
+
+    # tracemalloc slows every allocation down, so memory gets a run of its own
+    tracemalloc.start()
+    method()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    sql_obj.session.expunge_all()
+
+    p50 = percentile(samples, 50)
+    return {
+        'runs': runs,
+        'rows': rows,
+        'p50_ms': round(p50, 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'rows_per_second': round(rows / p50 * 1000, 1) if p50 else 0.0,
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run_suite(datasets: list[str], backend: str, url: str | None, factor: int, runs: int, warmup: int,
+              reports: list[str] | None = None) -> dict:
+    results = {}
+    for dataset in datasets:
+        if url:
+            engine = create_engine_(url)
+        elif backend == 'sqlite':
+            engine = sqlite_copy(dataset, factor)
+        else:
+            engine = get_engine(dataset)
+        query_cls = QUERY_CLASSES[dataset]
+        sql_obj = query_cls(base=load_base(engine), session=build_session(engine=engine))
+        for name in [*query_cls.reports(), *EXTRA_METHODS[dataset]]:
+            if reports and name not in reports:
+                continue
+            results[f'{dataset}.{name}'] = benchmark(sql_obj, name, runs, warmup)
+            print(f'{dataset}.{name:<36} p50 {results[f"{dataset}.{name}"]["p50_ms"]:>10.3f} ms', file=sys.stderr)
+        sql_obj.session.close()
+        engine.dispose()
+
+    return {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'backend': 'url' if url else backend,
+            'scale': factor,
+            'runs': runs,
+            'warmup': warmup,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """
+    Print the p50 change of every benchmark against the baseline and return the ones slower than the threshold.
+    """
+    regressions = []
+    for key in ('backend', 'scale', 'sqlalchemy'):
+        if baseline['meta'].get(key) != current['meta'].get(key):
+            print(f'note: {key} differs, baseline {baseline["meta"].get(key)} vs {current["meta"].get(key)}')
+    print(f'{"benchmark":<48} {"base p50":>10} {"p50":>10} {"change":>8}')
+    for key, result in current['results'].items():
+        base = baseline['results'].get(key)
+        if base is None:
+            print(f'{key:<48} {"-":>10} {result["p50_ms"]:>10.3f} {"new":>8}')
+            continue
+        change = (result['p50_ms'] - base['p50_ms']) / base['p50_ms'] if base['p50_ms'] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        print(f'{key:<48} {base["p50_ms"]:>10.3f} {result["p50_ms"]:>10.3f} {change:>+8.1%}{flag}')
+    return regressions
+
+
+def print_results(results: dict) -> None:
+    print(
+        f'{"benchmark":<48} {"rows":>8} {"p50 ms":>10} {"p95 ms":>10} {"p99 ms":>10} '
+        f'{"rows/s":>12} {"peak KiB":>10}'
+    )
+    for key, result in results['results'].items():
+        print(
+            f'{key:<48} {result["rows"]:>8} {result["p50_ms"]:>10.3f} {result["p95_ms"]:>10.3f} '
+            f'{result["p99_ms"]:>10.3f} {result["rows_per_second"]:>12.1f} {result["peak_kib"]:>10.1f}'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency, throughput and memory of every report method.')
+    parser.add_argument('--dataset', choices=QUERY_CLASSES, action='append',
+                        help='dataset to run, may be repeated; defaults to all of them')
+    parser.add_argument('--backend', choices=('sqlite', 'configured'), default='sqlite',
+                        help='a local SQLite copy of the dumps, or the configured database (e.g. Postgres)')
+    parser.add_argument('--url', help='database URL to run a single dataset against')
+    parser.add_argument('--scale', type=int, default=1, help='scale factor of the SQLite copy')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--output', help='save the results as JSON')
+    parser.add_argument('--baseline', help='JSON of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative p50 slowdown counted as a regression, 0.2 is 20%%')
+    parser.add_argument('reports', nargs='*', help='methods to run, defaults to all of them')
+    args = parser.parse_args()
+
+    datasets = args.dataset or list(QUERY_CLASSES)
+    if args.url and len(datasets) != 1:
+        parser.error('--url needs exactly one --dataset')
+
+    results = run_suite(datasets, args.backend, args.url, args.scale, args.runs, args.warmup, args.reports)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if not args.baseline:
+        print_results(results)
+        return
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    regressions = compare(baseline, results, args.threshold)
+    if regressions:
+        print(f'{len(regressions)} regression(s) above {args.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import datetime
+import random
+import time
+from typing import Iterator
+
+from sqlalchemy import Connection, Engine, Integer, MetaData, Table, create_engine as create_engine_, func, select, text
+from sqlalchemy.types import Date, DateTime
+
+from src.config.db_setup import get_engine
+from src.config.dump_loader import LoadReport, TableStats
+from src.config.schema_cache import invalidate, load_base
+
+FACT_TABLES = {
+    'northwind': ['orders', 'order_details'],
+    'chinook': ['Invoice', 'InvoiceLine'],
+}
+
+_POSTGRES_INTEGER_LIMITS = {'SMALLINT': 32767, 'INTEGER': 2147483647}
+
+
+class DataScaler:
+    """
+    Grows the fact tables of a loaded dataset by a scale factor for load testing.
+    Copy ``k`` of every seed row gets its integer keys shifted by ``k`` times the key span of its table,
+    references to other scaled tables are shifted the same way so every copy stays referentially consistent,
+    references to the other tables are kept, which keeps the seed's key distribution,
+    and the dates of the row are moved together by a random number of days.
+    The run is deterministic for a given seed and scales whatever is in the tables at the start.
+    """
+
+    def __init__(self, engine: Engine, tables: list[str], factor: int, seed: int = 0,
+                 jitter_days: int = 30, batch_size: int = 5000) -> None:
+        if factor < 2:
+            raise ValueError('scale factor must be at least 2')
+        self.engine = engine
+        self.tables = tables
+        self.factor = factor
+        self.jitter_days = jitter_days
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+
+    def scale(self) -> LoadReport:
+        report = LoadReport()
+        started = time.perf_counter()
+        metadata = load_base(self.engine).metadata
+        tables = [table for table in metadata.sorted_tables if table.name in self.tables]
+        missing = set(self.tables) - {table.name for table in tables}
+        if missing:
+            raise ValueError(f'unknown tables: {", ".join(sorted(missing))}')
+
+        with self.engine.begin() as connection:
+            strides = {table.name: self._stride(connection, table) for table in tables}
+            seeds = {table.name: connection.execute(select(table)).mappings().all() for table in tables}
+            report.ddl_seconds = self._widen_keys(connection, metadata, strides)
+
+            for table in tables:
+                table_started = time.perf_counter()
+                batch = []
+                for row in self._copies(table, seeds[table.name], strides):
+                    batch.append(row)
+                    if len(batch) >= self.batch_size:
+                        connection.execute(table.insert(), batch)
+                        batch = []
+                if batch:
+                    connection.execute(table.insert(), batch)
+                report.tables[table.name] = TableStats(
+                    rows=len(seeds[table.name]) * (self.factor - 1),
+                    seconds=time.perf_counter() - table_started,
+                )
+
+            deferred_started = time.perf_counter()
+            self._finish(connection, tables)
+            report.deferred_seconds = time.perf_counter() - deferred_started
+
+        report.total_seconds = time.perf_counter() - started
+        return report
+
+    @staticmethod
+    def _key_column(table: Table):
+        columns = [
+            column for column in table.primary_key.columns
+            if isinstance(column.type, Integer) and not column.foreign_keys
+        ]
+        return columns[0] if len(columns) == 1 else None
+
+    def _stride(self, connection: Connection, table: Table) -> int | None:
+        """
+        Offset between two copies of the table's own integer key, None when the key comes from a parent table.
+        """
+        key = self._key_column(table)
+        if key is None:
+            if not any(
+                foreign_key.column.table.name in self.tables
+                for column in table.primary_key.columns for foreign_key in column.foreign_keys
+            ):
+                raise ValueError(f'{table.name} has neither an integer key nor a key from a scaled table')
+            return None
+        low, high = connection.execute(select(func.min(key), func.max(key))).one()
+        if low is None:
+            return 0
+        if low < 0:
+            raise ValueError(f'{table.name}.{key.name} has negative keys')
+        return high + 1
+
+    def _widen_keys(self, connection: Connection, metadata: MetaData, strides: dict[str, int | None]) -> float:
+        """
+        On Postgres, key columns too narrow for the scaled key range (Northwind uses smallint) become integer or bigint,
+        together with the columns referencing them.
+        """
+        if connection.dialect.name != 'postgresql':
+            return 0.0
+        started = time.perf_counter()
+        widened = False
+        for name, stride in strides.items():
+            if not stride:
+                continue
+            key = self._key_column(metadata.tables[name])
+            highest = stride * self.factor
+            limit = _POSTGRES_INTEGER_LIMITS.get(str(key.type).upper())
+            if limit is None or highest <= limit:
+                continue
+            type_ = 'integer' if highest <= _POSTGRES_INTEGER_LIMITS['INTEGER'] else 'bigint'
+            columns = [key] + [
+                foreign_key.parent for table in metadata.tables.values()
+                for foreign_key in table.foreign_keys if foreign_key.column is key
+            ]
+            for column in columns:
+                connection.execute(text(
+                    f'ALTER TABLE {connection.dialect.identifier_preparer.format_table(column.table)} '
+                    f'ALTER COLUMN {connection.dialect.identifier_preparer.format_column(column)} TYPE {type_}'
+                ))
+            widened = True
+        if widened:
+            invalidate(self.engine)
+        return time.perf_counter() - started
+
+    def _copies(self, table: Table, seed_rows, strides: dict[str, int | None]) -> Iterator[dict]:
+        shifted = {}
+        for column in table.columns:
+            if strides.get(table.name) and column is self._key_column(table):
+                shifted[column.name] = strides[table.name]
+            for foreign_key in column.foreign_keys:
+                stride = strides.get(foreign_key.column.table.name)
+                if stride:
+                    shifted[column.name] = stride
+        dates = [column.name for column in table.columns if isinstance(column.type, (Date, DateTime))]
+
+        for copy in range(1, self.factor):
+            for seed_row in seed_rows:
+                row = dict(seed_row)
+                for name, stride in shifted.items():
+                    if row[name] is not None:
+                        row[name] += stride * copy
+                if dates and self.jitter_days:
+                    delta = datetime.timedelta(days=self.random.randint(-self.jitter_days, self.jitter_days))
+                    for name in dates:
+                        if row[name] is not None:
+                            row[name] += delta
+                yield row
+
+    @staticmethod
+    def _finish(connection: Connection, tables: list[Table]) -> None:
+        if connection.dialect.name == 'postgresql':
+            for table in tables:
+                for column in table.primary_key.columns:
+                    connection.execute(text(
+                        'SELECT setval(pg_get_serial_sequence(:table, :column), max_key) '
+                        f'FROM (SELECT max({connection.dialect.identifier_preparer.format_column(column)}) AS max_key '
+                        f'FROM {connection.dialect.identifier_preparer.format_table(table)}) AS keys '
+                        'WHERE pg_get_serial_sequence(:table, :column) IS NOT NULL'
+                    ), {'table': connection.dialect.identifier_preparer.format_table(table), 'column': column.name})
+        connection.execute(text('ANALYZE'))
+
+
+def scale(dataset: str = 'northwind', factor: int = 10, engine: Engine | None = None,
+          tables: list[str] | None = None, seed: int = 0, jitter_days: int = 30,
+          batch_size: int = 5000) -> LoadReport:
+    scaler = DataScaler(
+        engine or get_engine(dataset), tables or FACT_TABLES[dataset], factor,
+        seed=seed, jitter_days=jitter_days, batch_size=batch_size,
+    )
+    return scaler.scale()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Grow a loaded dataset by a scale factor with synthetic copies.')
+    parser.add_argument('dataset', choices=FACT_TABLES)
+    parser.add_argument('factor', type=int, help='resulting size as a multiple of the current one, e.g. 10, 100, 1000')
+    parser.add_argument('--url', help='target database URL, defaults to the dataset\'s configured database')
+    parser.add_argument('--tables', nargs='+', help='tables to scale, defaults to the dataset\'s fact tables')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jitter-days', type=int, default=30, help='maximum shift of the dates of a copied row')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    print(scale(
+        dataset=args.dataset,
+        factor=args.factor,
+        engine=create_engine_(args.url) if args.url else None,
+        tables=args.tables,
+        seed=args.seed,
+        jitter_days=args.jitter_days,
+        batch_size=args.batch_size,
+    ))
@@ -0,0 +1,476 @@
+import io
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+from sqlalchemy import Connection, Engine, column, insert, table, text
+
+_TOKEN = re.compile(r"'|;|--|/\*")
+_INSERT = re.compile(
+    r'INSERT\s+INTO\s+(?P<table>"[^"]+"|\w+)\s*(?:\((?P<columns>[^)]*)\))?\s*VALUES\s*',
+    re.IGNORECASE,
+)
+_VALUE = re.compile(
+    r"""\s*(?:
+        (?P<string>N?'(?:[^']|'')*')
+        |(?P<null>NULL)
+        |(?P<bool>TRUE|FALSE)
+        |(?P<number>[-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+    )\s*(?P<end>[,)])""",
+    re.IGNORECASE | re.VERBOSE,
+)
+_CREATE_TABLE = re.compile(r'CREATE\s+TABLE\s+(?P<table>"[^"]+"|\w+)\s*\((?P<body>.*)\)\s*$', re.IGNORECASE | re.DOTALL)
+_ALTER_CONSTRAINT = re.compile(
+    r'ALTER\s+TABLE\s+(?:ONLY\s+)?(?P<table>"[^"]+"|\w+)\s+ADD\s+(?P<constraint>CONSTRAINT\s+.*)$',
+    re.IGNORECASE | re.DOTALL,
+)
+_CREATE_INDEX = re.compile(r'CREATE\s+(?:UNIQUE\s+)?INDEX\s', re.IGNORECASE)
+_CONSTRAINT_ITEM = re.compile(r'(CONSTRAINT|PRIMARY\s+KEY|FOREIGN\s+KEY|UNIQUE|CHECK)\b', re.IGNORECASE)
+_REFERENCES_WITHOUT_COLUMNS = re.compile(
+    r'REFERENCES\s+(?P<table>"[^"]+"|\w+)(?!\s*\()', re.IGNORECASE
+)
+_PRIMARY_KEY_COLUMNS = re.compile(r'PRIMARY\s+KEY\s*\((?P<columns>[^)]*)\)', re.IGNORECASE)
+_SLASH_DATE = re.compile(r'^(\d{4})/(\d{1,2})/(\d{1,2})$')
+
+_SQLITE_TYPES = (
+    (re.compile(r'\bcharacter varying\b', re.IGNORECASE), 'VARCHAR'),
+    (re.compile(r'\bbytea\b', re.IGNORECASE), 'BLOB'),
+    (re.compile(r'\btimestamp without time zone\b', re.IGNORECASE), 'TIMESTAMP'),
+)
+
+
+def unquote(identifier: str) -> str:
+    return identifier.strip().strip('"')
+
+
+@dataclass
+class TableStats:
+    rows: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class LoadReport:
+    tables: dict[str, TableStats] = field(default_factory=dict)
+    ddl_seconds: float = 0.0
+    deferred_seconds: float = 0.0
+    total_seconds: float = 0.0
+
+    def __str__(self) -> str:
+        lines = [
+            f'{name:<24} {stats.rows:>8} rows {stats.seconds:>8.3f} s {stats.rows_per_second:>12.0f} rows/s'
+            for name, stats in self.tables.items()
+        ]
+        lines.append(
+            f'ddl {self.ddl_seconds:.3f} s, deferred constraints/indexes {self.deferred_seconds:.3f} s, '
+            f'total {self.total_seconds:.3f} s'
+        )
+        return '\n'.join(lines)
+
+
+@dataclass
+class _TableDef:
+    name: str
+    identifier: str
+    columns: list[str] = field(default_factory=list)
+    column_defs: list[str] = field(default_factory=list)
+    types: dict[str, str] = field(default_factory=dict)
+    constraints: list[str] = field(default_factory=list)
+
+
+def iter_statements(path: Path) -> Iterator[str]:
+    """
+    Split a SQL script into statements while streaming it line by line.
+    Semicolons inside string literals and comments don't terminate a statement.
+    """
+    buffer = []
+    in_string = False
+    in_block_comment = False
+
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            position = 0
+            while position < len(line):
+                if in_block_comment:
+                    end = line.find('*/', position)
+                    if end == -1:
+                        position = len(line)
+                    else:
+                        in_block_comment = False
+                        position = end + 2
+                    continue
+                if in_string:
+                    end = line.find("'", position)
+                    if end == -1:
+                        buffer.append(line[position:])
+                        position = len(line)
+                    else:
+                        buffer.append(line[position:end + 1])
+                        in_string = False
+                        position = end + 1
+                    continue
+
+                match = _TOKEN.search(line, position)
+                if match is None:
+                    buffer.append(line[position:])
+                    break
+                buffer.append(line[position:match.start()])
+                token = match.group()
+                if token == "'":
+                    buffer.append(token)
+                    in_string = True
+                    position = match.end()
+                elif token == ';':
+                    statement = ''.join(buffer).strip()
+                    buffer = []
+                    if statement:
+                        yield statement
+                    position = match.end()
+                elif token == '--':
+                    buffer.append('\n')
+                    break
+                else:
+                    in_block_comment = True
+                    position = match.end()
+
+    statement = ''.join(buffer).strip()
+    if statement:
+        yield statement
+
+
+def _parse_literal(match: re.Match):
+    if match.group('string') is not None:
+        literal = match.group('string')
+        if literal[0] in 'Nn':
+            literal = literal[1:]
+        return literal[1:-1].replace("''", "'")
+    if match.group('null') is not None:
+        return None
+    if match.group('bool') is not None:
+        return match.group('bool').upper() == 'TRUE'
+    number = match.group('number')
+    if '.' in number or 'e' in number or 'E' in number:
+        return float(number)
+    return int(number)
+
+
+def parse_insert(statement: str) -> tuple[str, list[str] | None, list[tuple]]:
+    """
+    Parse ``INSERT INTO t [(columns)] VALUES (...)[, (...)]`` into the table name,
+    the optional column list and the row tuples.
+    """
+    header = _INSERT.match(statement)
+    if header is None:
+        raise ValueError(f'Unsupported INSERT statement: {statement[:80]}')
+
+    columns = None
+    if header.group('columns'):
+        columns = [unquote(name) for name in header.group('columns').split(',')]
+
+    rows = []
+    position = header.end()
+    while position < len(statement):
+        if statement[position] in ', \t\r\n':
+            position += 1
+            continue
+        if statement[position] != '(':
+            raise ValueError(f'Unexpected token in INSERT statement: {statement[position:position + 40]}')
+        position += 1
+        values = []
+        while True:
+            match = _VALUE.match(statement, position)
+            if match is None:
+                raise ValueError(f'Unsupported literal in INSERT statement: {statement[position:position + 40]}')
+            values.append(_parse_literal(match))
+            position = match.end()
+            if match.group('end') == ')':
+                break
+        rows.append(tuple(values))
+
+    return unquote(header.group('table')), columns, rows
+
+
+def _split_top_level(body: str) -> list[str]:
+    items, depth, start, in_string = [], 0, 0, False
+    for index, char in enumerate(body):
+        if char == "'":
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            items.append(body[start:index].strip())
+            start = index + 1
+    items.append(body[start:].strip())
+    return [item for item in items if item]
+
+
+def _parse_create_table(match: re.Match) -> _TableDef:
+    table_def = _TableDef(name=unquote(match.group('table')), identifier=match.group('table'))
+    for item in _split_top_level(match.group('body')):
+        if _CONSTRAINT_ITEM.match(item):
+            table_def.constraints.append(' '.join(item.split()))
+            continue
+        identifier, _, rest = item.partition(' ')
+        name = unquote(identifier)
+        table_def.columns.append(name)
+        table_def.column_defs.append(' '.join(item.split()))
+        table_def.types[name] = rest.strip().lower()
+    return table_def
+
+
+class DumpLoader:
+    """
+    Streaming loader for plain SQL dumps such as Northwind.sql and Chinook.sql.
+
+    The dump is read twice: the first pass collects the DDL, the second one streams the data.
+    Tables are created without indexes and foreign keys, consecutive INSERTs of a table are
+    batched into multi-row inserts (or COPY FROM STDIN on psycopg2) and constraints and indexes
+    are created once all the data is loaded.
+    SQLite doesn't support ``ALTER TABLE ... ADD CONSTRAINT``, so there the keys are inlined
+    into ``CREATE TABLE`` and Postgres-only types and date literals are translated.
+    """
+
+    def __init__(self, engine: Engine, batch_size: int = 1000) -> None:
+        self.engine = engine
+        self.batch_size = batch_size
+        self.is_sqlite = engine.dialect.name == 'sqlite'
+        self.use_copy = engine.dialect.driver == 'psycopg2'
+
+        self._tables: dict[str, _TableDef] = {}
+        self._drops: list[str] = []
+        self._settings: list[str] = []
+        self._deferred: list[tuple[str, str]] = []
+        self._indexes: list[str] = []
+        self._other: list[str] = []
+
+    def load(self, path: Path) -> LoadReport:
+        report = LoadReport()
+        started = time.perf_counter()
+        self._collect_ddl(path)
+
+        with self.engine.begin() as connection:
+            ddl_started = time.perf_counter()
+            for statement in self._schema_statements():
+                connection.execute(text(statement))
+            report.ddl_seconds = time.perf_counter() - ddl_started
+
+            self._load_data(connection, path, report)
+
+            deferred_started = time.perf_counter()
+            for statement in self._deferred_statements():
+                connection.execute(text(statement))
+            report.deferred_seconds = time.perf_counter() - deferred_started
+
+        report.total_seconds = time.perf_counter() - started
+        return report
+
+    def _collect_ddl(self, path: Path) -> None:
+        for statement in iter_statements(path):
+            keyword = statement[:16].upper()
+            if keyword.startswith('INSERT'):
+                continue
+            if keyword.startswith('SET '):
+                self._settings.append(statement)
+            elif keyword.startswith('DROP '):
+                self._drops.append(statement)
+            elif (match := _CREATE_TABLE.match(statement)) is not None:
+                table_def = _parse_create_table(match)
+                self._tables[table_def.name] = table_def
+            elif (match := _ALTER_CONSTRAINT.match(statement)) is not None:
+                constraint = ' '.join(match.group('constraint').split())
+                self._deferred.append((unquote(match.group('table')), constraint))
+            elif _CREATE_INDEX.match(statement):
+                self._indexes.append(statement)
+            else:
+                self._other.append(statement)
+
+    def _schema_statements(self) -> list[str]:
+        statements = [] if self.is_sqlite else list(self._settings)
+        statements.extend(self._drops)
+        for table_def in self._tables.values():
+            items = list(table_def.column_defs)
+            if self.is_sqlite:
+                items = [self._sqlite_type(item) for item in items]
+                items.extend(table_def.constraints)
+                items.extend(
+                    self._resolve_references(constraint)
+                    for name, constraint in self._deferred if name == table_def.name
+                )
+            statements.append(f'CREATE TABLE {table_def.identifier} (\n    ' + ',\n    '.join(items) + '\n)')
+        return statements
+
+    def _deferred_statements(self) -> list[str]:
+        statements = []
+        if not self.is_sqlite:
+            constraints = [
+                (table_def.name, constraint)
+                for table_def in self._tables.values() for constraint in table_def.constraints
+            ] + self._deferred
+            # Primary and unique keys first: foreign keys need them on the referenced side
+            constraints.sort(key=lambda item: 'FOREIGN KEY' in item[1].upper())
+            statements.extend(
+                f'ALTER TABLE {self._tables[name].identifier} ADD {constraint}' for name, constraint in constraints
+            )
+        statements.extend(self._indexes)
+        statements.extend(self._other)
+        return statements
+
+    @staticmethod
+    def _sqlite_type(column_def: str) -> str:
+        for pattern, replacement in _SQLITE_TYPES:
+            column_def = pattern.sub(replacement, column_def)
+        return column_def
+
+    def _primary_key(self, table_name: str) -> str | None:
+        table_def = self._tables.get(table_name)
+        constraints = [] if table_def is None else list(table_def.constraints)
+        constraints.extend(constraint for name, constraint in self._deferred if name == table_name)
+        for constraint in constraints:
+            if (match := _PRIMARY_KEY_COLUMNS.search(constraint)) is not None:
+                return match.group('columns')
+        return None
+
+    def _resolve_references(self, constraint: str) -> str:
+        """
+        ``REFERENCES customers`` without a column list points to the primary key,
+        which SQLite (and its reflection) needs spelled out.
+        """
+
+        def replace(match: re.Match) -> str:
+            primary_key = self._primary_key(unquote(match.group('table')))
+            if primary_key is None:
+                return match.group()
+            return f'{match.group()} ({primary_key})'
+
+        return _REFERENCES_WITHOUT_COLUMNS.sub(replace, constraint)
+
+    def _load_data(self, connection: Connection, path: Path, report: LoadReport) -> None:
+        batch: list[tuple] = []
+        current: tuple[str, tuple[str, ...]] | None = None
+
+        for statement in iter_statements(path):
+            if not statement[:6].upper() == 'INSERT':
+                continue
+            name, columns, rows = parse_insert(statement)
+            key = (name, tuple(columns or self._tables[name].columns))
+            if key != current or len(batch) >= self.batch_size:
+                if batch:
+                    self._flush(connection, current, batch, report)
+                batch = []
+                current = key
+            batch.extend(rows)
+
+        if batch:
+            self._flush(connection, current, batch, report)
+
+    def _flush(
+            self,
+            connection: Connection,
+            key: tuple[str, tuple[str, ...]],
+            rows: list[tuple],
+            report: LoadReport
+    ) -> None:
+        name, columns = key
+        started = time.perf_counter()
+
+        if self.use_copy:
+            self._copy(connection, name, columns, rows)
+        else:
+            if self.is_sqlite:
+                rows = self._sqlite_rows(name, columns, rows)
+            target = table(name, *[column(column_name) for column_name in columns])
+            connection.execute(insert(target).values([dict(zip(columns, row)) for row in rows]))
+
+        stats = report.tables.setdefault(name, TableStats())
+        stats.rows += len(rows)
+        stats.seconds += time.perf_counter() - started
+
+    def _copy(self, connection: Connection, name: str, columns: tuple[str, ...], rows: list[tuple]) -> None:
+        quote = connection.dialect.identifier_preparer.quote
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_value(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        cursor = connection.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(
+                f'COPY {quote(name)} ({", ".join(quote(column_name) for column_name in columns)}) FROM STDIN',
+                buffer
+            )
+        finally:
+            cursor.close()
+
+    def _sqlite_rows(self, name: str, columns: tuple[str, ...], rows: list[tuple]) -> list[tuple]:
+        types = self._tables[name].types
+        converters = [_sqlite_converter(types.get(column_name, '')) for column_name in columns]
+        if not any(converters):
+            return rows
+        return [
+            tuple(value if converter is None or value is None else converter(value)
+                  for converter, value in zip(converters, row))
+            for row in rows
+        ]
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, str):
+        return (
+            value.replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r')
+        )
+    return str(value)
+
+
+def _sqlite_bytea(value):
+    if isinstance(value, str) and value.startswith('\\x'):
+        return bytes.fromhex(value[2:])
+    return value
+
+
+def _sqlite_date(value):
+    if isinstance(value, str) and (match := _SLASH_DATE.match(value)) is not None:
+        year, month, day = match.groups()
+        return f'{year}-{int(month):02d}-{int(day):02d}'
+    return value
+
+
+def _sqlite_timestamp(value):
+    if isinstance(value, str):
+        value = _sqlite_date(value)
+        if len(value) == 10:
+            return f'{value} 00:00:00.000000'
+    return value
+
+
+def _sqlite_converter(type_: str):
+    """
+    Values are stored in the formats SQLAlchemy's SQLite types read back.
+    """
+    if type_.startswith('bytea'):
+        return _sqlite_bytea
+    if type_.startswith('timestamp'):
+        return _sqlite_timestamp
+    if type_.startswith('date'):
+        return _sqlite_date
+    return None
+
+
+def load_dump(engine: Engine, path: Path, batch_size: int = 1000) -> LoadReport:
+    return DumpLoader(engine, batch_size=batch_size).load(path)
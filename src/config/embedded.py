@@ -0,0 +1,263 @@
+import argparse
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+import sqlalchemy
+from sqlalchemy import Engine, MetaData, create_engine as create_engine_, insert, select, types
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import QueuePool
+
+from src.config.data_scaler import scale
+from src.config.db_setup import ROOT, build_session
+from src.config.fill_bd import DUMPS, fill
+from src.config.schema_cache import load_base, store_metadata
+from src.sql.datasets import QUERY_CLASSES
+
+EMBEDDED_DIR = Path(os.environ.get('EMBEDDED_DB_DIR', ROOT / '.embedded'))
+BACKENDS = ('sqlite', 'duckdb')
+
+# Bump when the loader or the translation of the dumps changes, so cached databases are rebuilt
+LOADER_VERSION = 1
+
+_engines: dict[tuple[str, str], Engine] = {}
+# Shared in-memory SQLite databases live as long as one connection to them is open
+_keepers: dict[str, sqlite3.Connection] = {}
+_lock = threading.Lock()
+
+
+def require_duckdb() -> None:
+    try:
+        import duckdb_engine  # noqa: F401
+    except ModuleNotFoundError as error:
+        if error.name not in ('duckdb_engine', 'duckdb'):
+            raise
+        raise ImportError('the embedded DuckDB backend needs duckdb-engine: pip install duckdb-engine') from error
+    except ImportError as error:
+        # Installed but built against another SQLAlchemy, e.g. newer duckdb-engine releases import 2.0.x additions
+        raise ImportError(
+            f'duckdb-engine {_version("duckdb_engine")} does not work with SQLAlchemy {sqlalchemy.__version__} '
+            f'({error}); install the release pinned in requirements.txt'
+        ) from error
+
+
+def _version(distribution: str) -> str:
+    try:
+        return version(distribution)
+    except PackageNotFoundError:
+        return '(unknown version)'
+
+
+def dump_digest(dataset: str) -> str:
+    digest = hashlib.sha256(f'{LOADER_VERSION}:'.encode())
+    with DUMPS[dataset].open('rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _build(path: Path, load) -> Path:
+    """
+    Build a cached database file with ``load(building_path)`` unless it exists, and drop the copies of older dumps.
+    Files are named ``<dataset>-<digest>[-<variant>]<suffix>``.
+    """
+    if path.exists():
+        return path
+    EMBEDDED_DIR.mkdir(parents=True, exist_ok=True)
+    building = path.with_suffix(f'.{os.getpid()}.building')
+    building.unlink(missing_ok=True)
+    load(building)
+    os.replace(building, path)
+    dataset, digest = path.stem.split('-')[:2]
+    for stale in EMBEDDED_DIR.glob(f'{dataset}-*{path.suffix}'):
+        if stale.stem.split('-')[1] != digest:
+            stale.unlink(missing_ok=True)
+    return path
+
+
+def sqlite_file(dataset: str) -> Path:
+    """
+    SQLite database loaded from the dataset's bundled dump, cached under .embedded/ by the dump's digest.
+    """
+
+    def load(building: Path) -> None:
+        engine = create_engine_(f'sqlite:///{building}')
+        try:
+            fill(dataset, engine=engine)
+        finally:
+            engine.dispose()
+
+    return _build(EMBEDDED_DIR / f'{dataset}-{dump_digest(dataset)}.db', load)
+
+
+def scaled_sqlite_file(dataset: str, factor: int) -> Path:
+    """
+    SQLite database grown ``factor`` times by the data scaler, copied from the cached one and cached next to it.
+    """
+    if factor <= 1:
+        return sqlite_file(dataset)
+    source_path = sqlite_file(dataset)
+
+    def load(building: Path) -> None:
+        shutil.copyfile(source_path, building)
+        engine = create_engine_(f'sqlite:///{building}')
+        try:
+            scale(dataset, factor, engine=engine)
+        finally:
+            engine.dispose()
+
+    return _build(EMBEDDED_DIR / f'{dataset}-{dump_digest(dataset)}-x{factor}.db', load)
+
+
+def duckdb_file(dataset: str) -> Path:
+    """
+    DuckDB database copied table by table from the cached SQLite one.
+    Integer keys are created without sequences and self-referencing foreign keys are left out:
+    DuckDB checks foreign keys row by row on insert and cannot add them afterwards.
+    Single precision columns are widened to DOUBLE so their values read back as written in the dump.
+    """
+    require_duckdb()
+    source_path = sqlite_file(dataset)
+
+    def load(building: Path) -> None:
+        source = create_engine_(f'sqlite:///{source_path}')
+        target = create_engine_(f'duckdb:///{building}')
+        try:
+            metadata = _duckdb_metadata(source)
+            metadata.create_all(target)
+            with source.connect() as reader, target.begin() as writer:
+                for table in metadata.sorted_tables:
+                    result = reader.execution_options(yield_per=5000).execute(select(table))
+                    for partition in result.mappings().partitions():
+                        writer.execute(insert(table), partition)
+        finally:
+            source.dispose()
+            target.dispose()
+
+    return _build(EMBEDDED_DIR / f'{dataset}-{dump_digest(dataset)}.duckdb', load)
+
+
+def _duckdb_metadata(source: Engine) -> MetaData:
+    metadata = MetaData()
+    metadata.reflect(source)
+    for table in metadata.tables.values():
+        for column in table.columns:
+            # Otherwise integer primary keys are created as SERIAL, which DuckDB has no type for
+            column.autoincrement = False
+            if isinstance(column.type, types.Float):
+                column.type = types.Double()
+        for constraint in list(table.foreign_key_constraints):
+            if constraint.referred_table is table:
+                table.constraints.discard(constraint)
+                for column in constraint.columns:
+                    column.foreign_keys.difference_update(constraint.elements)
+    return metadata
+
+
+def _sqlite_memory_uri(dataset: str) -> str:
+    """
+    URI of a shared in-memory copy of the cached SQLite file, restored with the backup API on first use.
+    """
+    path = sqlite_file(dataset)
+    uri = f'file:embedded_{dataset}_{path.stem.split("-", 1)[1]}?mode=memory&cache=shared'
+    if uri not in _keepers:
+        keeper = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        with closing(sqlite3.connect(path)) as source:
+            source.backup(keeper)
+        _keepers[uri] = keeper
+    return uri
+
+
+def embedded_engine(dataset: str, backend: str = 'sqlite') -> Engine:
+    """
+    In-process engine of a dataset: an in-memory SQLite database shared by the engine's connections,
+    or the cached DuckDB file opened read-only. The dump is loaded once and the database reused across runs.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f'unknown embedded backend {backend!r}, expected one of {", ".join(BACKENDS)}')
+    key = (dataset, backend)
+    engine = _engines.get(key)
+    if engine is None:
+        with _lock:
+            engine = _engines.get(key)
+            if engine is None:
+                if backend == 'sqlite':
+                    # A regular pool: the default one for memory databases keeps a connection per thread
+                    engine = create_engine_(
+                        f'sqlite:///{_sqlite_memory_uri(dataset)}&uri=true',
+                        poolclass=QueuePool,
+                        connect_args={'check_same_thread': False},
+                    )
+                else:
+                    engine = _duckdb_engine(dataset)
+                _engines[key] = engine
+    return engine
+
+
+def _duckdb_engine(dataset: str) -> Engine:
+    path = duckdb_file(dataset)
+    engine = create_engine_(f'duckdb:///{path}', connect_args={'read_only': True})
+    # The automap base is built from the SQLite schema: it has the composite and self-referencing keys
+    # that DuckDB reflection leaves out
+    source = create_engine_(f'sqlite:///{sqlite_file(dataset)}')
+    try:
+        metadata = MetaData()
+        metadata.reflect(source)
+    finally:
+        source.dispose()
+    store_metadata(engine, metadata)
+    return engine
+
+
+def embedded_async_engine(dataset: str, backend: str = 'sqlite') -> AsyncEngine:
+    if backend != 'sqlite':
+        raise ValueError(f'the embedded {backend} backend has no asyncio driver')
+    with _lock:
+        uri = _sqlite_memory_uri(dataset)
+    return create_async_engine(f'sqlite+aiosqlite:///{uri}&uri=true')
+
+
+def dispose_embedded() -> None:
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        for keeper in _keepers.values():
+            keeper.close()
+        _keepers.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load a dataset into an in-process database and time its reports.')
+    parser.add_argument('dataset', choices=DUMPS)
+    parser.add_argument('--backend', choices=BACKENDS, default='sqlite')
+    parser.add_argument('--rebuild', action='store_true', help='reload the dump instead of using the cached database')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.rebuild:
+        for path in EMBEDDED_DIR.glob(f'{args.dataset}-*'):
+            path.unlink()
+    start = time.perf_counter()
+    engine = embedded_engine(args.dataset, args.backend)
+    sql_obj = QUERY_CLASSES[args.dataset](base=load_base(engine), session=build_session(engine=engine))
+    print(f'{"ready":<36} {(time.perf_counter() - start) * 1000:>10.2f} ms')
+
+    for name in sql_obj.reports():
+        sql_obj.run_report(name)
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            sql_obj.run_report(name)
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f'{name:<36} {min(timings):>10.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,29 @@
-from sqlalchemy import text
+import argparse
 
-from src.config.db_setup import build_session
+from sqlalchemy import Engine, create_engine as create_engine_
 
+from src.config.db_setup import ROOT, get_engine
+from src.config.dump_loader import LoadReport, load_dump
 
-def fill():
-    session = build_session()
-    with open('../../Northwind/Northwind.sql') as file:
-        session.execute(
-            text(
-                file.read()
-            )
-        )
-        session.commit()
+DUMPS = {
+    'northwind': ROOT / 'Northwind' / 'Northwind.sql',
+    'chinook': ROOT / 'Chinook' / 'Chinook.sql',
+}
+
+
+def fill(dataset: str = 'northwind', engine: Engine | None = None, batch_size: int = 1000) -> LoadReport:
+    return load_dump(engine or get_engine(dataset), DUMPS[dataset], batch_size=batch_size)
 
 
 if __name__ == '__main__':
-    fill()
+    parser = argparse.ArgumentParser(description='Load a bundled SQL dump into a database.')
+    parser.add_argument('dataset', nargs='?', choices=DUMPS, default='northwind')
+    parser.add_argument('--url', help='target database URL, defaults to the dataset\'s configured database')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(fill(
+        dataset=args.dataset,
+        engine=create_engine_(args.url) if args.url else None,
+        batch_size=args.batch_size
+    ))
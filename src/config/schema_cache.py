@@ -0,0 +1,141 @@
+import hashlib
+import os
+import pickle
+from contextlib import nullcontext
+from pathlib import Path
+
+from sqlalchemy import Connection, Engine, MetaData, inspect, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.ext.automap import automap_base, AutomapBase
+
+CACHE_DIR = Path(
+    os.environ.get('SCHEMA_CACHE_DIR', Path(__file__).resolve().parents[2] / '.schema_cache')
+)
+
+_FINGERPRINT_QUERIES = {
+    'postgresql': """
+        SELECT md5(
+            coalesce((
+                SELECT string_agg(
+                    c.relname || '.' || a.attname || ':' || format_type(a.atttypid, a.atttypmod)
+                    || ':' || a.attnotnull::text,
+                    ',' ORDER BY c.relname, a.attnum
+                )
+                FROM pg_attribute a
+                JOIN pg_class c ON c.oid = a.attrelid
+                WHERE c.relnamespace = current_schema()::regnamespace
+                  AND c.relkind IN ('r', 'v', 'p')
+                  AND a.attnum > 0
+                  AND NOT a.attisdropped
+            ), '')
+            || coalesce((
+                SELECT string_agg(
+                    conrelid::regclass::text || ':' || pg_get_constraintdef(oid),
+                    ',' ORDER BY conrelid::regclass::text, conname
+                )
+                FROM pg_constraint
+                WHERE connamespace = current_schema()::regnamespace
+            ), '')
+        )
+    """,
+    'sqlite': """
+        SELECT group_concat(name || ':' || coalesce(sql, ''), ';')
+        FROM (SELECT name, sql FROM sqlite_master WHERE type IN ('table', 'view', 'index') ORDER BY name)
+    """,
+    'duckdb': """
+        SELECT md5(coalesce(string_agg(
+            table_name || '.' || column_name || ':' || data_type || ':' || is_nullable,
+            ',' ORDER BY table_name, ordinal_position
+        ), ''))
+        FROM information_schema.columns
+        WHERE table_schema = current_schema()
+    """,
+}
+
+
+def _connect(bind: Engine | Connection):
+    # A connection already open is used as is and left open
+    return nullcontext(bind) if isinstance(bind, Connection) else bind.connect()
+
+
+def schema_fingerprint(bind: Engine | Connection) -> str:
+    """
+    Cheap digest of the current schema: one catalog query instead of a full reflection.
+    Dialects without a dedicated query fall back to hashing the inspector output.
+    """
+    query = _FINGERPRINT_QUERIES.get(bind.dialect.name)
+    with _connect(bind) as connection:
+        if query is not None:
+            raw = connection.execute(text(query)).scalar() or ''
+        else:
+            inspector = inspect(connection)
+            raw = repr(sorted(
+                (table, [(column['name'], str(column['type'])) for column in columns])
+                for (_, table), columns in inspector.get_multi_columns().items()
+            ))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def cache_path(engine: Engine) -> Path:
+    url = engine.url.render_as_string(hide_password=True)
+    return CACHE_DIR / f'{hashlib.sha256(url.encode()).hexdigest()[:32]}.pickle'
+
+
+def invalidate(engine: Engine) -> None:
+    cache_path(engine).unlink(missing_ok=True)
+
+
+def reflect_metadata(bind: Engine | Connection) -> MetaData:
+    """
+    Return the reflected MetaData of the engine's database.
+    The snapshot on disk is keyed by database URL and reused while the schema fingerprint matches,
+    otherwise the database is reflected again and the snapshot rewritten.
+    """
+    path = cache_path(bind.engine)
+    fingerprint = schema_fingerprint(bind)
+
+    if path.exists():
+        try:
+            with path.open('rb') as file:
+                snapshot = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            snapshot = None
+        if snapshot is not None and snapshot['fingerprint'] == fingerprint:
+            return snapshot['metadata']
+
+    metadata = MetaData()
+    metadata.reflect(bind)
+    store_metadata(bind.engine, metadata, fingerprint)
+    return metadata
+
+
+def store_metadata(engine: Engine, metadata: MetaData, fingerprint: str | None = None) -> None:
+    """
+    Write the schema snapshot of an engine, e.g. a MetaData known to be more complete than what its dialect reflects.
+    """
+    path = cache_path(engine)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    with tmp_path.open('wb') as file:
+        pickle.dump(
+            {'fingerprint': fingerprint or schema_fingerprint(engine), 'metadata': metadata},
+            file,
+            protocol=pickle.HIGHEST_PROTOCOL
+        )
+    os.replace(tmp_path, path)
+
+
+def load_base(bind: Engine | Connection) -> AutomapBase:
+    """
+    Automap base built from the cached schema snapshot.
+    Mapped classes can't be pickled, but preparing them from an already reflected MetaData
+    is pure Python and issues no queries.
+    """
+    base = automap_base(metadata=reflect_metadata(bind))
+    base.prepare()
+    return base
+
+
+async def load_base_async(engine: AsyncEngine) -> AutomapBase:
+    async with engine.connect() as connection:
+        return await connection.run_sync(load_base)
@@ -0,0 +1,250 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from sqlalchemy import Engine, make_url
+
+from src.config.db_setup import build_session, engine_for_url
+from src.config.schema_cache import load_base
+from src.sql.base_sql_query import BaseSQLQuery, record_type
+from src.sql.datasets import QUERY_CLASSES
+
+
+@dataclass(frozen=True)
+class MergeSpec:
+    """
+    How partial results of a report are combined across databases.
+    With ``group_by`` set, rows are regrouped on those columns, which must be the report's own GROUP BY
+    (or selected columns determining it), and ``sums`` are added up (counts included); the other columns keep
+    the value of the group's first row and every column keeps its place. Shards then run the report without
+    its LIMIT, since a shard's top N does not contain every group of the global top N. Without it the rows are
+    concatenated, made ``distinct`` if asked, and sorted and limited.
+    """
+    group_by: tuple[str, ...] | None = None
+    sums: tuple[str, ...] = ()
+    order_by: tuple[tuple[str, bool], ...] = ()
+    limit: int | None = None
+    distinct: bool = False
+
+    @property
+    def regroups(self) -> bool:
+        return self.group_by is not None
+
+
+def _asc(*names: str) -> tuple[tuple[str, bool], ...]:
+    return tuple((name, False) for name in names)
+
+
+# Reports missing here are concatenated in shard order. products_above_average_price and the other
+# reports comparing against a per-database aggregate cannot be merged from partial results.
+# Ranking reports are merged from their candidates, regrouped here if needed, and ranked once merged.
+# Reports grouped or sorted on columns they do not select keep those rows apart and in shard order:
+# employee_sales_by_country is sorted by employee id, quarterly_orders_by_product grouped by order date.
+# Per-order rows are never regrouped: tenants number their orders independently, the same order_id
+# in two databases is two orders.
+MERGE_SPECS: dict[str, dict[str, MergeSpec]] = {
+    'northwind': {
+        'order_subtotals': MergeSpec(order_by=_asc('order_id')),
+        'sales_by_year': MergeSpec(order_by=(('shipped_date', False), ('order_id', True))),
+        'alphabetical_list_of_products': MergeSpec(order_by=_asc('product_name')),
+        'order_details_extended': MergeSpec(order_by=_asc('order_id')),
+        'sales_by_category': MergeSpec(
+            group_by=('category_id', 'product_name', 'category_name'), sums=('product_sales',),
+            order_by=_asc('category_id', 'category_name', 'product_name'),
+        ),
+        'ten_most_expensive_products': MergeSpec(order_by=(('unit_price', True),), limit=10, distinct=True),
+        'most_expensive_products_per_category': MergeSpec(distinct=True),
+        'product_by_category': MergeSpec(order_by=_asc('category_name', 'product_name'), distinct=True),
+        'customer_and_suppliers_by_city': MergeSpec(order_by=_asc('city', 'company_name'), distinct=True),
+        'product_sales_for_1997': MergeSpec(
+            group_by=('category_name', 'product_name', 'shipped_quarter'), sums=('extend_price',),
+            order_by=_asc('category_name', 'product_name', 'shipped_quarter'),
+        ),
+        'quarterly_orders_by_product': MergeSpec(order_by=_asc('product_name', 'company_name')),
+    },
+    'chinook': {
+        'unique_invoice_countries': MergeSpec(distinct=True),
+        'total_invoices_year': MergeSpec(group_by=(), sums=('count_1',)),
+        'total_sales': MergeSpec(group_by=(), sums=('sum_1',)),
+        'extract_date_between_date': MergeSpec(group_by=(), sums=('by_date_range', 'by_year')),
+        'invoice_37_line_item_count': MergeSpec(group_by=(), sums=('count_1',)),
+        'country_invoices': MergeSpec(group_by=('BillingCountry',), sums=('count_1',), order_by=_asc('BillingCountry')),
+        'sales_agent_total_sales': MergeSpec(group_by=('EmployeeId', 'FirstName'), sums=('sum_1',)),
+        'top_2009_agent': MergeSpec(
+            group_by=('EmployeeId', 'FirstName'), sums=('sum_',), order_by=(('sum_', True),), limit=1,
+        ),
+        'sales_agent_customer_count': MergeSpec(group_by=('EmployeeId', 'FirstName'), sums=('count_1',)),
+        'sales_per_country': MergeSpec(group_by=('Country',), sums=('sum_1',), order_by=_asc('Country')),
+        'top_country': MergeSpec(group_by=('Country',), sums=('total',), order_by=(('total', True),), limit=1),
+        'top_2013_track': MergeSpec(group_by=('Name',), sums=('total',), order_by=(('total', True),), limit=10),
+        'top_5_tracks': MergeSpec(group_by=('Name',), sums=('total',), order_by=(('total', True),), limit=5),
+        'top_3_artists': MergeSpec(group_by=('Name',), sums=('total',), order_by=(('total', True),), limit=3),
+        'top_media_type': MergeSpec(group_by=('Name',), sums=('count',), order_by=(('count', True),), limit=1),
+        'top_agent_per_year': MergeSpec(group_by=('year', 'EmployeeId', 'FirstName'), sums=('total',)),
+        'top_tracks_per_genre': MergeSpec(group_by=('genre', 'TrackId', 'Name'), sums=('total',)),
+    },
+}
+
+
+@dataclass
+class ShardRun:
+    url: str
+    latency_ms: float
+    rows: int = 0
+    error: str | None = None
+
+
+@dataclass
+class FanoutResult:
+    report: str
+    rows: list | object
+    wall_ms: float
+    shards: list[ShardRun] = field(default_factory=list)
+
+    @property
+    def errors(self) -> list[ShardRun]:
+        return [shard for shard in self.shards if shard.error is not None]
+
+
+def _sort_key(value):
+    return (value is None, value)
+
+
+def merge(keys: list[str], partials: list[list[tuple]], spec: MergeSpec | None) -> list[tuple]:
+    rows = [row for partial in partials for row in partial]
+    if spec is None:
+        return rows
+
+    if spec.regroups:
+        group_indexes = [keys.index(name) for name in spec.group_by]
+        sum_indexes = [keys.index(name) for name in spec.sums]
+        groups: dict[tuple, list] = {}
+        for row in rows:
+            group = tuple(row[index] for index in group_indexes)
+            merged = groups.get(group)
+            if merged is None:
+                groups[group] = list(row)
+                continue
+            for index in sum_indexes:
+                if row[index] is not None:
+                    merged[index] = row[index] if merged[index] is None else merged[index] + row[index]
+        rows = [tuple(merged) for merged in groups.values()]
+    elif spec.distinct:
+        rows = list(dict.fromkeys(rows))
+
+    # Stable sorts from the last key to the first give the multi-column order with mixed directions
+    for name, descending in reversed(spec.order_by):
+        index = keys.index(name)
+        rows.sort(key=lambda row: _sort_key(row[index]), reverse=descending)
+    if spec.limit is not None:
+        rows = rows[:spec.limit]
+    return rows
+
+
+class FanoutExecutor:
+    """
+    Runs the same report on several databases with one thread per database and merges the partial results
+    according to the report's MergeSpec. Engines and automap bases are created once per URL,
+    the engines with the dataset's pool and timeout settings.
+    """
+
+    def __init__(self, dataset: str, urls: list[str], workers: int | None = None) -> None:
+        self.dataset = dataset
+        self.query_cls: type[BaseSQLQuery] = QUERY_CLASSES[dataset]
+        self.specs = MERGE_SPECS.get(dataset, {})
+        self.engines: dict[str, Engine] = {url: engine_for_url(url, dataset) for url in urls}
+        self.workers = workers or len(urls)
+        self._bases = {}
+
+    def close(self) -> None:
+        for engine in self.engines.values():
+            engine.dispose()
+
+    def _base(self, url: str):
+        base = self._bases.get(url)
+        if base is None:
+            base = self._bases[url] = load_base(self.engines[url])
+        return base
+
+    def _run_shard(self, url: str, name: str, params: dict, unlimited: bool) -> tuple[ShardRun, list, list[str]]:
+        start = time.perf_counter()
+        shard = ShardRun(url=make_url(url).render_as_string(hide_password=True), latency_ms=0.0)
+        rows, keys = [], []
+        try:
+            with build_session(engine=self.engines[url]) as session:
+                sql_obj = self.query_cls(base=self._base(url), session=session)
+                statement = sql_obj.flat_statement(name)
+                params = sql_obj.report_params(name) | sql_obj.bind(name, params)
+                report = getattr(self.query_cls, name)
+                if hasattr(report, 'ranking'):
+                    # The ranking is computed once the candidates of every shard are merged
+                    statement = report.ranking_builder(sql_obj)
+                    params.pop('n')
+                elif unlimited:
+                    statement = statement.limit(None)
+                result = session.connection().execute(statement, params)
+                keys = list(result.keys())
+                rows = [tuple(row) for row in result]
+            shard.rows = len(rows)
+        except Exception as error:
+            shard.error = f'{type(error).__name__}: {error}'
+        shard.latency_ms = (time.perf_counter() - start) * 1000
+        return shard, rows, keys
+
+    def run(self, name: str, **params) -> FanoutResult:
+        spec = self.specs.get(name)
+        unlimited = spec is not None and spec.regroups
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            runs = list(executor.map(lambda url: self._run_shard(url, name, params, unlimited), self.engines))
+
+        shards = [shard for shard, _, _ in runs]
+        keys = next((keys for shard, _, keys in runs if shard.error is None), None)
+        if keys is None:
+            # No shard answered: nothing to merge, the errors are in the shard runs
+            empty = None if getattr(self.query_cls, name).report_fetch == 'one' else []
+            return FanoutResult(report=name, rows=empty, wall_ms=(time.perf_counter() - start) * 1000, shards=shards)
+        rows = merge(keys, [rows for shard, rows, _ in runs if shard.error is None], spec)
+        ranking = getattr(getattr(self.query_cls, name), 'ranking', None)
+        if ranking is not None:
+            rows = ranking.rank_rows(keys, rows, params.get('n', ranking.n))
+            keys.append('position')
+        record = record_type(keys)
+        rows = [record._make(row) for row in rows]
+        if getattr(self.query_cls, name).report_fetch == 'one':
+            rows = rows[0] if rows else None
+        return FanoutResult(
+            report=name,
+            rows=rows,
+            wall_ms=(time.perf_counter() - start) * 1000,
+            shards=shards,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a report on several databases and merge the results.')
+    parser.add_argument('dataset', choices=QUERY_CLASSES)
+    parser.add_argument('report')
+    parser.add_argument('urls', nargs='+', help='database URLs of the shards/tenants')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--rows', type=int, default=10, help='merged rows to print')
+    args = parser.parse_args()
+
+    executor = FanoutExecutor(args.dataset, args.urls, workers=args.workers)
+    try:
+        result = executor.run(args.report)
+    finally:
+        executor.close()
+
+    for shard in result.shards:
+        status = shard.error or f'{shard.rows} rows'
+        print(f'{shard.url:<60} {shard.latency_ms:>10.2f} ms  {status}')
+    print(f'{"total":<60} {result.wall_ms:>10.2f} ms')
+    rows = result.rows if isinstance(result.rows, list) else [result.rows]
+    for row in rows[:args.rows]:
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
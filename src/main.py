@@ -1,18 +1,12 @@
-from sqlalchemy import MetaData
-from sqlalchemy.ext.automap import automap_base
-
 from src.config.db_setup import build_session, create_engine
+from src.config.schema_cache import load_base
 from src.sql.sql_query_northwind import SQLQueryNorthwind
 
 
 def main():
     engine = create_engine()
     session = build_session(engine=engine)
-    metadata = MetaData()
-    metadata.reflect(engine)
-    Base = automap_base(metadata=metadata)
-
-    Base.prepare()
+    Base = load_base(engine)
 
     sql_obj = SQLQueryNorthwind(base=Base, session=session)
 
@@ -0,0 +1,444 @@
+import argparse
+import asyncio
+import base64
+import json
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time
+from decimal import Decimal
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from src.config.db_setup import async_session_factory, dispose_async_engines, get_async_engine
+from src.config.schema_cache import load_base_async
+from src.sql.async_sql_query import AsyncBaseSQLQuery
+from src.sql.datasets import ASYNC_QUERY_CLASSES
+from src.sql.ranking import TIES
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    408: 'Request Timeout',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+# Query parameters of the server itself, the others are bind parameters of the report
+FORMAT, PARTITION_BY, TIES_PARAM = 'format', 'partition_by', 'ties'
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: dict[str, str] | None = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def parse_value(text: str, default):
+    """
+    A query string value converted to the type of the parameter's default.
+    """
+    try:
+        if isinstance(default, bool):
+            if text.lower() not in ('1', '0', 'true', 'false', 'yes', 'no'):
+                raise ValueError(text)
+            return text.lower() in ('1', 'true', 'yes')
+        if isinstance(default, datetime):
+            return datetime.fromisoformat(text)
+        if isinstance(default, date):
+            return date.fromisoformat(text)
+        if isinstance(default, (int, float, Decimal)):
+            return type(default)(text)
+    except (ValueError, ArithmeticError) as error:
+        raise HTTPError(400, f'invalid value {text!r} for a {type(default).__name__} parameter') from error
+    return text
+
+
+def json_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    if hasattr(value, '__table__'):
+        return {column.key: getattr(value, column.key) for column in value.__table__.columns}
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def row_object(row) -> dict:
+    return dict(zip(row._fields, row))
+
+
+def encode(document) -> bytes:
+    return json.dumps(document, default=json_value, ensure_ascii=False).encode()
+
+
+class ReportLimiter:
+    """
+    At most ``concurrency`` executions of a report at a time and ``max_queued`` waiting for a slot.
+    Requests beyond that are turned away with 503 at once, rather than piling up on the connection pool.
+    """
+
+    def __init__(self, concurrency: int, max_queued: int) -> None:
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.running = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked() and self.waiting >= self.max_queued:
+            raise HTTPError(503, 'too many requests for this report, retry shortly', {'Retry-After': '1'})
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+
+class ReportServer:
+    """
+    HTTP/JSON endpoints for the reports of the datasets:
+
+    - ``GET /`` lists the datasets and their reports,
+    - ``GET /<dataset>`` the reports with their parameters and defaults,
+    - ``GET /<dataset>/<report>?param=value`` runs a report, its rows as one JSON document,
+      or as chunked NDJSON with ``format=ndjson`` or ``Accept: application/x-ndjson``;
+      ranking reports also take ``partition_by`` (comma separated, empty for a global ranking) and ``ties``,
+    - ``GET /stats`` the request counters and per-report load.
+
+    Identical JSON requests arriving while one is in flight share its execution and its encoded body
+    (single-flight), so a burst of clients costs one query. NDJSON responses are streamed from a server-side
+    cursor batch by batch, each batch written once the client has taken the previous one.
+    """
+
+    def __init__(self, engines: dict[str, AsyncEngine], report_concurrency: int = 4, max_queued: int = 32,
+                 batch_size: int = 1000, keep_alive: float = 15.0) -> None:
+        self.engines = engines
+        self.report_concurrency = report_concurrency
+        self.max_queued = max_queued
+        self.batch_size = batch_size
+        self.keep_alive = keep_alive
+        self.bases = {}
+        self._prototypes: dict[str, AsyncBaseSQLQuery] = {}
+        self._limiters: dict[tuple[str, str], ReportLimiter] = {}
+        self._flights: dict[tuple, asyncio.Future] = {}
+        self.stats = {'requests': 0, 'executions': 0, 'coalesced': 0, 'rejected': 0, 'errors': 0}
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080) -> asyncio.Server:
+        for dataset, engine in self.engines.items():
+            self.bases[dataset] = await load_base_async(engine)
+            # Report statements and parameters are built from the base alone, no session needed
+            self._prototypes[dataset] = ASYNC_QUERY_CLASSES[dataset](base=self.bases[dataset], session=None)
+        return await asyncio.start_server(self.handle, host, port)
+
+    def limiter(self, dataset: str, name: str) -> ReportLimiter:
+        limiter = self._limiters.get((dataset, name))
+        if limiter is None:
+            limiter = self._limiters[(dataset, name)] = ReportLimiter(self.report_concurrency, self.max_queued)
+        return limiter
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.keep_alive)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HTTPError as error:
+                    # The rest of the request cannot be told apart from the next one: answer and close
+                    self.stats['requests'] += 1
+                    await self._send(writer, error.status, encode({'error': str(error)}), False, error.headers)
+                    break
+                if request is None:
+                    break
+                method, target, headers = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self.stats['requests'] += 1
+                try:
+                    await self.respond(writer, method, target, headers, keep_alive)
+                except HTTPError as error:
+                    if error.status == 503:
+                        self.stats['rejected'] += 1
+                    await self._send(writer, error.status, encode({'error': str(error)}), keep_alive, error.headers)
+                except ConnectionError:
+                    break
+                except Exception as error:
+                    self.stats['errors'] += 1
+                    await self._send(writer, 500, encode({'error': f'{type(error).__name__}: {error}'}), keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> tuple[str, str, dict] | None:
+        line = await _read_line(reader, HTTPError(400, 'request line too long'))
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode('latin-1').split()
+        except ValueError:
+            raise HTTPError(400, 'malformed request line')
+        headers = {}
+        while True:
+            line = await _read_line(reader, HTTPError(431, 'header line too long'))
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= 100:
+                raise HTTPError(431, 'too many headers')
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return method, target, headers
+
+    async def respond(self, writer: asyncio.StreamWriter, method: str, target: str, headers: dict,
+                      keep_alive: bool) -> None:
+        if method != 'GET':
+            raise HTTPError(405, f'{method} is not supported', {'Allow': 'GET'})
+        url = urlsplit(target)
+        path = [unquote(part) for part in url.path.split('/') if part]
+        query = dict(parse_qsl(url.query, keep_blank_values=True))
+
+        if not path:
+            body = {dataset: prototype.reports() for dataset, prototype in self._prototypes.items()}
+            return await self._send(writer, 200, encode(body), keep_alive)
+        if path == ['stats']:
+            return await self._send(writer, 200, encode(self.describe_load()), keep_alive)
+
+        dataset = path[0]
+        prototype = self._prototypes.get(dataset)
+        if prototype is None or len(path) > 2:
+            raise HTTPError(404, f'no such endpoint {url.path}')
+        if len(path) == 1:
+            return await self._send(writer, 200, encode(self.describe(dataset)), keep_alive)
+
+        name = path[1]
+        if name not in prototype.reports():
+            raise HTTPError(404, f'{dataset} has no report {name}')
+        ndjson = query.pop(FORMAT, None) == 'ndjson' or 'application/x-ndjson' in headers.get('accept', '')
+        ranking = self._ranking(prototype, name, query)
+        params = self._params(prototype, name, query)
+        if ndjson:
+            return await self._stream(writer, dataset, name, params, ranking, keep_alive)
+        body = await self.report_body(dataset, name, params, ranking)
+        await self._send(writer, 200, body, keep_alive)
+
+    def describe(self, dataset: str) -> dict:
+        prototype = self._prototypes[dataset]
+        reports = {}
+        for name in prototype.reports():
+            report = getattr(type(prototype), name)
+            reports[name] = {
+                'description': ' '.join((report.__doc__ or '').replace(':return:', '').split()) or None,
+                'fetch': report.report_fetch,
+                'params': prototype.report_params(name),
+            }
+            if hasattr(report, 'ranking'):
+                reports[name]['ranking'] = {
+                    'score': report.ranking.score,
+                    'partition_by': report.ranking.partition_by,
+                    'ties': report.ranking.ties,
+                }
+        return reports
+
+    def describe_load(self) -> dict:
+        return self.stats | {
+            'in_flight': len(self._flights),
+            'reports': {
+                f'{dataset}/{name}': {'running': limiter.running, 'waiting': limiter.waiting}
+                for (dataset, name), limiter in self._limiters.items()
+            },
+        }
+
+    @staticmethod
+    def _ranking(prototype: AsyncBaseSQLQuery, name: str, query: dict) -> tuple | None:
+        if PARTITION_BY not in query and TIES_PARAM not in query:
+            return None
+        if not hasattr(getattr(type(prototype), name), 'ranking'):
+            raise HTTPError(400, f'{name} is not a ranking report, it takes no {PARTITION_BY} or {TIES_PARAM}')
+        partition_by = query.pop(PARTITION_BY, None)
+        if partition_by is not None:
+            partition_by = tuple(column for column in partition_by.split(',') if column)
+        ties = query.pop(TIES_PARAM, None)
+        if ties is not None and ties not in TIES:
+            raise HTTPError(400, f'ties must be one of {", ".join(TIES)}')
+        try:
+            # Validated now so a bad column is a client error and not a failure of the shared execution
+            prototype.ranking_statement(name, prototype.top_ranking(name, partition_by, ties))
+        except ValueError as error:
+            raise HTTPError(400, str(error)) from error
+        return partition_by, ties
+
+    @staticmethod
+    def _params(prototype: AsyncBaseSQLQuery, name: str, query: dict) -> dict:
+        defaults = prototype.report_params(name)
+        unknown = set(query) - set(defaults)
+        if unknown:
+            raise HTTPError(400, f'{name} has no parameters {", ".join(sorted(unknown))}')
+        return {key: parse_value(text, defaults[key]) for key, text in query.items()}
+
+    async def report_body(self, dataset: str, name: str, params: dict, ranking: tuple | None = None) -> bytes:
+        """
+        Encoded result of a report, shared with every identical request already in flight.
+        Requests differing only by parameters left at their defaults are identical.
+        """
+        prototype = self._prototypes[dataset]
+        key = (dataset, name, ranking, tuple(sorted((prototype.report_params(name) | params).items())))
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = asyncio.ensure_future(self._execute(dataset, name, params, ranking))
+            flight.add_done_callback(lambda done: self._land(key, done))
+        else:
+            self.stats['coalesced'] += 1
+        # A client going away must not cancel the execution others are waiting for
+        return await asyncio.shield(flight)
+
+    def _land(self, key: tuple, flight: asyncio.Future) -> None:
+        self._flights.pop(key, None)
+        if not flight.cancelled():
+            # Retrieved here in case every waiter is gone
+            flight.exception()
+
+    async def _execute(self, dataset: str, name: str, params: dict, ranking: tuple | None) -> bytes:
+        async with self.limiter(dataset, name).slot():
+            self.stats['executions'] += 1
+            async with async_session_factory(self.engines[dataset])() as session:
+                sql_obj = ASYNC_QUERY_CLASSES[dataset](base=self.bases[dataset], session=session)
+                if ranking is None:
+                    result = await sql_obj.run_report(name, **params)
+                else:
+                    partition_by, ties = ranking
+                    result = await sql_obj.top(name, partition_by=partition_by, ties=ties, **params)
+        if isinstance(result, list):
+            return encode({'report': name, 'rows': [row_object(row) for row in result]})
+        return encode({'report': name, 'row': None if result is None else row_object(result)})
+
+    async def _stream(self, writer: asyncio.StreamWriter, dataset: str, name: str, params: dict,
+                      ranking: tuple | None, keep_alive: bool) -> None:
+        async with self.limiter(dataset, name).slot():
+            self.stats['executions'] += 1
+            async with async_session_factory(self.engines[dataset])() as session:
+                sql_obj = ASYNC_QUERY_CLASSES[dataset](base=self.bases[dataset], session=session)
+                if ranking is not None:
+                    # Rankings are bounded by n, they are fetched whole and sent as one batch
+                    partition_by, ties = ranking
+                    batches = _single(await sql_obj.top(name, partition_by=partition_by, ties=ties, **params))
+                else:
+                    batches = sql_obj.stream(name, batch_size=self.batch_size, partitions=True, **params)
+                started = False
+                try:
+                    async for batch in batches:
+                        if not started:
+                            writer.write(_head(200, keep_alive, {
+                                'Content-Type': 'application/x-ndjson', 'Transfer-Encoding': 'chunked',
+                            }))
+                            started = True
+                        lines = b''.join(encode(row_object(row)) + b'\n' for row in batch)
+                        writer.write(b'%x\r\n%s\r\n' % (len(lines), lines))
+                        await writer.drain()
+                except ConnectionError:
+                    raise
+                except Exception as error:
+                    if not started:
+                        raise
+                    # Headers are gone: the error becomes the last line of the stream
+                    self.stats['errors'] += 1
+                    line = encode({'error': f'{type(error).__name__}: {error}'}) + b'\n'
+                    writer.write(b'%x\r\n%s\r\n' % (len(line), line))
+                if not started:
+                    writer.write(_head(200, keep_alive, {
+                        'Content-Type': 'application/x-ndjson', 'Transfer-Encoding': 'chunked',
+                    }))
+                writer.write(b'0\r\n\r\n')
+                await writer.drain()
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, status: int, body: bytes, keep_alive: bool,
+                    headers: dict[str, str] | None = None) -> None:
+        writer.write(_head(status, keep_alive, {
+            'Content-Type': 'application/json', 'Content-Length': str(len(body)), **(headers or {}),
+        }) + body)
+        await writer.drain()
+
+
+def _head(status: int, keep_alive: bool, headers: dict[str, str]) -> bytes:
+    lines = [f'HTTP/1.1 {status} {REASONS.get(status, "")}', f'Connection: {"keep-alive" if keep_alive else "close"}']
+    lines.extend(f'{name}: {value}' for name, value in headers.items())
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def _read_line(reader: asyncio.StreamReader, too_long: HTTPError) -> bytes:
+    """
+    A line of the request, ``too_long`` raised for a line beyond the reader's limit.
+    """
+    try:
+        return await reader.readline()
+    except (asyncio.LimitOverrunError, ValueError) as error:
+        # readline() reports an overrun as a ValueError once it has discarded the line
+        raise too_long from error
+
+
+async def _single(rows: list):
+    if rows:
+        yield rows
+
+
+async def serve(args) -> None:
+    urls = dict(item.split('=', 1) for item in args.url)
+    engines = {
+        dataset: create_async_engine(urls[dataset]) if dataset in urls else get_async_engine(dataset)
+        for dataset in args.datasets
+    }
+    server = ReportServer(engines, report_concurrency=args.report_concurrency, max_queued=args.max_queued,
+                          batch_size=args.batch_size)
+    listener = await server.start(args.host, args.port)
+    print(f'serving {", ".join(args.datasets)} on http://{args.host}:{args.port}')
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        for dataset, engine in engines.items():
+            if dataset in urls:
+                await engine.dispose()
+        await dispose_async_engines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the reports over HTTP as JSON.')
+    parser.add_argument('datasets', nargs='*',
+                        help=f'datasets to serve among {", ".join(ASYNC_QUERY_CLASSES)}, defaults to all of them')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--url', action='append', default=[], metavar='DATASET=URL',
+                        help='async database URL of a dataset, defaults to its configured database')
+    parser.add_argument('--report-concurrency', type=int, default=4,
+                        help='executions of the same report at a time')
+    parser.add_argument('--max-queued', type=int, default=32,
+                        help='requests waiting for a report before further ones get 503')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows per NDJSON chunk')
+    args = parser.parse_args()
+    unknown = set(args.datasets) - set(ASYNC_QUERY_CLASSES)
+    if unknown:
+        parser.error(f'unknown datasets {", ".join(sorted(unknown))}')
+    args.datasets = args.datasets or list(ASYNC_QUERY_CLASSES)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
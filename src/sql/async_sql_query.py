@@ -0,0 +1,206 @@
+import asyncio
+from typing import AsyncIterator
+
+from sqlalchemy import Executable
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.ext.automap import AutomapBase
+
+from src.sql.base_sql_query import BaseSQLQuery, record_type
+from src.sql.pagination import Page, decode_cursor, encode_cursor, query_digest
+from src.sql.result_cache import returns_entities, statement_tables
+from src.sql.sql_query_chinook import SQLQueryChinook
+from src.sql.sql_query_northwind import SQLQueryNorthwind
+
+
+class AsyncBaseSQLQuery(BaseSQLQuery):
+    """
+    Runs the registered report statements on an AsyncSession: every report method returns a coroutine.
+    Reports go through the same result cache and rollups as the sync ones.
+    The columnar exports read the DBAPI cursor synchronously and are only available on a sync session.
+    An AsyncSession must not be shared by concurrent tasks, use run_concurrently() for that.
+    """
+    session: AsyncSession
+
+    async def run_report(self, name: str, **params):
+        params = self.bind(name, params)
+        with self.watch(name), self.measure(name) as metrics:
+            result = await self.cached_report(name, params)
+            if metrics is not None:
+                metrics.record(result)
+        if metrics is not None and self.instrumentation.explain:
+            metrics.plan = await self.session.run_sync(
+                lambda session: self.instrumentation.capture_plan(
+                    session.connection(), self.statement(name), self.report_params(name) | params
+                )
+            )
+        return result
+
+    async def cached_report(self, name: str, params: dict):
+        statement = self.statement(name)
+        if self.result_cache is None or returns_entities(statement):
+            return await self.execute_report(name, params)
+
+        key = self.cache_key(name, params)
+        found, result = self.result_cache.get(key)
+        if not found:
+            result = await self.execute_report(name, params)
+            self.result_cache.set(key, result, statement_tables(statement))
+        return result
+
+    async def resolve_async(self, name: str, params: dict) -> tuple[Executable, dict]:
+        if self.rollups is None:
+            return self.statement(name), params
+        # The rollup manager checks freshness on its own sync engine, kept off the event loop
+        return await asyncio.to_thread(self.resolve, name, params)
+
+    async def execute_report(self, name: str, params: dict):
+        result = await self.session.execute(*await self.resolve_async(name, params))
+        if getattr(type(self), name).report_fetch == 'one':
+            return result.fetchone()
+        return result.fetchall()
+
+    async def fast_report(self, name: str, **params):
+        statement, params = await self.resolve_async(name, self.bind(name, params))
+        if statement is self.statement(name):
+            statement = self.flat_statement(name)
+        with self.measure(name) as metrics:
+            result = await (await self.session.connection()).execute(statement, params)
+            record = record_type(result.keys())
+            if getattr(type(self), name).report_fetch == 'one':
+                row = result.fetchone()
+                records = None if row is None else record._make(row)
+            else:
+                records = list(map(record._make, result))
+            if metrics is not None:
+                metrics.record(records)
+        return records
+
+    async def paginate(self, name: str, page_size: int = 50, cursor: str | None = None, **params) -> Page:
+        if page_size < 1:
+            raise ValueError('page_size must be positive')
+        params = self.bind(name, params)
+        query = self.keyset_query(name)
+        digest = query_digest(name, self.report_params(name) | params)
+        statement, page_params = query.page_statement(
+            decode_cursor(cursor, digest) if cursor else None, page_size
+        )
+        with self.measure(name) as metrics:
+            result = await (await self.session.connection()).execute(statement, params | page_params)
+            record = record_type(list(result.keys())[:query.width])
+            rows, after = query.split(result, page_size)
+            rows = [record._make(row) for row in rows]
+            if metrics is not None:
+                metrics.record(rows)
+        return Page(rows=rows, next_cursor=None if after is None else encode_cursor(digest, after))
+
+    def _sync_only(self, method: str):
+        sync_class = next(klass for klass in type(self).__mro__ if not issubclass(klass, AsyncBaseSQLQuery))
+        raise TypeError(
+            f'{method}() reads the DBAPI cursor synchronously and needs a sync Session, '
+            f'run it with {sync_class.__name__} or inside AsyncSession.run_sync()'
+        )
+
+    def arrow_batches(self, name: str, *args, **kwargs):
+        self._sync_only('arrow_batches')
+
+    def to_arrow(self, name: str, *args, **kwargs):
+        self._sync_only('to_arrow')
+
+    def to_numpy(self, name: str, *args, **kwargs):
+        self._sync_only('to_numpy')
+
+    def to_parquet(self, name: str, *args, **kwargs):
+        self._sync_only('to_parquet')
+
+    async def load_report(self, name: str, profile: str, **params):
+        params = self.bind(name, params)
+        statement, unique = self.loading_statement(name, profile)
+        with self.watch(name), self.measure(name) as metrics:
+            result = await self.session.execute(statement, params)
+            if unique:
+                result = result.unique()
+            if getattr(type(self), name).report_fetch == 'one':
+                result = result.fetchone()
+            else:
+                result = result.fetchall()
+            if metrics is not None:
+                metrics.record(result)
+        return result
+
+    async def top(self, name: str, n: int | None = None, partition_by: tuple[str, ...] | None = None,
+                  ties: str | None = None, descending: bool | None = None, **params) -> list:
+        ranking = self.top_ranking(name, partition_by, ties, descending)
+        if n is not None:
+            if n < 1:
+                raise ValueError('n must be positive')
+            params['n'] = n
+        if ranking == getattr(type(self), name).ranking:
+            return await self.run_report(name, **params)
+
+        params = self.bind(name, params)
+        with self.watch(name), self.measure(name) as metrics:
+            result = (await self.session.execute(self.ranking_statement(name, ranking), params)).fetchall()
+            if metrics is not None:
+                metrics.record(result)
+        return result
+
+    async def run_bundle(self, name: str, **params) -> dict:
+        statement, _ = self.bundle_statement(name)
+        with self.measure(name) as metrics:
+            result = await self.session.execute(statement, self.bundle_params(name, params))
+            rows = result.fetchall()
+            results = self.split_bundle(name, rows)
+            if metrics is not None:
+                metrics.record(rows)
+        if self.result_cache is not None:
+            # Keys are probed on the sync side of the session, cache_bundle() then finds them known
+            reports = getattr(type(self), name).bundle_reports
+            await self.session.run_sync(
+                lambda session: [self.result_keys(report_name, session) for report_name in reports]
+            )
+            self.cache_bundle(name, params, rows)
+        return results
+
+    async def stream(self, name: str, batch_size: int | None = None, partitions: bool = False,
+                     **params) -> AsyncIterator:
+        batch_size = batch_size or self.stream_batch_size
+        statement, params = await self.resolve_async(name, self.bind(name, params))
+        result = await self.session.stream(statement, params, execution_options={'yield_per': batch_size})
+        try:
+            if partitions:
+                async for partition in result.partitions():
+                    yield partition
+            else:
+                async for row in result:
+                    yield row
+        finally:
+            await result.close()
+
+
+class AsyncSQLQueryNorthwind(AsyncBaseSQLQuery, SQLQueryNorthwind):
+    pass
+
+
+class AsyncSQLQueryChinook(AsyncBaseSQLQuery, SQLQueryChinook):
+    pass
+
+
+async def run_concurrently(
+        query_cls: type[AsyncBaseSQLQuery],
+        base: AutomapBase,
+        session_factory: async_sessionmaker,
+        names: list[str],
+        params: dict[str, dict] | None = None
+) -> dict:
+    """
+    Run reports with asyncio.gather, each on its own session checked out from the shared pool.
+    ``params`` maps report names to their bind parameters.
+    """
+    params = params or {}
+
+    async def run(name: str):
+        async with session_factory() as session:
+            return await getattr(query_cls(base=base, session=session), name)(**params.get(name, {}))
+
+    results = await asyncio.gather(*(run(name) for name in names))
+    return dict(zip(names, results))
@@ -1,12 +1,510 @@
+import re
 from abc import ABC, abstractmethod
+from collections import namedtuple
+from contextlib import nullcontext
+from functools import wraps
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator
+from weakref import WeakKeyDictionary
 
+from sqlalchemy import Executable
+from sqlalchemy.engine.result import IteratorResult, SimpleResultMetaData
 from sqlalchemy.ext.automap import AutomapBase
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import visitors
+
+from src.sql import columnar
+from src.sql import dialect_compat  # noqa: F401 - registers the embedded backends' compilation of Postgres-isms
+from src.sql.instrumentation import Instrumentation, NPlusOneDetector
+from src.sql.loading import LoadingProfile
+from src.sql.pagination import KeysetQuery, Page, decode_cursor, encode_cursor, query_digest
+from src.sql.ranking import Ranking
+from src.sql.report_spec import ReportSpec
+from src.sql.result_cache import ResultCache, returns_entities, statement_tables
+from src.sql.rollups import RollupManager
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+# Statements are built once per automap base, so every query object sharing a base reuses them
+_statements: WeakKeyDictionary = WeakKeyDictionary()
+# Column-only versions of the report statements that select mapped entities
+_flat_statements: WeakKeyDictionary = WeakKeyDictionary()
+_keyset_queries: WeakKeyDictionary = WeakKeyDictionary()
+_bundle_statements: WeakKeyDictionary = WeakKeyDictionary()
+# Ranking statements asked for with other partitions or ties than the ranking report's own
+_ranking_statements: WeakKeyDictionary = WeakKeyDictionary()
+_loading_statements: WeakKeyDictionary = WeakKeyDictionary()
+_result_keys: WeakKeyDictionary = WeakKeyDictionary()
+_record_types: dict[tuple[str, ...], type] = {}
+
+
+def record_type(fields) -> type:
+    """
+    Compact read-only record class for a set of result columns, generated once per distinct column list.
+    """
+    fields = tuple(re.sub(r'\W', '_', field) for field in fields)
+    record = _record_types.get(fields)
+    if record is None:
+        record = _record_types[fields] = namedtuple('Record', fields, rename=True)
+    return record
+
+
+def report(fetch: str = 'all', loading: dict[str, LoadingProfile] | None = None) -> Callable:
+    """
+    Register a statement builder as a report.
+    The builder is called once and the statement reused with bind parameters given as keyword arguments,
+    so repeated calls hit SQLAlchemy's compiled cache instead of rebuilding the query.
+    Reports selecting entities can name ``loading`` profiles for their relationships, used by ``load_report()``.
+    """
+
+    def decorator(builder: Callable[..., Executable]) -> Callable:
+        @wraps(builder)
+        def wrapper(self: 'BaseSQLQuery', **params):
+            return self.run_report(builder.__name__, **params)
+
+        wrapper.report_builder = builder
+        wrapper.report_fetch = fetch
+        wrapper.report_loading = dict(loading or {})
+        return wrapper
+
+    return decorator
+
+
+def bundle(*reports: str) -> Callable:
+    """
+    Register a builder computing several related reports in a single statement, so they cost one round-trip.
+    The builder returns the statement, written with the reports' bind parameters, and a function splitting
+    its rows into the rows of each report, in the order of ``reports``. Only reports selecting columns can be bundled.
+    """
+
+    def decorator(builder: Callable[..., tuple[Executable, Callable]]) -> Callable:
+        @wraps(builder)
+        def wrapper(self: 'BaseSQLQuery', **params):
+            return self.run_bundle(builder.__name__, **params)
+
+        wrapper.bundle_builder = builder
+        wrapper.bundle_reports = reports
+        return wrapper
+
+    return decorator
+
+
+def ranking(score: str, partition_by: tuple[str, ...] = (), n: int = 1, ties: str = 'none',
+            descending: bool = True) -> Callable:
+    """
+    Register a builder of the rows to rank as a report of their top ``n`` by ``score``, per ``partition_by`` group.
+    The builder selects the candidates, typically grouped with the score as an aggregate, and the report wraps them
+    in a single window query, so a top-N per group costs one read of the candidates instead of one query per group.
+    The cut-off is the report's ``n`` parameter; ``top()`` ranks the same candidates with other groups or ties.
+    """
+    spec = Ranking(score=score, partition_by=tuple(partition_by), n=n, ties=ties, descending=descending)
+
+    def decorator(builder: Callable[..., Executable]) -> Callable:
+        @wraps(builder)
+        def wrapper(self: 'BaseSQLQuery', **params):
+            return self.run_report(builder.__name__, **params)
+
+        wrapper.report_builder = lambda sql_obj: spec.statement(builder(sql_obj))
+        wrapper.report_fetch = 'all'
+        wrapper.ranking_builder = builder
+        wrapper.ranking = spec
+        return wrapper
+
+    return decorator
 
 
 class BaseSQLQuery(ABC):
+    stream_batch_size = 1000
+    result_cache: ResultCache | None = None
+    instrumentation: Instrumentation | None = None
+    n_plus_one: NPlusOneDetector | None = None
+    rollups: RollupManager | None = None
+    # Queries reports declared with a ReportSpec can share, each compiled as a CTE of the statements using it
+    shared_queries: dict[str, ReportSpec] = {}
 
     @abstractmethod
     def __init__(self, base: AutomapBase, session: Session) -> None:
         self.base = base
         self.session = session
+
+    @classmethod
+    def reports(cls) -> list[str]:
+        names = []
+        for klass in reversed(cls.__mro__):
+            for name, attribute in vars(klass).items():
+                if hasattr(attribute, 'report_builder') and name not in names:
+                    names.append(name)
+        return names
+
+    @classmethod
+    def bundles(cls) -> dict[str, tuple[str, ...]]:
+        bundles = {}
+        for klass in reversed(cls.__mro__):
+            for name, attribute in vars(klass).items():
+                if hasattr(attribute, 'bundle_builder'):
+                    bundles[name] = attribute.bundle_reports
+        return bundles
+
+    def statement(self, name: str) -> Executable:
+        statements = _statements.setdefault(self.base, {})
+        key = (type(self).__qualname__, name)
+        entry = statements.get(key)
+        if entry is None:
+            statement = getattr(type(self), name).report_builder(self)
+            defaults = {
+                bind.key: bind.value
+                for bind in visitors.iterate(statement)
+                if bind.__visit_name__ == 'bindparam' and not bind.key.startswith('%')
+            }
+            entry = statements[key] = (statement, defaults)
+        return entry[0]
+
+    def report_params(self, name: str) -> dict:
+        """
+        Bind parameters of a report with their default values.
+        """
+        self.statement(name)
+        return dict(_statements[self.base][(type(self).__qualname__, name)][1])
+
+    def bind(self, name: str, params: dict) -> dict:
+        unknown = set(params) - set(self.report_params(name))
+        if unknown:
+            raise TypeError(f'{name}() got unexpected parameters: {", ".join(sorted(unknown))}')
+        return params
+
+    def measure(self, name: str):
+        if self.instrumentation is None:
+            return nullcontext()
+        return self.instrumentation.measure(name)
+
+    def watch(self, name: str):
+        if self.n_plus_one is None:
+            return nullcontext()
+        return self.n_plus_one.watch(name)
+
+    def run_report(self, name: str, **params):
+        params = self.bind(name, params)
+        with self.watch(name), self.measure(name) as metrics:
+            result = self.cached_report(name, params)
+            if metrics is not None:
+                metrics.record(result)
+        if metrics is not None and self.instrumentation.explain:
+            metrics.plan = self.instrumentation.capture_plan(
+                self.session.connection(), self.statement(name), self.report_params(name) | params
+            )
+        return result
+
+    def cached_report(self, name: str, params: dict):
+        statement = self.statement(name)
+        # Mapped objects belong to the session that loaded them, so only plain rows are shared
+        if self.result_cache is None or returns_entities(statement):
+            return self.execute_report(name, params)
+
+        key = self.cache_key(name, params)
+        found, result = self.result_cache.get(key)
+        if not found:
+            result = self.execute_report(name, params)
+            self.result_cache.set(key, result, statement_tables(statement))
+        return result
+
+    def cache_key(self, name: str, params: dict) -> tuple:
+        return (
+            self.session.get_bind().url.render_as_string(hide_password=True),
+            type(self).__qualname__,
+            name,
+            tuple(sorted((self.report_params(name) | params).items())),
+        )
+
+    def resolve(self, name: str, params: dict) -> tuple[Executable, dict]:
+        """
+        Statement and parameters to run a report with: its rollup when one is fresh, otherwise its own statement.
+        """
+        statement = self.rollups.statement(self, name) if self.rollups is not None else None
+        if statement is None:
+            return self.statement(name), params
+        # Rollup statements reuse the report's bind parameters without their defaults
+        return statement, self.report_params(name) | params
+
+    def execute_report(self, name: str, params: dict):
+        result = self.session.execute(*self.resolve(name, params))
+        if getattr(type(self), name).report_fetch == 'one':
+            return result.fetchone()
+        return result.fetchall()
+
+    @classmethod
+    def loading_profiles(cls, name: str) -> dict[str, LoadingProfile]:
+        return dict(getattr(getattr(cls, name), 'report_loading', {}))
+
+    def loading_statement(self, name: str, profile: str) -> tuple[Executable, bool]:
+        profiles = self.loading_profiles(name)
+        if profile not in profiles:
+            raise ValueError(f'{name} has no loading profile {profile!r}')
+        statements = _loading_statements.setdefault(self.base, {})
+        key = (type(self).__qualname__, name, profile)
+        entry = statements.get(key)
+        if entry is None:
+            entry = statements[key] = profiles[profile].apply(self.statement(name))
+        return entry
+
+    def load_report(self, name: str, profile: str, **params):
+        """
+        A report's entities with the relationships of one of its loading profiles loaded along with them,
+        in one statement per level of the profile instead of one lazy load per object and relationship.
+        """
+        params = self.bind(name, params)
+        statement, unique = self.loading_statement(name, profile)
+        with self.watch(name), self.measure(name) as metrics:
+            result = self.session.execute(statement, params)
+            if unique:
+                result = result.unique()
+            if getattr(type(self), name).report_fetch == 'one':
+                result = result.fetchone()
+            else:
+                result = result.fetchall()
+            if metrics is not None:
+                metrics.record(result)
+        return result
+
+    @classmethod
+    def rankings(cls) -> dict[str, Ranking]:
+        return {name: getattr(cls, name).ranking for name in cls.reports() if hasattr(getattr(cls, name), 'ranking')}
+
+    def ranking_statement(self, name: str, ranking: Ranking) -> Executable:
+        if ranking == getattr(type(self), name).ranking:
+            return self.statement(name)
+        statements = _ranking_statements.setdefault(self.base, {})
+        key = (type(self).__qualname__, name, ranking)
+        statement = statements.get(key)
+        if statement is None:
+            statement = statements[key] = ranking.statement(getattr(type(self), name).ranking_builder(self))
+        return statement
+
+    def top_ranking(self, name: str, partition_by: tuple[str, ...] | None = None, ties: str | None = None,
+                    descending: bool | None = None) -> Ranking:
+        """
+        Ranking of a ranking report with its own partitions, ties and direction unless given.
+        """
+        own = getattr(getattr(type(self), name), 'ranking', None)
+        if own is None:
+            raise ValueError(f'{name} is not a ranking report')
+        return Ranking(
+            score=own.score,
+            partition_by=own.partition_by if partition_by is None else tuple(partition_by),
+            n=own.n,
+            ties=own.ties if ties is None else ties,
+            descending=own.descending if descending is None else descending,
+        )
+
+    def top(self, name: str, n: int | None = None, partition_by: tuple[str, ...] | None = None,
+            ties: str | None = None, descending: bool | None = None, **params) -> list:
+        """
+        Top ``n`` rows of a ranking report, with the report's own partitions, ties and direction unless given.
+        Each combination is built once and reused with ``n`` and the report parameters bound.
+        """
+        ranking = self.top_ranking(name, partition_by, ties, descending)
+        if n is not None:
+            if n < 1:
+                raise ValueError('n must be positive')
+            params['n'] = n
+        if ranking == getattr(type(self), name).ranking:
+            return self.run_report(name, **params)
+
+        params = self.bind(name, params)
+        statement = self.ranking_statement(name, ranking)
+        with self.watch(name), self.measure(name) as metrics:
+            result = self.session.execute(statement, params).fetchall()
+            if metrics is not None:
+                metrics.record(result)
+        return result
+
+    def bundle_statement(self, name: str) -> tuple[Executable, Callable]:
+        statements = _bundle_statements.setdefault(self.base, {})
+        key = (type(self).__qualname__, name)
+        entry = statements.get(key)
+        if entry is None:
+            entry = statements[key] = getattr(type(self), name).bundle_builder(self)
+        return entry
+
+    def bundle_params(self, name: str, params: dict) -> dict:
+        """
+        Bind parameters of a bundle: those of its reports with their default values, overridden by ``params``.
+        """
+        defaults = {}
+        for report_name in getattr(type(self), name).bundle_reports:
+            defaults |= self.report_params(report_name)
+        unknown = set(params) - set(defaults)
+        if unknown:
+            raise TypeError(f'{name}() got unexpected parameters: {", ".join(sorted(unknown))}')
+        return defaults | params
+
+    def split_bundle(self, name: str, rows: list) -> dict:
+        """
+        Per-report results from the rows of a bundle's statement, as records like ``fast_report`` gives.
+        """
+        reports = getattr(type(self), name).bundle_reports
+        results = {}
+        for report_name, part in zip(reports, self.bundle_statement(name)[1](rows)):
+            record = record_type(self.flat_statement(report_name).selected_columns.keys())
+            records = [record._make(row) for row in part]
+            if getattr(type(self), report_name).report_fetch == 'one':
+                records = records[0] if records else None
+            results[report_name] = records
+        return results
+
+    def run_bundle(self, name: str, **params) -> dict:
+        """
+        Results of every report of a bundle, keyed by report name, from one execution of the bundle's statement.
+        With a result cache the results are stored under each report, so running one of them afterwards is a hit.
+        """
+        statement, _ = self.bundle_statement(name)
+        with self.measure(name) as metrics:
+            rows = self.session.connection().execute(statement, self.bundle_params(name, params)).fetchall()
+            results = self.split_bundle(name, rows)
+            if metrics is not None:
+                metrics.record(rows)
+        self.cache_bundle(name, params, rows)
+        return results
+
+    def cache_bundle(self, name: str, params: dict, rows: list) -> None:
+        """
+        Store the part of a bundle's rows of each report under the report's cache key, as the same rows
+        ``run_report()`` returns, so a cached report does not change type depending on how it was filled.
+        """
+        if self.result_cache is None:
+            return
+        reports = getattr(type(self), name).bundle_reports
+        for report_name, part in zip(reports, self.bundle_statement(name)[1](rows)):
+            result = IteratorResult(SimpleResultMetaData(self.result_keys(report_name)), iter(part)).fetchall()
+            if getattr(type(self), report_name).report_fetch == 'one':
+                result = result[0] if result else None
+            report_params = {key: value for key, value in params.items() if key in self.report_params(report_name)}
+            self.result_cache.set(
+                self.cache_key(report_name, report_params), result, statement_tables(self.statement(report_name))
+            )
+
+    def result_keys(self, name: str, session: Session | None = None) -> tuple[str, ...]:
+        """
+        Keys of the rows ``run_report()`` returns for a report. Unlabeled columns are only named at execution,
+        ``sum`` or ``count_1`` depending on the expression, so they are read once from an empty result,
+        on ``session`` when given instead of the report's own.
+        """
+        session = session or self.session
+        keys = _result_keys.setdefault(self.base, {})
+        key = (type(self).__qualname__, name, session.get_bind().dialect.name)
+        entry = keys.get(key)
+        if entry is None:
+            result = session.execute(self.statement(name).limit(0))
+            entry = keys[key] = tuple(result.keys())
+            result.close()
+        return entry
+
+    def flat_statement(self, name: str) -> Executable:
+        """
+        The report statement with every selected entity replaced by its columns.
+        """
+        statements = _flat_statements.setdefault(self.base, {})
+        key = (type(self).__qualname__, name)
+        statement = statements.get(key)
+        if statement is None:
+            statement = self.statement(name)
+            if returns_entities(statement):
+                statement = statement.with_only_columns(*statement.selected_columns)
+            statements[key] = statement
+        return statement
+
+    def fast_report(self, name: str, **params):
+        """
+        Read-only variant of a report for large results: entities are selected as plain columns and the rows
+        come back as generated namedtuple records, with no ORM instances or identity map entries.
+        """
+        statement, params = self.resolve(name, self.bind(name, params))
+        if statement is self.statement(name):
+            statement = self.flat_statement(name)
+        with self.measure(name) as metrics:
+            result = self.session.connection().execute(statement, params)
+            record = record_type(result.keys())
+            if getattr(type(self), name).report_fetch == 'one':
+                row = result.fetchone()
+                records = None if row is None else record._make(row)
+            else:
+                records = list(map(record._make, result))
+            if metrics is not None:
+                metrics.record(records)
+        return records
+
+    def keyset_query(self, name: str) -> KeysetQuery:
+        queries = _keyset_queries.setdefault(self.base, {})
+        key = (type(self).__qualname__, name)
+        query = queries.get(key)
+        if query is None:
+            query = queries[key] = KeysetQuery(self.flat_statement(name))
+        return query
+
+    def paginate(self, name: str, page_size: int = 50, cursor: str | None = None, **params) -> Page:
+        """
+        One page of a report with keyset pagination. The returned page carries an opaque cursor for the next one,
+        which is only accepted together with the same report parameters.
+        """
+        if page_size < 1:
+            raise ValueError('page_size must be positive')
+        params = self.bind(name, params)
+        query = self.keyset_query(name)
+        digest = query_digest(name, self.report_params(name) | params)
+        statement, page_params = query.page_statement(
+            decode_cursor(cursor, digest) if cursor else None, page_size
+        )
+        with self.measure(name) as metrics:
+            result = self.session.connection().execute(statement, params | page_params)
+            record = record_type(list(result.keys())[:query.width])
+            rows, after = query.split(result, page_size)
+            rows = [record._make(row) for row in rows]
+            if metrics is not None:
+                metrics.record(rows)
+        return Page(rows=rows, next_cursor=None if after is None else encode_cursor(digest, after))
+
+    def stream(self, name: str, batch_size: int | None = None, partitions: bool = False, **params) -> Iterator:
+        """
+        Streaming variant of a report: rows are fetched from a server-side cursor ``batch_size`` at a time
+        and yielded one by one, or as lists of up to ``batch_size`` rows with ``partitions=True``.
+        """
+        batch_size = batch_size or self.stream_batch_size
+        statement, params = self.resolve(name, self.bind(name, params))
+        result = self.session.execute(statement, params, execution_options={'yield_per': batch_size})
+        try:
+            if partitions:
+                yield from result.partitions()
+            else:
+                yield from result
+        finally:
+            result.close()
+
+    def arrow_batches(self, name: str, batch_size: int | None = None, decimals: str = 'float',
+                      **params) -> Iterator['pa.RecordBatch']:
+        """
+        Columnar variant of a report: Arrow record batches of up to ``batch_size`` rows, built from the
+        cursor's raw rows. Numeric columns become float64, or decimal128 with ``decimals='decimal'``.
+        """
+        statement, params = self.resolve(name, self.bind(name, params))
+        # No stream_results: its buffered fetch strategy pre-reads rows from the cursor this reads directly
+        result = self.session.connection().execute(statement, params)
+        column_types = [column.type for column in statement.selected_columns]
+        yield from columnar.record_batches(result, column_types, batch_size or self.stream_batch_size, decimals)
+
+    def to_arrow(self, name: str, batch_size: int | None = None, decimals: str = 'float', **params) -> 'pa.Table':
+        return columnar.pa.Table.from_batches(list(self.arrow_batches(name, batch_size, decimals, **params)))
+
+    def to_numpy(self, name: str, batch_size: int | None = None, **params) -> dict:
+        """
+        Report columns as NumPy arrays keyed by column name. Columns with nulls come back as object
+        arrays (float columns with NaN instead).
+        """
+        table = self.to_arrow(name, batch_size, **params)
+        return {
+            column_name: column.to_numpy()
+            for column_name, column in zip(table.column_names, table.columns)
+        }
+
+    def to_parquet(self, name: str, path: str | Path, batch_size: int | None = None, decimals: str = 'float',
+                   compression: str = 'zstd', **params) -> int:
+        return columnar.write_parquet(self.arrow_batches(name, batch_size, decimals, **params), path, compression)
@@ -0,0 +1,169 @@
+import argparse
+import hashlib
+import os
+import pickle
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sqlalchemy import Connection, Engine, Integer, MetaData, create_engine as create_engine_, func, select, text
+
+from src.config.db_setup import ROOT, build_session, get_engine
+from src.config.schema_cache import load_base
+from src.sql.base_sql_query import BaseSQLQuery
+from src.sql.datasets import QUERY_CLASSES
+from src.sql.result_cache import returns_entities, statement_tables
+
+SNAPSHOT_DIR = Path(os.environ.get('REPORT_SNAPSHOT_DIR', ROOT / '.report_snapshots'))
+
+_PG_TABLE_STATS = text("""
+    SELECT relname, n_tup_ins, n_tup_upd, n_tup_del, n_live_tup
+    FROM pg_stat_user_tables
+    WHERE schemaname = current_schema()
+""")
+
+
+def table_watermarks(connection: Connection, metadata: MetaData, tables) -> dict[str, tuple]:
+    """
+    A cheap value per table that moves whenever the table is written to.
+    On Postgres it is the insert/update/delete counters of ``pg_stat_user_tables``, all tables in one query.
+    Elsewhere it is the row count and the highest integer primary key, which catches inserts and deletes
+    but not in-place updates.
+    """
+    if connection.dialect.name == 'postgresql':
+        stats = {row.relname: tuple(row[1:]) for row in connection.execute(_PG_TABLE_STATS)}
+        return {table: stats.get(table) for table in tables}
+
+    watermarks = {}
+    for name in tables:
+        table = metadata.tables[name]
+        keys = [column for column in table.primary_key.columns if isinstance(column.type, Integer)]
+        columns = [func.count()] + ([func.max(keys[0])] if len(keys) == 1 else [])
+        watermarks[name] = tuple(connection.execute(select(*columns).select_from(table)).one())
+    return watermarks
+
+
+@dataclass
+class Snapshot:
+    watermarks: dict[str, tuple]
+    result: object
+    stored_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class RefreshRun:
+    report: str
+    rerun: bool
+    latency_ms: float
+    changed_tables: list[str] = field(default_factory=list)
+
+
+class ChangeTracker:
+    """
+    Re-runs a report only when a table it reads has changed since its stored result.
+    Results are kept per database in a pickle file next to the schema snapshots, together with the watermarks
+    of the report's tables at the time it ran. Reports returning mapped objects are always re-run,
+    as their objects belong to the session that loaded them.
+    """
+
+    def __init__(self, engine: Engine, path: str | Path | None = None, max_age: float | None = None) -> None:
+        self.engine = engine
+        url = engine.url.render_as_string(hide_password=True)
+        self.path = Path(path) if path else SNAPSHOT_DIR / f'{hashlib.sha256(url.encode()).hexdigest()[:32]}.pickle'
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._snapshots: dict[tuple, Snapshot] = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with self.path.open('rb') as file:
+                return pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return {}
+
+    def save(self) -> None:
+        with self._lock:
+            snapshots = dict(self._snapshots)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        with tmp_path.open('wb') as file:
+            pickle.dump(snapshots, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshots.clear()
+        self.path.unlink(missing_ok=True)
+
+    def _key(self, sql_obj: BaseSQLQuery, name: str, params: dict) -> tuple:
+        return type(sql_obj).__qualname__, name, tuple(sorted((sql_obj.report_params(name) | params).items()))
+
+    def run_report(self, sql_obj: BaseSQLQuery, name: str, watermarks: dict[str, tuple] | None = None,
+                   **params) -> tuple[object, RefreshRun]:
+        """
+        Result of a report, from its snapshot when none of its tables moved. ``watermarks`` can carry
+        the values already read for a batch of reports, otherwise those of the report's tables are read here.
+        """
+        start = time.perf_counter()
+        statement = sql_obj.statement(name)
+        tables = sorted(statement_tables(statement))
+        if watermarks is None:
+            watermarks = table_watermarks(sql_obj.session.connection(), sql_obj.base.metadata, tables)
+        current = {table: watermarks[table] for table in tables}
+
+        key = self._key(sql_obj, name, sql_obj.bind(name, params))
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+        fresh_enough = snapshot is not None and (self.max_age is None or time.time() - snapshot.stored_at < self.max_age)
+        if fresh_enough and snapshot.watermarks == current and not returns_entities(statement):
+            return snapshot.result, RefreshRun(report=name, rerun=False, latency_ms=(time.perf_counter() - start) * 1000)
+
+        changed = tables if snapshot is None else [
+            table for table in tables if snapshot.watermarks.get(table) != current[table]
+        ]
+        result = sql_obj.run_report(name, **params)
+        if not returns_entities(statement):
+            with self._lock:
+                self._snapshots[key] = Snapshot(watermarks=current, result=result)
+        return result, RefreshRun(
+            report=name, rerun=True, latency_ms=(time.perf_counter() - start) * 1000, changed_tables=changed
+        )
+
+    def refresh(self, sql_obj: BaseSQLQuery, names: list[str] | None = None) -> dict[str, RefreshRun]:
+        """
+        Bring every report up to date, reading the watermarks of all the tables involved once, and save the snapshots.
+        """
+        names = names or sql_obj.reports()
+        tables = set().union(*(statement_tables(sql_obj.statement(name)) for name in names))
+        watermarks = table_watermarks(sql_obj.session.connection(), sql_obj.base.metadata, sorted(tables))
+        runs = {name: self.run_report(sql_obj, name, watermarks=watermarks)[1] for name in names}
+        self.save()
+        return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh the reports whose tables changed since the last run.')
+    parser.add_argument('dataset', choices=QUERY_CLASSES)
+    parser.add_argument('--url', help='database URL, defaults to the dataset\'s configured database')
+    parser.add_argument('--snapshots', help='snapshot file, defaults to one per database under .report_snapshots/')
+    parser.add_argument('--max-age', type=float, help='re-run reports whose snapshot is older than this many seconds')
+    parser.add_argument('reports', nargs='*', help='reports to refresh, defaults to all of them')
+    args = parser.parse_args()
+
+    engine = create_engine_(args.url) if args.url else get_engine(args.dataset)
+    tracker = ChangeTracker(engine, path=args.snapshots, max_age=args.max_age)
+    with build_session(engine=engine) as session:
+        sql_obj = QUERY_CLASSES[args.dataset](base=load_base(engine), session=session)
+        start = time.perf_counter()
+        runs = tracker.refresh(sql_obj, args.reports or None)
+    total = (time.perf_counter() - start) * 1000
+
+    for run in runs.values():
+        status = f'rerun ({", ".join(run.changed_tables)})' if run.rerun else 'unchanged'
+        print(f'{run.report:<32} {run.latency_ms:>10.2f} ms  {status}')
+    print(f'{sum(run.rerun for run in runs.values())} of {len(runs)} reports re-run in {total:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+from decimal import Decimal
+from pathlib import Path
+from typing import Iterator
+
+from sqlalchemy import CursorResult, types
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pq = None
+
+
+def require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError('columnar export needs pyarrow: pip install pyarrow')
+
+
+def unique_names(names: list[str]) -> list[str]:
+    seen: dict[str, int] = {}
+    unique = []
+    for name in names:
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        unique.append(name if count == 0 else f'{name}_{count}')
+    return unique
+
+
+def arrow_type(type_: types.TypeEngine, decimals: str):
+    """
+    Arrow type of a column from its SQLAlchemy type, None to let Arrow infer it from the values.
+    """
+    if isinstance(type_, types.Boolean):
+        return pa.bool_()
+    if isinstance(type_, types.Integer):
+        return pa.int64()
+    if isinstance(type_, types.Numeric):
+        scale = getattr(type_, 'scale', None)
+        if decimals == 'decimal' and not isinstance(type_, types.Float):
+            return pa.decimal128(38, scale if scale is not None else 10)
+        return pa.float64()
+    if isinstance(type_, types.DateTime):
+        return pa.timestamp('us')
+    if isinstance(type_, types.Date):
+        return pa.date32()
+    if isinstance(type_, types.LargeBinary):
+        return pa.binary()
+    if isinstance(type_, (types.String, types.Enum)):
+        return pa.string()
+    return None
+
+
+def column_array(values: tuple, type_: types.TypeEngine, target):
+    """
+    Arrow array straight from the driver's values of one column.
+    SQLite hands dates over as ISO strings and booleans as integers, Postgres numerics as Decimal,
+    so the values go into the closest array type first and are cast from there.
+    """
+    if target is None:
+        return pa.array(values)
+    sample = next((value for value in values if value is not None), None)
+    if isinstance(sample, str) and not pa.types.is_string(target):
+        array = pa.array(values, pa.string())
+        if pa.types.is_timestamp(target):
+            array = pc.replace_substring(array, ' ', 'T')
+        return array.cast(target)
+    if isinstance(sample, Decimal):
+        array = pa.array(values).cast(target)
+    elif pa.types.is_boolean(target) and isinstance(sample, int):
+        array = pa.array(values, pa.int64()).cast(target)
+    elif pa.types.is_decimal(target):
+        array = pa.array(values, pa.float64()).cast(target)
+    else:
+        array = pa.array(values, target)
+    scale = getattr(type_, 'scale', None)
+    if pa.types.is_floating(target) and scale is not None and not isinstance(type_, types.Float):
+        # Same rounding the Numeric result processor applies to Row values
+        array = pc.round(array, scale)
+    return array
+
+
+def record_batches(result: CursorResult, column_types: list[types.TypeEngine], batch_size: int,
+                   decimals: str = 'float') -> Iterator['pa.RecordBatch']:
+    """
+    Record batches built from ``fetchmany()`` on the DBAPI cursor, bypassing Row construction
+    and SQLAlchemy's per-value result processing.
+    """
+    require_pyarrow()
+    names = unique_names(list(result.keys()))
+    targets = [arrow_type(type_, decimals) for type_ in column_types]
+    schema = None
+    cursor = result.cursor
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            arrays = [
+                column_array(values, type_, target) for values, type_, target in zip(columns, column_types, targets)
+            ]
+            batch = pa.RecordBatch.from_arrays(arrays, names=names)
+            if schema is None:
+                schema = batch.schema
+            elif batch.schema != schema:
+                batch = batch.cast(schema)
+            yield batch
+        if schema is None:
+            yield pa.RecordBatch.from_arrays(
+                [pa.array([], target or pa.null()) for target in targets], names=names
+            )
+    finally:
+        result.close()
+
+
+def write_parquet(batches: Iterator['pa.RecordBatch'], path: str | Path, compression: str = 'zstd') -> int:
+    """
+    Write record batches to a Parquet file as they arrive. Returns the number of rows written.
+    """
+    require_pyarrow()
+    rows = 0
+    writer = None
+    try:
+        for batch in batches:
+            if writer is None:
+                writer = pq.ParquetWriter(str(path), batch.schema, compression=compression)
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
@@ -0,0 +1,13 @@
+from src.sql.async_sql_query import AsyncSQLQueryChinook, AsyncSQLQueryNorthwind
+from src.sql.sql_query_chinook import SQLQueryChinook
+from src.sql.sql_query_northwind import SQLQueryNorthwind
+
+QUERY_CLASSES = {
+    'northwind': SQLQueryNorthwind,
+    'chinook': SQLQueryChinook,
+}
+
+ASYNC_QUERY_CLASSES = {
+    'northwind': AsyncSQLQueryNorthwind,
+    'chinook': AsyncSQLQueryChinook,
+}
@@ -0,0 +1,62 @@
+"""
+Compilation of the Postgres-specific SQL the reports rely on for the embedded backends (SQLite and DuckDB),
+so a local copy gives the same results as the Postgres database. Registered on import; base_sql_query imports it.
+"""
+
+from sqlalchemy import Column, types
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.elements import Cast, Extract
+from sqlalchemy.sql.selectable import Select
+
+
+@compiles(Extract, 'sqlite')
+def _sqlite_extract(element: Extract, compiler, **kw) -> str:
+    # SQLite's strftime() has no quarter, the default compilation reads it as 0
+    if element.field == 'quarter':
+        return f"((CAST(STRFTIME('%m', {compiler.process(element.expr, **kw)}) AS INTEGER) + 2) / 3)"
+    return compiler.visit_extract(element, **kw)
+
+
+@compiles(Cast, 'sqlite')
+def _sqlite_cast(element: Cast, compiler, **kw) -> str:
+    # CAST(x AS NUMERIC(10, 2)) keeps every digit on SQLite; Postgres rounds to the scale,
+    # which shows once the value is summed, compared or made DISTINCT in SQL
+    type_ = element.type
+    scale = getattr(type_, 'scale', None)
+    if isinstance(type_, types.Numeric) and not isinstance(type_, types.Float) and scale is not None:
+        return (
+            f'CAST(ROUND({compiler.process(element.clause, **kw)}, {int(scale)}) '
+            f'AS {compiler.process(element.typeclause, **kw)})'
+        )
+    return compiler.visit_cast(element, **kw)
+
+
+def _contains(columns: list, column) -> bool:
+    return any(column.compare(other) for other in columns)
+
+
+def functionally_dependent_columns(statement: Select) -> list:
+    """
+    Selected table columns missing from the GROUP BY of a statement that groups by their table's primary key.
+    Postgres accepts them as functionally dependent on the key, other databases want them grouped.
+    """
+    grouped = [clause for clause in statement._group_by_clauses if isinstance(clause, Column)]
+    if not grouped:
+        return []
+    missing = []
+    for column in statement.selected_columns:
+        table = getattr(column, 'table', None)
+        if not isinstance(column, Column) or table is None or _contains(grouped, column) or _contains(missing, column):
+            continue
+        keys = list(getattr(table, 'primary_key', ()))
+        if keys and all(_contains(grouped, key) for key in keys):
+            missing.append(column)
+    return missing
+
+
+@compiles(Select, 'duckdb')
+def _duckdb_select(element: Select, compiler, **kw) -> str:
+    missing = functionally_dependent_columns(element)
+    if missing:
+        element = element.group_by(*missing)
+    return compiler.visit_select(element, **kw)
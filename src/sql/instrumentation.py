@@ -0,0 +1,241 @@
+import json
+import statistics
+import threading
+import time
+import warnings
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Iterator
+
+from sqlalchemy import Connection, Engine, Executable, event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.sql.result_cache import result_size
+
+
+EXPLAIN_PREFIXES = {
+    'postgresql': ('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ', 'EXPLAIN (FORMAT JSON) '),
+    'sqlite': ('EXPLAIN QUERY PLAN ', 'EXPLAIN QUERY PLAN '),
+}
+
+
+def explain_sql(connection: Connection, statement: Executable, params: dict, analyze: bool = False) -> str:
+    prefixes = EXPLAIN_PREFIXES.get(connection.dialect.name, ('EXPLAIN ', 'EXPLAIN '))
+    prefix = prefixes[0] if analyze else prefixes[1]
+    compiled = statement.params(**params).compile(
+        dialect=connection.dialect, compile_kwargs={'literal_binds': True}
+    )
+    return prefix + str(compiled)
+
+
+def capture_plan(connection: Connection, statement: Executable, params: dict, analyze: bool = False):
+    """
+    Plan of a statement: the JSON plan on Postgres, the rows of EXPLAIN QUERY PLAN on SQLite.
+    """
+    rows = connection.exec_driver_sql(explain_sql(connection, statement, params, analyze)).fetchall()
+    if connection.dialect.name == 'postgresql':
+        return rows[0][0]
+    return [list(row) for row in rows]
+
+
+@dataclass
+class ReportMetrics:
+    report: str
+    started_at: float = field(default_factory=time.time)
+    wall_ms: float = 0.0
+    db_ms: float = 0.0
+    statements: int = 0
+    rows: int = 0
+    bytes: int = 0
+    error: str | None = None
+    plan: object = None
+
+    def record(self, result) -> None:
+        if isinstance(result, list):
+            self.rows = len(result)
+        elif isinstance(result, tuple):
+            self.rows = 1
+        else:
+            self.rows = int(result is not None)
+        self.bytes = result_size(result)
+
+
+class Instrumentation:
+    """
+    Per-report metrics collected from the engine's cursor events: wall time of the report call,
+    time spent in the database, statements issued, rows and approximate bytes returned.
+    With ``explain`` the plan of every report statement is captured as well,
+    ``EXPLAIN (ANALYZE, BUFFERS)`` on Postgres and ``EXPLAIN QUERY PLAN`` on SQLite.
+    """
+
+    def __init__(self, engine: Engine | AsyncEngine, explain: bool = False, analyze: bool = True) -> None:
+        self.engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+        self.explain = explain
+        self.analyze = analyze
+        self.metrics: list[ReportMetrics] = []
+        self._lock = threading.Lock()
+        # Report measured by this instance in the current thread or task
+        self._current: ContextVar[ReportMetrics | None] = ContextVar(f'report_metrics_{id(self)}', default=None)
+        # Key of the (execution context, start time) stack of this instance in connection.info
+        self.started_key = f'instrumentation_started_{id(self)}'
+
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(self.engine, 'handle_error', self._handle_error)
+
+    def remove(self) -> None:
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.remove(self.engine, 'handle_error', self._handle_error)
+
+    def _before_cursor_execute(self, connection, cursor, statement, parameters, context, executemany) -> None:
+        connection.info.setdefault(self.started_key, []).append((context, time.perf_counter()))
+
+    def _after_cursor_execute(self, connection, cursor, statement, parameters, context, executemany) -> None:
+        _, started = connection.info[self.started_key].pop()
+        metrics = self._current.get()
+        if metrics is not None:
+            metrics.db_ms += (time.perf_counter() - started) * 1000
+            metrics.statements += 1
+
+    def _handle_error(self, exception_context) -> None:
+        # A failed execute has no after_cursor_execute: drop its start so later statements pair with their own
+        connection = exception_context.connection
+        started = connection.info.get(self.started_key) if connection is not None else None
+        if started and started[-1][0] is exception_context.execution_context:
+            started.pop()
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[ReportMetrics]:
+        metrics = ReportMetrics(report=name)
+        token = self._current.set(metrics)
+        started = time.perf_counter()
+        try:
+            yield metrics
+        except Exception as error:
+            metrics.error = f'{type(error).__name__}: {error}'
+            raise
+        finally:
+            metrics.wall_ms = (time.perf_counter() - started) * 1000
+            self._current.reset(token)
+            with self._lock:
+                self.metrics.append(metrics)
+
+    def explain_sql(self, connection: Connection, statement: Executable, params: dict) -> str:
+        return explain_sql(connection, statement, params, self.analyze)
+
+    def capture_plan(self, connection: Connection, statement: Executable, params: dict):
+        return capture_plan(connection, statement, params, self.analyze)
+
+    def summary(self) -> dict:
+        with self._lock:
+            metrics = list(self.metrics)
+        reports: dict[str, list[ReportMetrics]] = {}
+        for item in metrics:
+            reports.setdefault(item.report, []).append(item)
+        return {
+            name: {
+                'calls': len(items),
+                'errors': sum(item.error is not None for item in items),
+                'wall_ms_total': round(sum(item.wall_ms for item in items), 3),
+                'wall_ms_median': round(statistics.median(item.wall_ms for item in items), 3),
+                'wall_ms_max': round(max(item.wall_ms for item in items), 3),
+                'db_ms_total': round(sum(item.db_ms for item in items), 3),
+                'statements': sum(item.statements for item in items),
+                'rows': sum(item.rows for item in items),
+                'bytes': sum(item.bytes for item in items),
+            }
+            for name, items in reports.items()
+        }
+
+    def to_json(self) -> dict:
+        with self._lock:
+            metrics = [asdict(item) for item in self.metrics]
+        return {'summary': self.summary(), 'calls': metrics}
+
+    def export(self, path: str | Path) -> None:
+        with open(path, 'w') as file:
+            json.dump(self.to_json(), file, indent=2, default=str)
+
+
+class NPlusOneWarning(UserWarning):
+    pass
+
+
+@dataclass
+class StatementLog:
+    name: str
+    statements: Counter = field(default_factory=Counter)
+
+    @property
+    def total(self) -> int:
+        return sum(self.statements.values())
+
+    def most_repeated(self) -> tuple[str, int] | None:
+        return self.statements.most_common(1)[0] if self.statements else None
+
+
+class NPlusOneDetector:
+    """
+    Counts the statements issued while a watch is open, such as a report call or a page render walking
+    the entities it returned, and warns with NPlusOneWarning when a watch issued more than ``threshold``.
+    The warning names the statement repeated most, typically the lazy load of a relationship run once per row.
+    Watches nest: a statement on the detector's engine counts for every watch of this detector
+    open in the current thread or task.
+    """
+
+    def __init__(self, engine: Engine | AsyncEngine, threshold: int = 10) -> None:
+        self.engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+        self.threshold = threshold
+        self.logs: list[StatementLog] = []
+        self._lock = threading.Lock()
+        # Open watches of this detector, innermost last: a statement counts for each of them
+        self._watches: ContextVar[tuple[StatementLog, ...]] = ContextVar(
+            f'statement_watches_{id(self)}', default=()
+        )
+
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+    def remove(self) -> None:
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+    def _before_cursor_execute(self, connection, cursor, statement, parameters, context, executemany) -> None:
+        for log in self._watches.get():
+            log.statements[statement] += 1
+
+    @contextmanager
+    def watch(self, name: str) -> Iterator[StatementLog]:
+        log = StatementLog(name=name)
+        token = self._watches.set((*self._watches.get(), log))
+        try:
+            yield log
+        finally:
+            self._watches.reset(token)
+            with self._lock:
+                self.logs.append(log)
+            if log.total > self.threshold:
+                statement, count = log.most_repeated()
+                warnings.warn(
+                    f'{name} issued {log.total} statements, more than {self.threshold}; '
+                    f'{count} of them: {" ".join(statement.split())[:300]}',
+                    NPlusOneWarning,
+                    stacklevel=3,
+                )
+
+    def summary(self) -> dict:
+        with self._lock:
+            logs = list(self.logs)
+        watches: dict[str, list[StatementLog]] = {}
+        for log in logs:
+            watches.setdefault(log.name, []).append(log)
+        return {
+            name: {
+                'calls': len(items),
+                'statements_max': max(item.total for item in items),
+                'over_threshold': sum(item.total > self.threshold for item in items),
+            }
+            for name, items in watches.items()
+        }
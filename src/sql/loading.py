@@ -0,0 +1,82 @@
+from dataclasses import dataclass
+
+from sqlalchemy import Select, inspect
+from sqlalchemy.orm import Load
+
+# Loader of the relationships on a path: 'selectin' issues one IN query per level, fit for collections,
+# 'joined' adds a LEFT OUTER JOIN to the report statement, fit for many-to-one, 'raise' refuses to load
+STRATEGIES = {
+    'selectin': 'selectinload',
+    'joined': 'joinedload',
+    'raise': 'raiseload',
+}
+
+
+@dataclass(frozen=True)
+class LoadPath:
+    """
+    Relationships followed from the loaded entity, as dotted automap relationship names like
+    ``'invoice_collection.invoiceline_collection'``, each loaded with ``strategy``.
+    """
+    path: str
+    strategy: str = 'selectin'
+
+    def __post_init__(self) -> None:
+        if self.strategy not in STRATEGIES:
+            raise ValueError(f'unknown strategy {self.strategy!r}, expected one of {", ".join(STRATEGIES)}')
+
+
+@dataclass(frozen=True)
+class LoadingProfile:
+    """
+    How the entities of a report load their relationships: the ``loads`` paths eagerly, in a fixed number
+    of statements whatever the number of rows, and with ``raise_others`` every other relationship of the
+    entities on the way raises instead of lazy loading, so a template walking past the profile fails
+    at once instead of issuing a query per object.
+    ``entity`` names the mapped class the paths start from when the report selects several.
+    """
+    loads: tuple[LoadPath, ...] = ()
+    raise_others: bool = True
+    entity: str | None = None
+    description: str | None = None
+
+    def root(self, statement: Select):
+        entities = [
+            description['entity'] for description in statement.column_descriptions
+            if description['entity'] is not None and description['expr'] is description['entity']
+        ]
+        if self.entity is not None:
+            entities = [entity for entity in entities if entity.__name__ == self.entity]
+        if len(entities) != 1:
+            raise ValueError(
+                f'a loading profile needs one selected entity to start from, found {len(entities)}'
+                + ('' if self.entity is None else f' named {self.entity}')
+            )
+        return entities[0]
+
+    def apply(self, statement: Select) -> tuple[Select, bool]:
+        """
+        The statement with the profile's loader options, and whether its rows must be made unique:
+        a joined collection repeats the parent row once per child.
+        """
+        root = self.root(statement)
+        options, unique = [], False
+        # Wildcards set the loader of every relationship not named by another option, one per class on a path
+        raised = {(): Load(root)} if self.raise_others else {}
+        for load in self.loads:
+            option, entity, walked = Load(root), root, ()
+            for key in load.path.split('.'):
+                relationship = inspect(entity).relationships.get(key)
+                if relationship is None:
+                    raise KeyError(f'{entity.__name__} has no relationship {key}')
+                option = getattr(option, STRATEGIES[load.strategy])(getattr(entity, key))
+                unique = unique or (load.strategy == 'joined' and relationship.uselist)
+                entity, walked = relationship.mapper.class_, (*walked, key)
+                if self.raise_others and load.strategy != 'raise':
+                    raised.setdefault(walked, option)
+            options.append(option)
+        options.extend(option.raiseload('*', sql_only=True) for option in raised.values())
+        return statement.options(*options), unique
+
+
+STRICT = LoadingProfile(description='The selected entities alone, every relationship raises when touched.')
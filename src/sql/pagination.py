@@ -0,0 +1,185 @@
+import base64
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from sqlalchemy import Executable, Select, Table, and_, bindparam, or_, tuple_
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import Label, UnaryExpression
+
+
+@dataclass
+class Page:
+    rows: list
+    next_cursor: str | None
+
+    @property
+    def has_more(self) -> bool:
+        return self.next_cursor is not None
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    if isinstance(value, time):
+        return {'t': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'n': str(value)}
+    if isinstance(value, bytes):
+        return {'b': base64.b64encode(value).decode()}
+    return value
+
+
+def _decode_value(value):
+    if not isinstance(value, dict):
+        return value
+    (tag, text), = value.items()
+    return {
+        'dt': datetime.fromisoformat,
+        'd': date.fromisoformat,
+        't': time.fromisoformat,
+        'n': Decimal,
+        'b': base64.b64decode,
+    }[tag](text)
+
+
+def query_digest(name: str, params: dict) -> str:
+    """
+    Short digest of a report and its parameters, so a cursor is only accepted by the query that issued it.
+    """
+    payload = json.dumps([name, sorted((key, _encode_value(value)) for key, value in params.items())], default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:12]
+
+
+def encode_cursor(digest: str, values: tuple) -> str:
+    payload = json.dumps({'q': digest, 'k': [_encode_value(value) for value in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, digest: str) -> tuple:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        values = tuple(_decode_value(value) for value in payload['k'])
+    except (ValueError, KeyError, TypeError) as error:
+        raise ValueError('malformed page cursor') from error
+    if payload.get('q') != digest:
+        raise ValueError('page cursor belongs to a different report or different parameters')
+    return values
+
+
+def _unwrap(clause) -> tuple[object, bool]:
+    """
+    Expression and direction (True for descending) of an ORDER BY clause.
+    """
+    descending = False
+    if isinstance(clause, UnaryExpression) and clause.modifier in (operators.desc_op, operators.asc_op):
+        descending = clause.modifier is operators.desc_op
+        clause = clause.element
+    return clause, descending
+
+
+def _primary_keys(from_clause) -> list:
+    if isinstance(from_clause, Table):
+        return list(from_clause.primary_key.columns)
+    keys = []
+    for side in ('left', 'right'):
+        if hasattr(from_clause, side):
+            keys.extend(_primary_keys(getattr(from_clause, side)))
+    return keys
+
+
+class KeysetQuery:
+    """
+    Keyset (seek) pagination over an ordered report statement.
+    The sort key is the statement's ORDER BY followed by a tie-breaker that makes it unique: the GROUP BY columns
+    of a grouped statement, the selected columns of a DISTINCT one, otherwise the primary keys of the joined tables,
+    or the selected columns when it reads from subqueries, which have none.
+    Pages after the first continue with ``WHERE key > last key`` (HAVING for grouped statements) instead of OFFSET,
+    so with an index on the sort key every page costs the same however deep it is.
+    Sort keys holding NULLs cannot be sought past.
+    """
+
+    def __init__(self, statement: Executable) -> None:
+        if not isinstance(statement, Select):
+            raise ValueError('only SELECT statements can be paged')
+        self.statement = statement
+        self.grouped = bool(statement._group_by_clauses)
+
+        if statement._limit_clause is not None or statement._offset_clause is not None:
+            raise ValueError('statement has its own LIMIT/OFFSET')
+
+        keys: list[tuple[object, bool]] = []
+        for clause in statement._order_by_clauses:
+            expression, descending = _unwrap(clause)
+            keys.append((self._resolve(expression), descending))
+
+        if self.grouped:
+            tie_breakers = list(statement._group_by_clauses)
+        elif statement._distinct:
+            tie_breakers = list(statement.selected_columns)
+        else:
+            tie_breakers = [key for from_clause in statement.get_final_froms() for key in _primary_keys(from_clause)]
+            tie_breakers = tie_breakers or list(statement.selected_columns)
+        if not tie_breakers:
+            raise ValueError('statement has no columns to break ties in its order')
+        for column in map(self._resolve, tie_breakers):
+            if not any(column.compare(expression) for expression, _ in keys):
+                keys.append((column, False))
+        self.keys = keys
+        self.width = len(statement.selected_columns)
+
+        ordered = statement.order_by(None).order_by(
+            *(expression.desc() if descending else expression.asc() for expression, descending in keys)
+        ).add_columns(*(expression.label(f'_page_key_{index}') for index, (expression, _) in enumerate(keys)))
+        self.first = ordered
+        self.following = (ordered.having if self.grouped else ordered.where)(self._seek())
+
+    def _resolve(self, expression):
+        """
+        The expression behind a label, or behind a label name as in order_by('name') and desc('name').
+        """
+        if isinstance(getattr(expression, 'element', None), str):
+            expression = self.statement.selected_columns[expression.element]
+        if isinstance(expression, Label):
+            expression = expression.element
+        return expression
+
+    def _seek(self):
+        # Typed like their key, so values such as Decimal totals are bound the way the database expects
+        bound = [bindparam(f'_page_after_{index}', type_=expression.type) for index, (expression, _) in enumerate(self.keys)]
+        directions = {descending for _, descending in self.keys}
+        if len(directions) == 1:
+            left = tuple_(*(expression for expression, _ in self.keys))
+            right = tuple_(*bound)
+            return left < right if directions.pop() else left > right
+        # Mixed directions: (a > x) OR (a = x AND b < y) OR ...
+        alternatives = []
+        for index, (expression, descending) in enumerate(self.keys):
+            equal = [self.keys[position][0] == bound[position] for position in range(index)]
+            step = expression < bound[index] if descending else expression > bound[index]
+            alternatives.append(and_(*equal, step))
+        return or_(*alternatives)
+
+    def page_statement(self, after: tuple | None, page_size: int) -> tuple[Executable, dict]:
+        if after is None:
+            return self.first.limit(page_size + 1), {}
+        if len(after) != len(self.keys):
+            raise ValueError('page cursor does not match the report\'s sort key')
+        if any(value is None for value in after):
+            raise ValueError('cannot page past a NULL sort key')
+        return (
+            self.following.limit(page_size + 1),
+            {f'_page_after_{index}': value for index, value in enumerate(after)},
+        )
+
+    def split(self, rows, page_size: int) -> tuple[list[tuple], tuple | None]:
+        """
+        Visible columns of a fetched page, and the sort key of its last row when another page follows.
+        """
+        rows = list(rows)
+        after = tuple(rows[page_size - 1][self.width:]) if len(rows) > page_size else None
+        return [tuple(row[:self.width]) for row in rows[:page_size]], after
@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+
+from sqlalchemy import Select, bindparam, func, select
+
+# How rows with equal scores are ranked: 'none' keeps exactly n rows per group in a stable order,
+# 'include' keeps every row tied with the n-th, 'dense' keeps the rows of the n best distinct scores
+TIES = {
+    'none': func.row_number,
+    'include': func.rank,
+    'dense': func.dense_rank,
+}
+
+
+@dataclass(frozen=True)
+class Ranking:
+    """
+    Top-N over the rows of a statement: the ``n`` best rows by the ``score`` column, within each distinct
+    value of the ``partition_by`` columns or over all rows without them.
+    """
+    score: str
+    partition_by: tuple[str, ...] = ()
+    n: int = 1
+    ties: str = 'none'
+    descending: bool = True
+
+    def __post_init__(self) -> None:
+        if self.ties not in TIES:
+            raise ValueError(f'unknown ties {self.ties!r}, expected one of {", ".join(TIES)}')
+        if self.n < 1:
+            raise ValueError('n must be positive')
+
+    def statement(self, source: Select) -> Select:
+        """
+        One window query over ``source``: its rows numbered by score within their group and filtered on that number,
+        with the cut-off as the ``n`` bind parameter. The source is read once whatever the number of groups.
+        """
+        source = source.order_by(None).limit(None).offset(None)
+        columns = source.selected_columns
+        unknown = {self.score, *self.partition_by} - set(columns.keys())
+        if unknown:
+            raise ValueError(f'ranking columns not selected by the statement: {", ".join(sorted(unknown))}')
+
+        score = columns[self.score]
+        order_by = [score.desc().nulls_last() if self.descending else score.asc().nulls_last()]
+        # Only row numbers need a tie-breaker; for RANK() and DENSE_RANK() it would split the ties
+        others = [key for key in columns.keys() if key != self.score and key not in self.partition_by]
+        if self.ties == 'none':
+            order_by.extend(columns[key] for key in others)
+        position = TIES[self.ties]().over(
+            partition_by=[columns[key] for key in self.partition_by] or None, order_by=order_by
+        ).label('position')
+
+        ranked = source.add_columns(position).subquery('ranked')
+        return select(*ranked.c). \
+            where(ranked.c.position <= bindparam('n', self.n)). \
+            order_by(
+            *(ranked.c[key] for key in self.partition_by),
+            ranked.c.position,
+            *(ranked.c[key] for key in others)
+        )
+
+    def rank_rows(self, keys: list[str], rows: list[tuple], n: int) -> list[tuple]:
+        """
+        The same top-N over rows already fetched, such as candidates merged from several databases,
+        each kept row followed by its position like the statement's rows.
+        """
+        score = keys.index(self.score)
+        partition = [keys.index(key) for key in self.partition_by]
+        others = [index for index, key in enumerate(keys) if index != score and index not in partition]
+
+        groups: dict[tuple, list[tuple]] = {}
+        for row in rows:
+            groups.setdefault(tuple(row[index] for index in partition), []).append(row)
+
+        ranked = []
+        for group in groups.values():
+            group.sort(key=lambda row: tuple(_sort_key(row[index]) for index in others))
+            scored = [row for row in group if row[score] is not None]
+            scored.sort(key=lambda row: row[score], reverse=self.descending)
+            group = scored + [row for row in group if row[score] is None]
+            position, previous = 0, object()
+            for number, row in enumerate(group, start=1):
+                if self.ties == 'none':
+                    position = number
+                elif row[score] != previous:
+                    position = number if self.ties == 'include' else position + 1
+                previous = row[score]
+                if position > n:
+                    break
+                ranked.append((*row, position))
+
+        ranked.sort(key=lambda row: tuple(
+            [_sort_key(row[index]) for index in partition] + [row[-1]] + [_sort_key(row[index]) for index in others]
+        ))
+        return ranked
+
+
+def _sort_key(value):
+    return value is None, value
@@ -0,0 +1,182 @@
+from dataclasses import dataclass, replace
+from datetime import date
+from functools import partial
+from typing import TYPE_CHECKING, Callable
+
+from sqlalchemy import Select, and_, bindparam, select
+from sqlalchemy.sql.elements import ColumnElement, Label
+
+if TYPE_CHECKING:
+    from src.sql.base_sql_query import BaseSQLQuery
+
+# A dotted attribute path on the query object, like 'orders.order_date', or a function of the context
+Expression = str | Callable[['SpecContext'], ColumnElement]
+
+
+def resolve(expression: Expression, context: 'SpecContext'):
+    if isinstance(expression, str):
+        value = context
+        for attribute in expression.split('.'):
+            value = getattr(value, attribute)
+        return value
+    return expression(context)
+
+
+@dataclass(frozen=True)
+class Field:
+    """
+    A selected dimension or measure: an expression built from the query object, labeled with ``name`` if given.
+    """
+    expression: Expression
+    name: str | None = None
+
+    def build(self, context: 'SpecContext') -> ColumnElement:
+        expression = resolve(self.expression, context)
+        return expression if self.name is None else expression.label(self.name)
+
+
+@dataclass(frozen=True)
+class Join:
+    """
+    A joined table, mapped class or shared query; without ``onclause`` the join follows the foreign key.
+    """
+    target: Expression
+    onclause: Expression | None = None
+
+
+def window(expression: Expression, low: date, high: date, prefix: str = 'date') -> Expression:
+    """
+    ``low <= expression <= high`` with the bounds as ``<prefix>_from``/``<prefix>_to`` bind parameters.
+    """
+    return lambda context: and_(
+        resolve(expression, context) >= bindparam(f'{prefix}_from', low),
+        resolve(expression, context) <= bindparam(f'{prefix}_to', high),
+    )
+
+
+def _clause(expression):
+    # Mapped attributes compare through the column they stand for
+    return expression.__clause_element__() if hasattr(expression, '__clause_element__') else expression
+
+
+def _contains(expressions: list, expression) -> bool:
+    return any(_clause(expression).compare(_clause(other)) for other in expressions)
+
+
+def _same(onclause, other) -> bool:
+    if onclause is None or other is None:
+        return onclause is other
+    return _clause(onclause).compare(_clause(other))
+
+
+def _unlabeled(expression):
+    return expression.element if isinstance(expression, Label) else expression
+
+
+@dataclass(frozen=True)
+class ReportSpec:
+    """
+    Declarative report: dimensions and measures over joined tables, filtered, grouped and sorted.
+    With measures the statement is grouped by the dimensions unless ``group_by`` says otherwise.
+    Shared queries of the query class are referenced through ``context.cte(name)`` and compiled once per statement.
+    Building drops what cannot change the result: DISTINCT on a statement grouped by selected columns only,
+    ORDER BY of a statement nested without a LIMIT, and joins repeated with the same target and condition.
+    """
+    dimensions: tuple[Field, ...] = ()
+    measures: tuple[Field, ...] = ()
+    joins: tuple[Join, ...] = ()
+    filters: tuple[Expression, ...] = ()
+    group_by: tuple[Expression, ...] | None = None
+    # Names of selected columns, '-name' for descending, or functions of the context giving sort expressions
+    order_by: tuple[str | Callable[['SpecContext'], ColumnElement], ...] = ()
+    distinct: bool = False
+    limit: int | None = None
+    description: str | None = None
+
+    def replace(self, **changes) -> 'ReportSpec':
+        return replace(self, **changes)
+
+    def build(self, context: 'SpecContext', nested: bool = False) -> Select:
+        dimensions = [field.build(context) for field in self.dimensions]
+        statement = select(*dimensions, *(field.build(context) for field in self.measures))
+
+        joined = []
+        for join in self.joins:
+            target = resolve(join.target, context)
+            onclause = None if join.onclause is None else resolve(join.onclause, context)
+            if any(target is other and _same(onclause, other_onclause) for other, other_onclause in joined):
+                continue
+            joined.append((target, onclause))
+            statement = statement.join(target, onclause)
+
+        filters = [resolve(expression, context) for expression in self.filters]
+        if filters:
+            statement = statement.where(*filters)
+
+        grouped = []
+        if self.group_by is not None:
+            grouped = [resolve(expression, context) for expression in self.group_by]
+        elif self.measures:
+            grouped = [_unlabeled(dimension) for dimension in dimensions]
+        if grouped:
+            statement = statement.group_by(*grouped)
+
+        selected = [_unlabeled(dimension) for dimension in dimensions]
+        if self.distinct and not (grouped and all(_contains(selected, expression) for expression in grouped)):
+            statement = statement.distinct()
+
+        if self.order_by and not (nested and self.limit is None):
+            statement = statement.order_by(*(self._order(statement, item, context) for item in self.order_by))
+        if self.limit is not None:
+            statement = statement.limit(self.limit)
+        return statement
+
+    @staticmethod
+    def _order(statement: Select, item, context: 'SpecContext'):
+        if not isinstance(item, str):
+            return item(context)
+        descending = item.startswith('-')
+        column = statement.selected_columns[item.lstrip('-')]
+        return column.desc() if descending else column
+
+
+class SpecContext:
+    """
+    What spec expressions are built from: the query object's mapped classes and its shared queries as CTEs.
+    """
+
+    def __init__(self, sql_obj: 'BaseSQLQuery') -> None:
+        self.sql_obj = sql_obj
+        self._ctes = {}
+
+    def __getattr__(self, name: str):
+        return getattr(self.sql_obj, name)
+
+    def cte(self, name: str):
+        cte = self._ctes.get(name)
+        if cte is None:
+            cte = self._ctes[name] = type(self.sql_obj).shared_queries[name].build(self, nested=True).cte(name)
+        return cte
+
+
+class SpecReport:
+    """
+    Registers a ReportSpec as a report of the class it is assigned in, the declarative counterpart of a
+    ``@report()`` builder method.
+    """
+
+    def __init__(self, spec: ReportSpec, fetch: str = 'all') -> None:
+        self.spec = spec
+        self.report_fetch = fetch
+        self.__doc__ = spec.description
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.__name__ = name
+
+    def report_builder(self, sql_obj: 'BaseSQLQuery') -> Select:
+        return self.spec.build(SpecContext(sql_obj))
+
+    def __get__(self, instance: 'BaseSQLQuery | None', owner: type):
+        if instance is None:
+            return self
+        return partial(instance.run_report, self.__name__)
@@ -0,0 +1,169 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable
+
+from sqlalchemy import event, Executable
+from sqlalchemy.orm import Session, sessionmaker, ORMExecuteState
+from sqlalchemy.sql import visitors
+
+
+def statement_tables(statement: Executable) -> frozenset[str]:
+    """
+    Names of the tables a statement reads, collected from its FROM clauses, joins and subqueries.
+    """
+    return frozenset(
+        element.name for element in visitors.iterate(statement) if element.__visit_name__ == 'table'
+    )
+
+
+def returns_entities(statement: Executable) -> bool:
+    descriptions = getattr(statement, 'column_descriptions', [])
+    return any(
+        description.get('entity') is not None and description.get('type') is description.get('entity')
+        for description in descriptions
+    )
+
+
+def result_size(value) -> int:
+    """
+    Rough size in bytes of a report result: the containers plus every value in them.
+    """
+    if isinstance(value, (list, tuple)) or hasattr(value, '_fields'):
+        return sys.getsizeof(value) + sum(result_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+@dataclass
+class _Entry:
+    value: object
+    tables: frozenset[str]
+    expires_at: float | None
+    size: int
+
+
+class ResultCache:
+    """
+    LRU cache of report results with an optional TTL and a memory cap.
+    Every entry remembers the tables its statement reads, and is dropped as soon as
+    a watched session flushes or commits changes to one of them.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: float | None = 300) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._by_table: dict[str, set[Hashable]] = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> tuple[bool, object]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry.value
+
+    def set(self, key: Hashable, value, tables: frozenset[str]) -> None:
+        size = result_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+            self._entries[key] = _Entry(value=value, tables=tables, expires_at=expires_at, size=size)
+            self._bytes += size
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_tables(self, tables) -> int:
+        with self._lock:
+            keys = set()
+            for table in tables:
+                keys |= self._by_table.get(table, set())
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for table in entry.tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def watch(self, target: Session | sessionmaker | type[Session]) -> None:
+        """
+        Invalidate entries on flush, commit and rollback of a session, of every session of a sessionmaker
+        or of every Session. ORM-enabled UPDATE/DELETE/INSERT statements count as well.
+        """
+        event.listen(target, 'after_flush', self._after_flush)
+        event.listen(target, 'after_commit', self._after_commit)
+        event.listen(target, 'after_rollback', self._after_rollback)
+        event.listen(target, 'do_orm_execute', self._do_orm_execute)
+
+    @staticmethod
+    def _touched(session: Session) -> set:
+        return session.info.setdefault('result_cache_tables', set())
+
+    def _after_flush(self, session: Session, flush_context) -> None:
+        tables = self._touched(session)
+        for instance in (*session.new, *session.dirty, *session.deleted):
+            mapper = getattr(instance, '__mapper__', None)
+            if mapper is not None:
+                tables.update(table.name for table in mapper.tables)
+        self.invalidate_tables(tables)
+
+    def _after_commit(self, session: Session) -> None:
+        self.invalidate_tables(session.info.pop('result_cache_tables', set()))
+
+    def _after_rollback(self, session: Session) -> None:
+        # Results cached between the flush and the rollback saw the discarded changes
+        self.invalidate_tables(session.info.pop('result_cache_tables', set()))
+
+    def _do_orm_execute(self, state: ORMExecuteState) -> None:
+        if state.is_insert or state.is_update or state.is_delete:
+            tables = {state.statement.table.name}
+            self._touched(state.session).update(tables)
+            self.invalidate_tables(tables)
@@ -0,0 +1,462 @@
+import argparse
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable
+
+from sqlalchemy import (
+    BigInteger, Column, DateTime, Engine, Executable, Integer, MetaData, Numeric, String, Table,
+    and_, bindparam, case, create_engine as create_engine_, delete, desc, event, extract, func, insert, select,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import ORMExecuteState, Session, sessionmaker
+
+from src.config.db_setup import get_engine
+from src.config.schema_cache import load_base
+
+if TYPE_CHECKING:
+    from src.sql.base_sql_query import BaseSQLQuery
+
+_UPSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def _exact(column, scale: int):
+    """
+    A fractional column as an integer of ``scale`` units, so its sum over the source is exact and
+    the same whatever order the database adds the rows in.
+    """
+    return func.cast(func.round(column * scale), BigInteger)
+
+
+# Row hashes are taken modulo a prime below 2**31: every intermediate product stays within a BIGINT
+_MODULUS = 2147483647
+_MULTIPLIER = 1000003
+
+
+def _row_hash(identity: list, values: list):
+    """
+    Hash of a source row computed by the database: each value weighted by a factor derived from the row's
+    identity columns and from its position, so moving a value to another row or another column changes the
+    sum of the hashes, which sums of the plain columns cannot see.
+    """
+    row = 0
+    for column in identity:
+        row = (row * _MULTIPLIER + func.cast(column, BigInteger)) % _MODULUS
+    digest = 0
+    for position, value in enumerate(values, start=1):
+        weight = (row * _MULTIPLIER + position) % _MODULUS + 1
+        digest = (digest + (func.cast(value, BigInteger) % _MODULUS) * weight) % _MODULUS
+    return digest
+
+
+class Rollup(ABC):
+    """
+    A summary table kept next to the tables it aggregates.
+    Source rows are ordered by an integer key (order or invoice id): rows above the watermark are new and are
+    added to the rollup incrementally, while a changed count or checksum of the rows below it means old rows
+    were edited or deleted and the rollup is rebuilt.
+    """
+    name: str
+    source_tables: tuple[str, ...]
+    group_by: tuple[str, ...]
+    measures: tuple[str, ...]
+    # Report name -> builder of the statement reading the same result from the rollup
+    readers: dict[str, Callable[['BaseSQLQuery', Table], Executable]] = {}
+
+    @abstractmethod
+    def define(self, metadata: MetaData) -> Table:
+        pass
+
+    @abstractmethod
+    def key(self, source: MetaData):
+        pass
+
+    @abstractmethod
+    def identity(self, source: MetaData) -> list:
+        """
+        Columns identifying a source row, the primary key of the source table.
+        """
+
+    @abstractmethod
+    def checksums(self, source: MetaData) -> list:
+        """
+        Integer expressions hashed with the row's identity and summed over the source rows below the watermark:
+        every column the groups and measures are computed from must be part of them,
+        or an edit of that column leaves the rollup stale.
+        """
+
+    @abstractmethod
+    def delta(self, source: MetaData, low: int | None, high: int) -> Executable:
+        """
+        Aggregate of the source rows with ``low < key <= high``, one row per rollup group.
+        """
+
+
+def _order_subtotals(sql_obj, rollup: Table) -> Executable:
+    return select(
+        rollup.c.order_id,
+        func.cast(rollup.c.sub_total, Numeric(precision=10, scale=2)),
+    ).order_by(rollup.c.order_id)
+
+
+def _sales_by_year(sql_obj, rollup: Table) -> Executable:
+    orders = sql_obj.orders
+    return select(
+        orders.shipped_date,
+        orders.order_id,
+        func.cast(rollup.c.sub_total, Numeric(precision=10, scale=2)).label('sub_total'),
+        func.extract('year', orders.shipped_date).label('year'),
+    ).join(rollup, rollup.c.order_id == orders.order_id). \
+        where(and_(
+        orders.shipped_date != None,
+        orders.shipped_date >= bindparam('date_from'),
+        orders.shipped_date <= bindparam('date_to'),
+    )).order_by(orders.shipped_date, desc(orders.order_id))
+
+
+class OrderSubtotals(Rollup):
+    """
+    Subtotal of every Northwind order, read by order_subtotals and sales_by_year.
+    """
+    name = 'rollup_order_subtotals'
+    source_tables = ('order_details',)
+    group_by = ('order_id',)
+    measures = ('sub_total',)
+
+    def define(self, metadata: MetaData) -> Table:
+        return Table(
+            self.name, metadata,
+            Column('order_id', Integer, primary_key=True),
+            Column('sub_total', Numeric, nullable=False),
+        )
+
+    def key(self, source: MetaData):
+        return source.tables['order_details'].c.order_id
+
+    def identity(self, source: MetaData) -> list:
+        order_details = source.tables['order_details']
+        return [order_details.c.order_id, order_details.c.product_id]
+
+    def checksums(self, source: MetaData) -> list:
+        order_details = source.tables['order_details']
+        return [
+            order_details.c.order_id,
+            order_details.c.product_id,
+            order_details.c.quantity,
+            _exact(order_details.c.unit_price, 10000),
+            _exact(order_details.c.discount, 10000),
+        ]
+
+    def delta(self, source: MetaData, low: int | None, high: int) -> Executable:
+        order_details = source.tables['order_details']
+        key = self.key(source)
+        return select(
+            order_details.c.order_id,
+            func.sum(order_details.c.unit_price * order_details.c.quantity * (1 - order_details.c.discount)),
+        ).where(key <= high, *(() if low is None else (key > low,))).group_by(order_details.c.order_id)
+
+    readers = {'order_subtotals': _order_subtotals, 'sales_by_year': _sales_by_year}
+
+
+def _sales_per_country(sql_obj, rollup: Table) -> Executable:
+    return select(
+        sql_obj.customer.Country,
+        func.sum(rollup.c.total),
+    ).join(rollup, rollup.c.CustomerId == sql_obj.customer.CustomerId). \
+        group_by(sql_obj.customer.Country)
+
+
+def _top_country(sql_obj, rollup: Table) -> Executable:
+    return select(
+        sql_obj.customer.Country,
+        func.sum(rollup.c.total).label('total'),
+    ).join(rollup, rollup.c.CustomerId == sql_obj.customer.CustomerId). \
+        group_by(sql_obj.customer.Country). \
+        order_by(desc('total')). \
+        limit(1)
+
+
+def _sales_agent_total_sales(sql_obj, rollup: Table) -> Executable:
+    return select(
+        sql_obj.employee.EmployeeId,
+        sql_obj.employee.FirstName,
+        func.sum(rollup.c.total),
+    ).join(sql_obj.customer, sql_obj.customer.SupportRepId == sql_obj.employee.EmployeeId). \
+        join(rollup, rollup.c.CustomerId == sql_obj.customer.CustomerId). \
+        where(sql_obj.employee.Title == bindparam('title')). \
+        group_by(sql_obj.employee.EmployeeId)
+
+
+def _top_2009_agent(sql_obj, rollup: Table) -> Executable:
+    return select(
+        sql_obj.employee.EmployeeId,
+        sql_obj.employee.FirstName,
+        func.sum(rollup.c.total).label('sum_'),
+    ).join(sql_obj.customer, sql_obj.customer.SupportRepId == sql_obj.employee.EmployeeId). \
+        join(rollup, rollup.c.CustomerId == sql_obj.customer.CustomerId). \
+        where(sql_obj.employee.Title == bindparam('title')). \
+        where(rollup.c.year == bindparam('year')). \
+        group_by(sql_obj.employee.EmployeeId). \
+        order_by(desc('sum_')). \
+        limit(1)
+
+
+class CustomerYearSales(Rollup):
+    """
+    Invoice totals of every Chinook customer per year, read by the per-country and per-agent sales reports.
+    """
+    name = 'rollup_customer_year_sales'
+    source_tables = ('Invoice',)
+    group_by = ('CustomerId', 'year')
+    measures = ('total', 'invoices')
+
+    def define(self, metadata: MetaData) -> Table:
+        return Table(
+            self.name, metadata,
+            Column('CustomerId', Integer, primary_key=True),
+            Column('year', Integer, primary_key=True),
+            Column('total', Numeric(14, 2), nullable=False),
+            Column('invoices', Integer, nullable=False),
+        )
+
+    def key(self, source: MetaData):
+        return source.tables['Invoice'].c.InvoiceId
+
+    def identity(self, source: MetaData) -> list:
+        return [source.tables['Invoice'].c.InvoiceId]
+
+    def checksums(self, source: MetaData) -> list:
+        invoice = source.tables['Invoice']
+        year = func.cast(extract('year', invoice.c.InvoiceDate), Integer)
+        return [invoice.c.CustomerId, _exact(invoice.c.Total, 100), year]
+
+    def delta(self, source: MetaData, low: int | None, high: int) -> Executable:
+        invoice = source.tables['Invoice']
+        key = self.key(source)
+        year = func.cast(extract('year', invoice.c.InvoiceDate), Integer)
+        return select(
+            invoice.c.CustomerId,
+            year,
+            func.sum(invoice.c.Total),
+            func.count(),
+        ).where(key <= high, *(() if low is None else (key > low,))).group_by(invoice.c.CustomerId, year)
+
+    readers = {
+        'sales_per_country': _sales_per_country,
+        'top_country': _top_country,
+        'sales_agent_total_sales': _sales_agent_total_sales,
+        'top_2009_agent': _top_2009_agent,
+    }
+
+
+ROLLUPS = {
+    'northwind': [OrderSubtotals()],
+    'chinook': [CustomerYearSales()],
+}
+
+
+class RollupManager:
+    """
+    Creates, refreshes and serves the rollups of a database.
+    A rollup is read instead of the report's own statement only while it is known to be fresh: it was checked
+    against its source within ``max_age`` seconds and no watched session has written to the source since.
+    Otherwise it is checked again and, with ``auto_refresh``, brought up to date first;
+    a rollup that stays stale leaves the report on its original statement.
+    """
+
+    def __init__(self, engine: Engine, source: MetaData, rollups: list[Rollup],
+                 max_age: float = 60, auto_refresh: bool = True) -> None:
+        self.engine = engine
+        self.source = source
+        self.max_age = max_age
+        self.auto_refresh = auto_refresh
+        self.metadata = MetaData()
+        self.state = Table(
+            'rollup_state', self.metadata,
+            Column('name', String(64), primary_key=True),
+            Column('watermark', BigInteger, nullable=False),
+            Column('fingerprint', String(200), nullable=False),
+            Column('refreshed_at', DateTime, nullable=False),
+        )
+        self.rollups = {rollup.name: rollup for rollup in rollups}
+        self.tables = {rollup.name: rollup.define(self.metadata) for rollup in rollups}
+        self.by_report = {report: rollup for rollup in rollups for report in rollup.readers}
+
+        self._verified: dict[str, float] = {}
+        self._statements: dict[tuple[str, str], Executable] = {}
+        self._lock = threading.RLock()
+
+    def create(self) -> None:
+        self.metadata.create_all(self.engine)
+
+    def _fingerprint(self, connection, rollup: Rollup, watermark: int | None) -> tuple[int | None, str]:
+        """
+        Current highest source key, and the count and summed row hashes of the source rows up to the watermark.
+        """
+        key = rollup.key(self.source)
+        below = key <= (watermark if watermark is not None else key)
+        digest = _row_hash(rollup.identity(self.source), rollup.checksums(self.source))
+        row = connection.execute(select(
+            func.max(key),
+            func.count(case((below, 1))),
+            func.sum(case((below, digest))),
+        )).one()
+        return row[0], ':'.join(str(value) for value in row[1:])
+
+    def _status(self, connection, rollup: Rollup, state) -> tuple[str, int]:
+        """
+        Status of a rollup against its state row, and the current highest source key.
+        """
+        if state is None:
+            highest, _ = self._fingerprint(connection, rollup, None)
+            return 'missing', highest or 0
+        highest, fingerprint = self._fingerprint(connection, rollup, state.watermark)
+        if fingerprint != state.fingerprint:
+            return 'changed', highest or 0
+        if (highest or 0) > state.watermark:
+            return 'append', highest
+        return 'fresh', highest or 0
+
+    def check(self, name: str) -> str:
+        """
+        'fresh', 'append' when only new source rows arrived, 'changed' when older rows changed, 'missing' if never built.
+        """
+        with self.engine.connect() as connection:
+            state = connection.execute(select(self.state).where(self.state.c.name == name)).one_or_none()
+            return self._status(connection, self.rollups[name], state)[0]
+
+    def _locked_state(self, connection, name: str):
+        """
+        State row of a rollup, locked until the end of the transaction so that refreshes from other processes
+        wait for this one and then see its watermark; on Postgres an advisory lock also covers a missing row.
+        """
+        if connection.dialect.name == 'postgresql':
+            connection.execute(select(func.pg_advisory_xact_lock(zlib.crc32(name.encode()))))
+        return connection.execute(
+            select(self.state).where(self.state.c.name == name).with_for_update()
+        ).one_or_none()
+
+    def refresh(self, name: str, full: bool = False) -> int:
+        """
+        Bring a rollup up to date, incrementally when possible. Returns the number of groups written.
+        Refreshes are serialized: the status is taken again once the rollup is locked, so a delta already
+        applied by a concurrent refresh is not added a second time.
+        """
+        rollup = self.rollups[name]
+        table = self.tables[name]
+        with self._lock, self.engine.begin() as connection:
+            state = self._locked_state(connection, name)
+            status, highest = self._status(connection, rollup, state)
+            if full:
+                status = 'missing'
+            elif status == 'fresh':
+                self._mark_verified(name)
+                return 0
+
+            columns = [*rollup.group_by, *rollup.measures]
+            upsert = _UPSERTS.get(connection.dialect.name)
+            if status == 'append' and upsert is not None:
+                low = state.watermark
+                rows = [dict(zip(columns, row)) for row in connection.execute(rollup.delta(self.source, low, highest))]
+                if rows:
+                    statement = upsert(table)
+                    connection.execute(statement.on_conflict_do_update(
+                        index_elements=list(rollup.group_by),
+                        set_={measure: table.c[measure] + statement.excluded[measure] for measure in rollup.measures},
+                    ), rows)
+                written = len(rows)
+            else:
+                connection.execute(delete(table))
+                written = connection.execute(
+                    insert(table).from_select(columns, rollup.delta(self.source, None, highest))
+                ).rowcount
+
+            _, fingerprint = self._fingerprint(connection, rollup, highest)
+            connection.execute(delete(self.state).where(self.state.c.name == name))
+            connection.execute(insert(self.state).values(
+                name=name, watermark=highest, fingerprint=fingerprint, refreshed_at=datetime.now()
+            ))
+        self._mark_verified(name)
+        return written
+
+    def refresh_all(self, full: bool = False) -> dict[str, int]:
+        return {name: self.refresh(name, full=full) for name in self.rollups}
+
+    def _mark_verified(self, name: str) -> None:
+        with self._lock:
+            self._verified[name] = time.monotonic()
+
+    def mark_stale(self, tables) -> None:
+        with self._lock:
+            for name, rollup in self.rollups.items():
+                if set(rollup.source_tables) & set(tables):
+                    self._verified.pop(name, None)
+
+    def is_fresh(self, name: str) -> bool:
+        with self._lock:
+            verified = self._verified.get(name)
+        if verified is not None and time.monotonic() - verified < self.max_age:
+            return True
+        status = self.check(name)
+        if status != 'fresh' and self.auto_refresh:
+            self.refresh(name)
+            return True
+        if status == 'fresh':
+            self._mark_verified(name)
+        return status == 'fresh'
+
+    def statement(self, sql_obj: 'BaseSQLQuery', name: str) -> Executable | None:
+        """
+        Statement reading a report from its rollup, or None when the report has no fresh rollup.
+        """
+        rollup = self.by_report.get(name)
+        if rollup is None or not self.is_fresh(rollup.name):
+            return None
+        key = (type(sql_obj).__qualname__, name)
+        with self._lock:
+            statement = self._statements.get(key)
+            if statement is None:
+                statement = self._statements[key] = rollup.readers[name](sql_obj, self.tables[rollup.name])
+        return statement
+
+    def watch(self, target: Session | sessionmaker | type[Session]) -> None:
+        """
+        Treat the rollups as stale as soon as a session flushes changes to their source tables.
+        """
+        event.listen(target, 'after_flush', self._after_flush)
+        event.listen(target, 'do_orm_execute', self._do_orm_execute)
+
+    def _after_flush(self, session: Session, flush_context) -> None:
+        tables = set()
+        for instance in (*session.new, *session.dirty, *session.deleted):
+            mapper = getattr(instance, '__mapper__', None)
+            if mapper is not None:
+                tables.update(table.name for table in mapper.tables)
+        self.mark_stale(tables)
+
+    def _do_orm_execute(self, state: ORMExecuteState) -> None:
+        if state.is_insert or state.is_update or state.is_delete:
+            self.mark_stale({state.statement.table.name})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create and refresh the report rollups of a dataset.')
+    parser.add_argument('dataset', choices=ROLLUPS)
+    parser.add_argument('--url', help='database URL, defaults to the dataset\'s configured database')
+    parser.add_argument('--full', action='store_true', help='rebuild instead of refreshing incrementally')
+    args = parser.parse_args()
+
+    engine = create_engine_(args.url) if args.url else get_engine(args.dataset)
+    manager = RollupManager(engine, load_base(engine).metadata, ROLLUPS[args.dataset])
+    manager.create()
+    for name in manager.rollups:
+        before = manager.check(name)
+        start = time.perf_counter()
+        written = manager.refresh(name, full=args.full)
+        print(f'{name:<32} {before:>8} -> fresh, {written:>8} groups written in {time.perf_counter() - start:.3f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,11 @@
-from sqlalchemy import select, func, and_, or_, extract, desc, case, null
+from datetime import datetime
+
+from sqlalchemy import select, func, and_, or_, extract, desc, case, null, bindparam
 from sqlalchemy.ext.automap import AutomapBase
 from sqlalchemy.orm import Session
 
-from src.sql.base_sql_query import BaseSQLQuery
+from src.sql.base_sql_query import BaseSQLQuery, bundle, ranking, report
+from src.sql.loading import STRICT, LoadingProfile, LoadPath
 
 
 class SQLQueryChinook(BaseSQLQuery):
@@ -23,6 +26,7 @@ class SQLQueryChinook(BaseSQLQuery):
         self.media_type = base.classes['MediaType']
         self.genre = base.classes['Genre']
 
+    @report()
     def non_usa_customers(self):
         """
         Provide a query showing Customers (just their full names, customer ID and country) who are not in the US.
@@ -33,9 +37,17 @@ class SQLQueryChinook(BaseSQLQuery):
             self.customer.LastName,
             self.customer.CustomerId,
             self.customer.Country
-        ).where(self.customer.Country != 'USA')
-        return self.session.execute(query).fetchall()
-
+        ).where(self.customer.Country != bindparam('country', 'USA'))
+        return query
+
+    @report(loading={
+        'invoices': LoadingProfile(
+            loads=(LoadPath('invoice_collection.invoiceline_collection.track'),),
+            description='Each customer with their invoices, the lines of the invoices and the purchased tracks.',
+        ),
+        'support_rep': LoadingProfile(loads=(LoadPath('employee', 'joined'),)),
+        'strict': STRICT,
+    })
     def brazil_customers(self):
         """
         Provide a query only showing the Customers from Brazil.
@@ -43,9 +55,10 @@ class SQLQueryChinook(BaseSQLQuery):
         """
         query = select(
             self.customer
-        ).where(self.customer.Country == 'Brazil')
-        return self.session.execute(query).fetchall()
+        ).where(self.customer.Country == bindparam('country', 'Brazil'))
+        return query
 
+    @report()
     def brasil_customers_invoices(self):
         """
         Provide a query showing the Invoices for customers who are from Brazil.
@@ -60,9 +73,10 @@ class SQLQueryChinook(BaseSQLQuery):
             self.invoice.InvoiceDate,
             self.invoice.BillingCountry
         ).join(self.invoice). \
-            where(self.customer.Country == 'Brazil')
-        return self.session.execute(query).fetchall()
+            where(self.customer.Country == bindparam('country', 'Brazil'))
+        return query
 
+    @report()
     def sales_agents(self):
         """
         Provide a query showing only the Employees who are Sales Agents.
@@ -72,9 +86,10 @@ class SQLQueryChinook(BaseSQLQuery):
             self.employee.FirstName,
             self.employee.LastName
         ). \
-            where(self.employee.Title == 'Sales Support Agent')
-        return self.session.execute(query).fetchall()
+            where(self.employee.Title == bindparam('title', 'Sales Support Agent'))
+        return query
 
+    @report()
     def sales_agent_with_case_when(self):
         query = select(
             self.employee.EmployeeId,
@@ -87,8 +102,7 @@ class SQLQueryChinook(BaseSQLQuery):
             )
         ). \
             group_by(self.employee.EmployeeId)
-        print(query)
-        return self.session.execute(query).fetchall()
+        return query
 
     #
     # case(
@@ -97,6 +111,7 @@ class SQLQueryChinook(BaseSQLQuery):
     #     case(
     #     (self.employee.EmployeeId == 5, self.invoice.Total), else_=null()
     # ).label('Steve_Johnson')
+    @report()
     def unique_invoice_countries(self):
         """
         Provide a query showing a unique/distinct list of billing countries from the Invoice table.
@@ -105,9 +120,9 @@ class SQLQueryChinook(BaseSQLQuery):
         query = select(
             self.invoice.BillingCountry,
         ).distinct()
-        print(query)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def sales_agent_invoices(self):
         """
         Provide a query that shows the invoices associated with each sales agent.
@@ -120,8 +135,9 @@ class SQLQueryChinook(BaseSQLQuery):
             self.invoice.InvoiceId
         ).join(self.customer, self.customer.SupportRepId == self.employee.EmployeeId). \
             join(self.invoice)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def invoice_totals(self):
         """
          Provide a query that shows the Invoice Total, Customer name,
@@ -136,8 +152,21 @@ class SQLQueryChinook(BaseSQLQuery):
             self.invoice.Total
         ).join(self.customer, self.customer.SupportRepId == self.employee.EmployeeId). \
             join(self.invoice)
-        return self.session.execute(query).fetchall()
+        return query
+
+    def _invoice_years(self):
+        return or_(
+            and_(
+                self.invoice.InvoiceDate >= bindparam('first_from', datetime(2009, 1, 1)),
+                self.invoice.InvoiceDate <= bindparam('first_to', datetime(2009, 12, 31))
+            ),
+            and_(
+                self.invoice.InvoiceDate >= bindparam('second_from', datetime(2011, 1, 1)),
+                self.invoice.InvoiceDate <= bindparam('second_to', datetime(2011, 12, 31))
+            )
+        )
 
+    @report(fetch='one')
     def total_invoices_year(self):
         """
         How many Invoices were there in 2009 and 2011?
@@ -146,12 +175,10 @@ class SQLQueryChinook(BaseSQLQuery):
 
         query = select(
             func.count()
-        ).filter(or_(
-            and_(self.invoice.InvoiceDate >= '2009-01-01', self.invoice.InvoiceDate <= '2009-12-31'),
-            and_(self.invoice.InvoiceDate >= '2011-01-01', self.invoice.InvoiceDate <= '2011-12-31')
-        ))
-        return self.session.execute(query).fetchone()
+        ).filter(self._invoice_years())
+        return query
 
+    @report(fetch='one')
     def total_sales(self):
         """
         What are the respective total sales for each of those years?
@@ -159,12 +186,10 @@ class SQLQueryChinook(BaseSQLQuery):
         """
         query = select(
             func.sum(self.invoice.Total)
-        ).filter(or_(
-            and_(self.invoice.InvoiceDate >= '2009-01-01', self.invoice.InvoiceDate <= '2009-12-31'),
-            and_(self.invoice.InvoiceDate >= '2011-01-01', self.invoice.InvoiceDate <= '2011-12-31')
-        ))
-        return self.session.execute(query).fetchone()
+        ).filter(self._invoice_years())
+        return query
 
+    @report()
     def invoice_37_line_item_count(self):
         """
         Looking at the InvoiceLine table, provide a query that COUNT the number of line items for Invoice ID 37.
@@ -172,9 +197,10 @@ class SQLQueryChinook(BaseSQLQuery):
         """
         query = select(
             func.count()
-        ).filter(self.invoice_line.InvoiceId == 37)
-        return self.session.execute(query).fetchall()
+        ).filter(self.invoice_line.InvoiceId == bindparam('invoice_id', 37))
+        return query
 
+    @report()
     def line_items_per_invoice(self):
         """
         Looking at the InvoiceLine table,
@@ -185,8 +211,15 @@ class SQLQueryChinook(BaseSQLQuery):
             self.invoice_line.InvoiceId,
             func.count(self.invoice_line.InvoiceLineId)
         ).group_by(self.invoice_line.InvoiceId)
-        return self.session.execute(query).fetchall()
-
+        return query
+
+    @report(loading={
+        'invoice': LoadingProfile(
+            loads=(LoadPath('invoice.customer', 'joined'),),
+            description='Each line with its invoice and the customer billed.',
+        ),
+        'strict': STRICT,
+    })
     def line_item_track(self):
         """
          Provide a query that includes the purchased track name with each invoice line item.
@@ -196,8 +229,9 @@ class SQLQueryChinook(BaseSQLQuery):
             self.track.Name,
             self.invoice_line
         ).join(self.track, self.track.TrackId == self.invoice_line.TrackId)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def line_item_track_artist(self):
         """
         Provide a query that includes the purchased track name AND artist name with each invoice line item.
@@ -208,8 +242,9 @@ class SQLQueryChinook(BaseSQLQuery):
             self.track.Composer,
             self.invoice_line.InvoiceLineId
         ).join(self.track)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def country_invoices(self):
         """
         Provide a query that shows the # of invoices per country. HINT: GROUP BY
@@ -219,8 +254,9 @@ class SQLQueryChinook(BaseSQLQuery):
             self.invoice.BillingCountry,
             func.count(self.invoice.InvoiceId)
         ).group_by(self.invoice.BillingCountry)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def tracks_no_id(self):
         """
         Provide a query that shows all the Tracks, but displays no IDs.
@@ -235,8 +271,9 @@ class SQLQueryChinook(BaseSQLQuery):
         ).join(self.album). \
             join(self.media_type). \
             join(self.genre)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def invoices_line_item_count(self):
         """
         Provide a query that shows all Invoices but includes the # of invoice line items.
@@ -246,8 +283,9 @@ class SQLQueryChinook(BaseSQLQuery):
             self.invoice.InvoiceId,
             func.count(self.invoice.InvoiceId)
         ).group_by(self.invoice.InvoiceId)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def sales_agent_total_sales(self):
         """
         Provide a query that shows total sales made by each sales agent.
@@ -259,10 +297,11 @@ class SQLQueryChinook(BaseSQLQuery):
             func.sum(self.invoice.Total)
         ).join(self.customer, self.customer.SupportRepId == self.employee.EmployeeId). \
             join(self.invoice, self.customer.CustomerId == self.invoice.CustomerId). \
-            where(self.employee.Title == 'Sales Support Agent'). \
+            where(self.employee.Title == bindparam('title', 'Sales Support Agent')). \
             group_by(self.employee.EmployeeId)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def top_2009_agent(self):
         """
         Which sales agent made the most in sales in 2009?
@@ -275,25 +314,29 @@ class SQLQueryChinook(BaseSQLQuery):
             func.sum(self.invoice.Total).label("sum_")
         ).join(self.customer, self.customer.SupportRepId == self.employee.EmployeeId). \
             join(self.invoice, self.customer.CustomerId == self.invoice.CustomerId). \
-            where(self.employee.Title == 'Sales Support Agent'). \
-            where(extract('year', self.invoice.InvoiceDate) == 2009). \
+            where(self.employee.Title == bindparam('title', 'Sales Support Agent')). \
+            where(extract('year', self.invoice.InvoiceDate) == bindparam('year', 2009)). \
             group_by(self.employee.EmployeeId). \
             order_by(desc('sum_')). \
             limit(1)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report(fetch='one')
     def extract_date_between_date(self):
-        query_1 = select(
-            func.count()
-        ).where(and_(self.invoice.InvoiceDate >= '2009-01-01', self.invoice.InvoiceDate <= '2009-12-31'))
-        query_2 = select(
-            func.count()
-        ).where(extract('year', self.invoice.InvoiceDate) == 2009)
-        print(query_1)
-        print(query_2)
-        print(self.session.execute(query_1).fetchall())
-        print(self.session.execute(query_2).fetchall())
-
+        """
+        Count the invoices of a year twice: with a date range and with extract('year'), as two filtered counts of one scan.
+        :return:
+        """
+        query = select(
+            func.count().filter(and_(
+                self.invoice.InvoiceDate >= bindparam('date_from', datetime(2009, 1, 1)),
+                self.invoice.InvoiceDate <= bindparam('date_to', datetime(2009, 12, 31))
+            )).label('by_date_range'),
+            func.count().filter(extract('year', self.invoice.InvoiceDate) == bindparam('year', 2009)).label('by_year')
+        )
+        return query
+
+    @report()
     def sales_agent_customer_count(self):
         """
          Provide a query that shows the count of customers assigned to each sales agent.
@@ -305,8 +348,9 @@ class SQLQueryChinook(BaseSQLQuery):
             func.count(self.customer.CustomerId),
         ).join(self.customer, self.customer.SupportRepId == self.employee.EmployeeId). \
             group_by(self.employee.EmployeeId)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def sales_per_country(self):
         """
         Provide a query that shows the total sales per country.
@@ -317,8 +361,9 @@ class SQLQueryChinook(BaseSQLQuery):
             func.sum(self.invoice.Total)
         ).join(self.customer). \
             group_by(self.customer.Country)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def top_country(self):
         """
         Which country's customers spent the most?
@@ -331,8 +376,9 @@ class SQLQueryChinook(BaseSQLQuery):
             group_by(self.customer.Country). \
             order_by(desc('total')). \
             limit(1)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def top_2013_track(self):
         """
         Provide a query that shows the most purchased track of 2013.
@@ -343,13 +389,14 @@ class SQLQueryChinook(BaseSQLQuery):
             func.sum(self.invoice_line.InvoiceId).label('total')
         ).join(self.invoice, self.invoice.InvoiceId == self.invoice_line.InvoiceId). \
             join(self.track, self.track.TrackId == self.invoice_line.TrackId). \
-            where(extract('year', self.invoice.InvoiceDate) == 2013). \
+            where(extract('year', self.invoice.InvoiceDate) == bindparam('year', 2013)). \
             group_by(self.track.Name). \
             order_by(desc('total')). \
             limit(10)
 
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def top_5_tracks(self):
         """
          Provide a query that shows the top 5 most purchased tracks over all.
@@ -364,8 +411,9 @@ class SQLQueryChinook(BaseSQLQuery):
             order_by(desc('total')). \
             limit(5)
 
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def top_3_artists(self):
         """
         Provide a query that shows the top 3 best-selling artists.
@@ -382,8 +430,9 @@ class SQLQueryChinook(BaseSQLQuery):
             order_by(desc('total')). \
             limit(3)
 
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def top_media_type(self):
         """
         Provide a query that shows the most purchased Media Type.# sqlite-assignment-chinook
@@ -397,4 +446,102 @@ class SQLQueryChinook(BaseSQLQuery):
             group_by(self.media_type.Name). \
             order_by(desc('count')). \
             limit(1)
-        return self.session.execute(query).fetchall()
+        return query
+
+    @ranking(score='total', partition_by=('year',))
+    def top_agent_per_year(self):
+        """
+        Which sales agent made the most in sales in each year?
+        :return:
+        """
+        year = extract('year', self.invoice.InvoiceDate)
+        query = select(
+            year.label('year'),
+            self.employee.EmployeeId,
+            self.employee.FirstName,
+            func.sum(self.invoice.Total).label('total')
+        ).join(self.customer, self.customer.SupportRepId == self.employee.EmployeeId). \
+            join(self.invoice, self.customer.CustomerId == self.invoice.CustomerId). \
+            where(self.employee.Title == bindparam('title', 'Sales Support Agent')). \
+            group_by(year, self.employee.EmployeeId)
+        return query
+
+    @ranking(score='total', partition_by=('genre',), n=3)
+    def top_tracks_per_genre(self):
+        """
+        Provide a query that shows the 3 most purchased tracks of each genre.
+        :return:
+        """
+        query = select(
+            self.genre.Name.label('genre'),
+            self.track.TrackId,
+            self.track.Name,
+            func.sum(self.invoice_line.Quantity).label('total')
+        ).join(self.track, self.track.GenreId == self.genre.GenreId). \
+            join(self.invoice_line, self.invoice_line.TrackId == self.track.TrackId). \
+            group_by(self.genre.Name, self.track.TrackId)
+        return query
+
+    @bundle('total_invoices_year', 'total_sales')
+    def invoice_year_totals(self):
+        """
+        Invoice count and total sales of the same two years in one scan of Invoice.
+        :return:
+        """
+        query = select(
+            func.count(),
+            func.sum(self.invoice.Total)
+        ).filter(self._invoice_years())
+        return query, lambda rows: ([rows[0][:1]], [rows[0][1:]])
+
+    @bundle('sales_per_country', 'top_country')
+    def country_sales(self):
+        """
+        Total sales per country, with the position of each country ranked by its total for the top one.
+        :return:
+        """
+        total = func.sum(self.invoice.Total)
+        query = select(
+            self.customer.Country,
+            total,
+            func.row_number().over(order_by=total.desc())
+        ).join(self.customer). \
+            group_by(self.customer.Country). \
+            order_by(self.customer.Country)
+        return query, lambda rows: ([row[:2] for row in rows], [row[:2] for row in rows if row[2] == 1])
+
+    @bundle('top_5_tracks', 'top_2013_track')
+    def top_tracks(self):
+        """
+        Track totals over all years and for one year from the same grouping, each total with its own ranking,
+        keeping only the tracks in either top list.
+        :return:
+        """
+        total = func.sum(self.invoice_line.InvoiceId)
+        year_total = func.sum(self.invoice_line.InvoiceId).filter(
+            extract('year', self.invoice.InvoiceDate) == bindparam('year', 2013)
+        )
+        totals = select(
+            self.track.Name,
+            total.label('total'),
+            year_total.label('year_total'),
+            func.row_number().over(order_by=total.desc()).label('position'),
+            func.row_number().over(order_by=year_total.desc().nulls_last()).label('year_position')
+        ).join(self.invoice, self.invoice.InvoiceId == self.invoice_line.InvoiceId). \
+            join(self.track, self.track.TrackId == self.invoice_line.TrackId). \
+            group_by(self.track.Name). \
+            subquery()
+        query = select(totals).where(or_(
+            totals.c.position <= 5,
+            and_(totals.c.year_position <= 10, totals.c.year_total.is_not(None))
+        ))
+
+        def split(rows):
+            overall = sorted((row for row in rows if row.position <= 5), key=lambda row: row.position)
+            year = sorted(
+                (row for row in rows if row.year_position <= 10 and row.year_total is not None),
+                key=lambda row: row.year_position
+            )
+            return [(row.Name, row.total) for row in overall], [(row.Name, row.year_total) for row in year]
+
+        return query, split
@@ -1,15 +1,58 @@
-from sqlalchemy import select, func, literal, Numeric, desc, asc, case
+from datetime import date
+
+from sqlalchemy import select, func, literal, Numeric, desc, case, bindparam
 from sqlalchemy.ext.automap import AutomapBase
 from sqlalchemy.orm import Session
 from sqlalchemy.sql.elements import and_
 
-from src.sql.base_sql_query import BaseSQLQuery
+from src.sql.base_sql_query import BaseSQLQuery, ranking, report
+from src.sql.loading import STRICT, LoadingProfile, LoadPath
+from src.sql.report_spec import Field, Join, ReportSpec, SpecContext, SpecReport, window
+
+
+def revenue(context: SpecContext):
+    """
+    Sales amount of order lines after discount, rounded to cents.
+    """
+    order_details = context.order_details
+    return func.cast(func.sum(
+        order_details.unit_price * order_details.quantity * (1 - order_details.discount)
+    ), Numeric(precision=10, scale=2))
+
+
+def quarter_revenue(quarter: int) -> Field:
+    return Field(lambda context: case((
+        func.extract('quarter', context.orders.order_date) == quarter,
+        revenue(context)
+    ),
+        else_=0
+    ), f'qtr {quarter}')
+
+
+ORDER_SUBTOTALS = ReportSpec(
+    dimensions=(Field('order_details.order_id'),),
+    measures=(Field(revenue, 'sub_total'),),
+    order_by=('order_id',),
+)
+
+PRODUCT_ORDER_SALES = ReportSpec(
+    dimensions=(Field('order_details.order_id'), Field('products.product_id'), Field('products.product_name')),
+    measures=(Field(revenue, 'extend_price'),),
+    joins=(Join('order_details'),),
+    group_by=('order_details.order_id', 'products.product_id'),
+    order_by=('order_id',),
+    distinct=True,
+)
 
 
 class SQLQueryNorthwind(BaseSQLQuery):
     """
     All questions from https://www.geeksengine.com/database/problem-solving/northwind-queries-part-1.php
     """
+    shared_queries = {
+        'order_subtotals': ORDER_SUBTOTALS,
+        'product_order_sales': PRODUCT_ORDER_SALES,
+    }
 
     def __init__(self, base: AutomapBase, session: Session) -> None:
         super().__init__(base=base, session=session)
@@ -29,69 +72,64 @@ class SQLQueryNorthwind(BaseSQLQuery):
         self.region = self.base.classes['region']
         self.us_states = self.base.classes['us_states']
 
-    def order_subtotals(self):
-        """
+    order_subtotals = SpecReport(ORDER_SUBTOTALS.replace(
+        measures=(Field(revenue),),
+        description="""
         For each order, calculate a subtotal for each Order (identified by OrderID).
         This is a simple query using GROUP BY to aggregate data for each order.
-        """
-
-        query = select(
-            self.order_details.order_id,
-            func.cast(func.sum(
-                self.order_details.unit_price * self.order_details.quantity * (1 - self.order_details.discount)
-            ), Numeric(precision=10, scale=2))
-        ).group_by(self.order_details.order_id). \
-            order_by(self.order_details.order_id)
+        """,
+    ))
 
-        return self.session.execute(query).fetchall()
-
-    def sales_by_year(self):
-        """
+    sales_by_year = SpecReport(ReportSpec(
+        dimensions=(
+            Field('orders.shipped_date'),
+            Field('orders.order_id'),
+            Field(lambda context: context.cte('order_subtotals').c.sub_total),
+            Field(lambda context: func.extract('year', context.orders.shipped_date), 'year'),
+        ),
+        joins=(Join(
+            lambda context: context.cte('order_subtotals'),
+            lambda context: context.cte('order_subtotals').c.order_id == context.orders.order_id,
+        ),),
+        filters=(
+            lambda context: context.orders.shipped_date.is_not(None),
+            window('orders.shipped_date', date(1996, 12, 24), date(1997, 9, 30)),
+        ),
+        order_by=('shipped_date', '-order_id'),
+        description="""
         This query shows how to get the year part from Shipped_Date column.
         A subtotal is calculated by a sub-query for each order.
         The sub-query forms a table and then joined with the Orders table.
-        """
-        sub_query = select(
-            self.order_details.order_id,
-            func.cast(func.sum(
-                self.order_details.unit_price * self.order_details.quantity * (1 - self.order_details.discount)
-            ), Numeric(precision=10, scale=2)).label('sub_total')
-        ).group_by(self.order_details.order_id). \
-            order_by(self.order_details.order_id).subquery()
-
-        query = select(
-            self.orders.shipped_date,
-            self.orders.order_id,
-            sub_query.c.sub_total,
-            func.extract("year", self.orders.shipped_date).label('year')
-        ).join(sub_query, sub_query.c.order_id == self.orders.order_id). \
-            where(and_(
-            self.orders.shipped_date != None,
-            self.orders.shipped_date >= "1996-12-24",
-            self.orders.shipped_date <= "1997-09-30"
-        )).order_by(asc(self.orders.shipped_date), desc(self.orders.order_id))
-
-        return self.session.execute(query).fetchall()
+        """,
+    ))
 
-    def employee_sales_by_country(self):
-        """
+    employee_sales_by_country = SpecReport(ReportSpec(
+        dimensions=(
+            Field('customers.country'),
+            Field('employees.first_name'),
+            Field('employees.last_name'),
+            Field('orders.order_id'),
+        ),
+        measures=(Field(revenue, 'sales_amount'),),
+        joins=(
+            Join('orders', lambda context: context.orders.employee_id == context.employees.employee_id),
+            Join('customers', lambda context: context.customers.customer_id == context.orders.customer_id),
+            Join('order_details', lambda context: context.order_details.order_id == context.orders.order_id),
+        ),
+        group_by=('employees.employee_id', 'orders.order_id', 'customers.country'),
+        order_by=(lambda context: desc(context.employees.employee_id), 'country'),
+        description="""
         For each employee, get their sales amount, broken down by country name.
-        """
-        query = select(
-            self.customers.country,
-            self.employees.first_name,
-            self.employees.last_name,
-            self.orders.order_id,
-            func.cast(func.sum(
-                self.order_details.unit_price * self.order_details.quantity * (1 - self.order_details.discount)
-            ), Numeric(precision=10, scale=2)).label('sales_amount')
-        ).join(self.orders, self.orders.employee_id == self.employees.employee_id). \
-            join(self.customers, self.customers.customer_id == self.orders.customer_id). \
-            join(self.order_details, self.order_details.order_id == self.orders.order_id). \
-            group_by(self.employees.employee_id, self.orders.order_id, self.customers.country). \
-            order_by(desc(self.employees.employee_id), self.customers.country)
-        return self.session.execute(query).fetchall()
+        """,
+    ))
 
+    @report(loading={
+        'catalog': LoadingProfile(
+            loads=(LoadPath('categories', 'joined'), LoadPath('suppliers', 'joined')),
+            description='Each product with its category and supplier.',
+        ),
+        'strict': STRICT,
+    })
     def alphabetical_list_of_products(self):
         """
         This is a rather simple query to get an alphabetical list of products.
@@ -101,8 +139,9 @@ class SQLQueryNorthwind(BaseSQLQuery):
         ).order_by(
             self.products.product_name
         )
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def current_product_list(self):
         """
         This is a rather simple query to get an alphabetical list of products.
@@ -110,74 +149,60 @@ class SQLQueryNorthwind(BaseSQLQuery):
         query = select(
             self.products.product_name
         ).where(self.products.discontinued == 1)
-        return self.session.execute(query).fetchall()
+        return query
 
-    def order_details_extended(self):
-        """
+    order_details_extended = SpecReport(PRODUCT_ORDER_SALES.replace(
+        measures=(Field(revenue, 'sales_amount'),),
+        description="""
         This query calculates sales price for each order after discount is applied.
-        """
-        query = select(
-            self.order_details.order_id,
-            self.products.product_id,
-            self.products.product_name,
-            func.cast(func.sum(
-                self.order_details.unit_price * self.order_details.quantity * (1 - self.order_details.discount)
-            ), Numeric(precision=10, scale=2)).label('sales_amount')
-        ).join(self.order_details). \
-            group_by(self.order_details.order_id, self.products.product_id). \
-            order_by(self.order_details.order_id). \
-            distinct()
-
-        return self.session.execute(query).fetchall()
+        """,
+    ))
 
-    def sales_by_category(self):
-        """
+    sales_by_category = SpecReport(ReportSpec(
+        dimensions=(
+            Field('categories.category_id'),
+            Field('products.product_name'),
+            Field('categories.category_name'),
+        ),
+        measures=(Field(lambda context: func.sum(context.cte('product_order_sales').c.extend_price), 'product_sales'),),
+        joins=(
+            Join('products', lambda context: context.products.category_id == context.categories.category_id),
+            Join(
+                lambda context: context.cte('product_order_sales'),
+                lambda context: context.cte('product_order_sales').c.product_id == context.products.product_id,
+            ),
+            Join('orders', lambda context: context.orders.order_id == context.cte('product_order_sales').c.order_id),
+        ),
+        filters=(window('orders.order_date', date(1997, 1, 1), date(1997, 12, 31)),),
+        group_by=('categories.category_id', 'categories.category_name', 'products.product_name'),
+        order_by=('category_id', 'category_name', 'product_name'),
+        description="""
         For each category, we get the list of products sold and the total sales amount.
         Note that, in the second query, the inner query for table c is to get sales for each product on each order. It then joins with outer query on Product_ID. In the outer query, products are grouped for each category.
-        """
-        subquery = select(
-            self.order_details.order_id,
-            self.products.product_id,
-            self.products.product_name,
-            func.cast(func.sum(
-                self.order_details.unit_price * self.order_details.quantity * (1 - self.order_details.discount)
-            ), Numeric(precision=10, scale=2)).label('extend_price')
-        ).join(self.order_details). \
-            group_by(self.order_details.order_id, self.products.product_id). \
-            order_by(self.order_details.order_id). \
-            distinct(). \
-            subquery()
-        query = select(
-            self.categories.category_id,
-            self.products.product_name,
-            self.categories.category_name,
-            func.sum(subquery.c.extend_price).label('product_sales')
-        ).join(self.products, self.products.category_id == self.categories.category_id). \
-            join(subquery, subquery.c.product_id == self.products.product_id). \
-            join(self.orders, self.orders.order_id == subquery.c.order_id). \
-            where(and_(
-            self.orders.order_date >= '1997-1-1',
-            self.orders.order_date <= "1997-12-31"
-        )). \
-            group_by(
-            self.categories.category_id,
-            self.categories.category_name,
-            self.products.product_name
-        ). \
-            order_by(
-            self.categories.category_id,
-            self.categories.category_name,
-            self.products.product_name
-        )
-        return self.session.execute(query).fetchall()
+        """,
+    ))
 
+    @report()
     def ten_most_expensive_products(self):
         query = select(
             self.products.product_name,
             self.products.unit_price
         ).order_by(desc(self.products.unit_price)).distinct().limit(10)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @ranking(score='unit_price', partition_by=('category_name',), n=3, ties='include')
+    def most_expensive_products_per_category(self):
+        """
+        The three most expensive products of each category, with every product priced as the third one.
+        """
+        query = select(
+            self.categories.category_name,
+            self.products.product_name,
+            self.products.unit_price
+        ).join(self.categories)
+        return query
+
+    @report()
     def product_by_category(self):
         query = select(
             self.categories.category_name,
@@ -192,8 +217,9 @@ class SQLQueryNorthwind(BaseSQLQuery):
             self.categories.category_name,
             self.products.product_name
         )
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def customer_and_suppliers_by_city(self):
         query_1 = select(
             self.customers.city,
@@ -208,9 +234,9 @@ class SQLQueryNorthwind(BaseSQLQuery):
         query = query_1.union(
             query_2
         ).order_by(self.customers.city, self.suppliers.company_name)
-        print(query)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def products_above_average_price(self):
         subquery = select(
             func.avg(self.products.unit_price)
@@ -220,63 +246,40 @@ class SQLQueryNorthwind(BaseSQLQuery):
             self.products.unit_price
         ).where(self.products.unit_price > subquery). \
             order_by(self.products.unit_price)
-        return self.session.execute(query).fetchall()
+        return query
 
+    @report()
     def product_sales_for_1997(self):
         query = select(
             self.categories.category_name,
             self.products.product_name,
-            func.cast(func.sum(
-                self.order_details.unit_price * self.order_details.quantity * (1 - self.order_details.discount)
-            ), Numeric(precision=10, scale=2)).label('extend_price'),
+            revenue(SpecContext(self)).label('extend_price'),
             func.extract('quarter', self.orders.shipped_date).label('shipped_quarter')
         ).join(self.products, self.categories.category_id == self.categories.category_id). \
             join(self.order_details, self.order_details.product_id == self.products.product_id). \
             join(self.orders, self.orders.order_id == self.order_details.order_id). \
             where(and_(
-            self.orders.shipped_date >= '1997-01-01',
-            self.orders.shipped_date <= '1997-12-31'
+            self.orders.shipped_date >= bindparam('date_from', date(1997, 1, 1)),
+            self.orders.shipped_date <= bindparam('date_to', date(1997, 12, 31))
         )). \
             group_by(self.categories.category_name, self.products.product_name, 'shipped_quarter'). \
             order_by(self.categories.category_name, self.products.product_name, 'shipped_quarter'). \
             distinct()
-        return self.session.execute(query).fetchall()
-
-    def quarterly_orders_by_product(self):
-        sum_query = func.cast(func.sum(
-            self.order_details.unit_price * self.order_details.quantity * (1 - self.order_details.discount)
-        ), Numeric(precision=10, scale=2))
+        return query
 
-        def sub_case(quart: str) -> case:
-            return case((
-                func.extract('quarter', self.orders.order_date) == quart,
-                sum_query
-            ),
-                else_=0
-            ).label(f'qtr {quart}')
-
-        query = select(
-            self.products.product_name,
-            self.customers.company_name,
-            func.extract('year', self.orders.order_date).label('order_year'),
-            sub_case('1'),
-            sub_case('2'),
-            sub_case('3'),
-            sub_case('4'),
-        ).join(self.order_details, self.order_details.product_id == self.products.product_id). \
-            join(self.orders, self.orders.order_id == self.order_details.order_id). \
-            join(self.customers, self.customers.customer_id == self.orders.customer_id). \
-            where(and_(
-            self.orders.shipped_date >= '1997-01-01',
-            self.orders.shipped_date <= '1997-12-31'
-        )). \
-            group_by(
-            self.orders.order_date,
-            self.products.product_name,
-            self.customers.company_name,
-        ). \
-            order_by(
-            self.products.product_name,
-            self.customers.company_name
-        )
-        return self.session.execute(query).fetchall()
+    quarterly_orders_by_product = SpecReport(ReportSpec(
+        dimensions=(
+            Field('products.product_name'),
+            Field('customers.company_name'),
+            Field(lambda context: func.extract('year', context.orders.order_date), 'order_year'),
+        ),
+        measures=tuple(quarter_revenue(quarter) for quarter in range(1, 5)),
+        joins=(
+            Join('order_details', lambda context: context.order_details.product_id == context.products.product_id),
+            Join('orders', lambda context: context.orders.order_id == context.order_details.order_id),
+            Join('customers', lambda context: context.customers.customer_id == context.orders.customer_id),
+        ),
+        filters=(window('orders.shipped_date', date(1997, 1, 1), date(1997, 12, 31)),),
+        group_by=('orders.order_date', 'products.product_name', 'customers.company_name'),
+        order_by=('product_name', 'company_name'),
+    ))
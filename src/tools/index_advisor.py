@@ -0,0 +1,227 @@
+import argparse
+import statistics
+import time
+from dataclasses import dataclass, field
+
+from sqlalchemy import Engine, Executable, Index, MetaData, Table, create_engine as create_engine_, inspect, text
+from sqlalchemy.schema import CreateIndex, DropIndex
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.elements import ClauseElement
+
+from src.config.db_setup import build_session, get_engine
+from src.config.schema_cache import load_base
+from src.sql.base_sql_query import BaseSQLQuery
+from src.sql.datasets import QUERY_CLASSES
+
+
+@dataclass
+class ColumnUsage:
+    joins: set[tuple[str, str]] = field(default_factory=set)
+    filters: set[tuple[str, str]] = field(default_factory=set)
+    wrapped_filters: set[tuple[str, str]] = field(default_factory=set)
+    order_by: list[tuple[tuple[str, str], ...]] = field(default_factory=list)
+
+
+@dataclass
+class Recommendation:
+    table: str
+    columns: tuple[str, ...]
+    reasons: set[str] = field(default_factory=set)
+    reports: set[str] = field(default_factory=set)
+
+    @property
+    def name(self) -> str:
+        return f'ix_{self.table}_{"_".join(self.columns)}'.lower()
+
+
+def _table_columns(element: ClauseElement) -> list[tuple[str, str]]:
+    """
+    Base table columns of an expression, following subquery columns back to their tables.
+    """
+    columns = []
+    for item in visitors.iterate(element):
+        if item.__visit_name__ != 'column':
+            continue
+        for base_column in getattr(item, 'base_columns', {item}):
+            if isinstance(getattr(base_column, 'table', None), Table):
+                columns.append((base_column.table.name, base_column.name))
+    return columns
+
+
+def _filter_columns(element: ClauseElement, usage: ColumnUsage, wrapped: bool = False) -> None:
+    if element.__visit_name__ in ('function', 'extract', 'cast'):
+        wrapped = True
+    if element.__visit_name__ == 'column':
+        for column in _table_columns(element):
+            (usage.wrapped_filters if wrapped else usage.filters).add(column)
+        return
+    for child in element.get_children():
+        _filter_columns(child, usage, wrapped)
+
+
+def core_statement(statement: Executable, dialect) -> Executable:
+    """
+    Core form of an ORM statement, with joins against mapped classes turned into ON clauses.
+    """
+    compile_state = getattr(statement.compile(dialect=dialect), 'compile_state', None)
+    resolved = getattr(compile_state, 'statement', None)
+    return statement if resolved is None else resolved
+
+
+def column_usage(statement: Executable, dialect, usage: ColumnUsage | None = None) -> ColumnUsage:
+    usage = usage or ColumnUsage()
+    core = core_statement(statement, dialect)
+    for element in visitors.iterate(core):
+        name = element.__visit_name__
+        if name == 'select' and element is not core and element._setup_joins:
+            column_usage(element, dialect, usage)
+        elif name == 'join' and element.onclause is not None:
+            usage.joins.update(_table_columns(element.onclause))
+        elif name == 'select':
+            for criteria in element._where_criteria:
+                _filter_columns(criteria, usage)
+            order_by = tuple(column for clause in element._order_by_clauses for column in _table_columns(clause))
+            if order_by and len({table for table, _ in order_by}) == 1:
+                usage.order_by.append(order_by)
+    return usage
+
+
+def existing_indexes(engine: Engine) -> dict[str, list[tuple[str, ...]]]:
+    """
+    Column lists of the indexes, primary keys and unique constraints of every table.
+    """
+    inspector = inspect(engine)
+    indexes = {}
+    for table in inspector.get_table_names():
+        columns = [tuple(inspector.get_pk_constraint(table)['constrained_columns'])]
+        columns.extend(tuple(index['column_names']) for index in inspector.get_indexes(table))
+        columns.extend(tuple(unique['column_names']) for unique in inspector.get_unique_constraints(table))
+        indexes[table] = [item for item in columns if item and None not in item]
+    return indexes
+
+
+def _covered(columns: tuple[str, ...], indexes: list[tuple[str, ...]]) -> bool:
+    return any(index[:len(columns)] == columns for index in indexes)
+
+
+def advise(sql_objs: list[BaseSQLQuery], engine: Engine) -> list[Recommendation]:
+    indexes = existing_indexes(engine)
+    recommendations: dict[tuple[str, tuple[str, ...]], Recommendation] = {}
+
+    def add(table: str, columns: tuple[str, ...], reason: str, report: str) -> None:
+        if _covered(columns, indexes.get(table, [])):
+            return
+        recommendation = recommendations.setdefault(
+            (table, columns), Recommendation(table=table, columns=columns)
+        )
+        recommendation.reasons.add(reason)
+        recommendation.reports.add(report)
+
+    for sql_obj in sql_objs:
+        for name in sql_obj.reports():
+            usage = column_usage(sql_obj.statement(name), engine.dialect)
+            for table, column in usage.joins:
+                add(table, (column,), 'join', name)
+            for table, column in usage.filters:
+                add(table, (column,), 'filter', name)
+            for table, column in usage.wrapped_filters:
+                add(table, (column,), 'filter through a function', name)
+            for order_by in usage.order_by:
+                add(order_by[0][0], tuple(column for _, column in order_by), 'order by', name)
+
+    # A single-column candidate that leads a composite one is served by the composite index
+    for key, recommendation in list(recommendations.items()):
+        wider = next((
+            other for other in recommendations.values()
+            if other.table == recommendation.table
+            and len(other.columns) > len(recommendation.columns)
+            and other.columns[:len(recommendation.columns)] == recommendation.columns
+        ), None)
+        if wider is not None:
+            wider.reasons |= recommendation.reasons
+            wider.reports |= recommendation.reports
+            del recommendations[key]
+
+    return sorted(recommendations.values(), key=lambda item: (item.table, item.columns))
+
+
+def _index(recommendation: Recommendation, metadata: MetaData) -> Index:
+    table = metadata.tables[recommendation.table]
+    return Index(recommendation.name, *(table.c[column] for column in recommendation.columns))
+
+
+def migration_sql(recommendations: list[Recommendation], metadata: MetaData, engine: Engine) -> str:
+    statements = []
+    for recommendation in recommendations:
+        statements.append(
+            f'-- {", ".join(sorted(recommendation.reasons))}: {", ".join(sorted(recommendation.reports))}'
+        )
+        statements.append(
+            f'{CreateIndex(_index(recommendation, metadata), if_not_exists=True).compile(dialect=engine.dialect)};'
+        )
+    return '\n'.join(statements) + '\n'
+
+
+def time_reports(sql_objs: list[BaseSQLQuery], runs: int) -> dict[str, float]:
+    timings = {}
+    for sql_obj in sql_objs:
+        for name in sql_obj.reports():
+            samples = []
+            getattr(sql_obj, name)()
+            for _ in range(runs):
+                start = time.perf_counter()
+                getattr(sql_obj, name)()
+                samples.append((time.perf_counter() - start) * 1000)
+            timings[name] = statistics.median(samples)
+            sql_obj.session.expunge_all()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Suggest indexes for the columns the reports join, filter and sort on.')
+    parser.add_argument('dataset', choices=QUERY_CLASSES)
+    parser.add_argument('--url', help='database URL, defaults to the dataset\'s configured database')
+    parser.add_argument('--output', help='write the CREATE INDEX migration to this file')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='time every report, create the indexes, time again and drop them')
+    parser.add_argument('--keep', action='store_true', help='keep the indexes created by --benchmark')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine_(args.url) if args.url else get_engine(args.dataset)
+    base = load_base(engine)
+    sql_obj = QUERY_CLASSES[args.dataset](base=base, session=build_session(engine=engine))
+
+    recommendations = advise([sql_obj], engine)
+    migration = migration_sql(recommendations, base.metadata, engine)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(migration)
+    else:
+        print(migration)
+
+    if not args.benchmark or not recommendations:
+        return
+
+    before = time_reports([sql_obj], args.runs)
+    indexes = [_index(recommendation, base.metadata) for recommendation in recommendations]
+    sql_obj.session.close()
+    with engine.begin() as connection:
+        for index in indexes:
+            connection.execute(CreateIndex(index, if_not_exists=True))
+        connection.execute(text('ANALYZE'))
+    after = time_reports([sql_obj], args.runs)
+    if not args.keep:
+        sql_obj.session.close()
+        with engine.begin() as connection:
+            for index in indexes:
+                connection.execute(DropIndex(index, if_exists=True))
+
+    print(f'{"report":<32} {"before ms":>10} {"after ms":>10} {"speedup":>8}')
+    for name, before_ms in before.items():
+        after_ms = after[name]
+        print(f'{name:<32} {before_ms:>10.2f} {after_ms:>10.2f} {before_ms / after_ms if after_ms else 0:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
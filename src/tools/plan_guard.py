@@ -0,0 +1,342 @@
+import argparse
+import hashlib
+import json
+import re
+import sys
+import warnings
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sqlalchemy import Column, Connection, Engine, Executable, MetaData, Table, create_engine as create_engine_, \
+    exc, func, select, text
+from sqlalchemy.sql import compiler, operators, visitors
+from sqlalchemy.sql.elements import ClauseElement, _anonymous_label
+from sqlalchemy.sql.selectable import Join
+from sqlalchemy.sql.util import find_tables
+
+from src.config.db_setup import build_session, get_engine
+from src.config.schema_cache import load_base
+from src.sql.base_sql_query import BaseSQLQuery
+from src.sql.datasets import QUERY_CLASSES
+from src.sql.instrumentation import capture_plan
+from src.tools.index_advisor import column_usage, core_statement
+
+BASELINE = Path(__file__).with_name('plan_guard_baseline.json')
+
+_PG_TABLE_ROWS = text("""
+    SELECT relname, reltuples::bigint
+    FROM pg_class
+    WHERE relnamespace = current_schema()::regnamespace AND relkind = 'r'
+""")
+_PG_JOINS = ('Nested Loop', 'Hash Join', 'Merge Join')
+
+
+@dataclass(frozen=True)
+class Finding:
+    report: str
+    check: str
+    subject: str
+    detail: str = field(default='', compare=False)
+
+    @property
+    def key(self) -> str:
+        return f'{self.report}: {self.check}: {self.subject}'
+
+
+def _source_name(selectable) -> str:
+    """
+    Name of a FROM element as findings and baselines refer to it. Anonymous subqueries and aliases get their
+    generated name anew on every run, so they are named by the tables they read and a digest of their SQL.
+    """
+    name = getattr(selectable, 'name', None)
+    if name is not None and not isinstance(name, _anonymous_label):
+        return name
+    element = getattr(selectable, 'element', selectable)
+    tables = sorted({table.name for table in find_tables(element, include_aliases=True)})
+    digest = hashlib.sha1(str(element).encode()).hexdigest()[:8]
+    return f'anonymous({", ".join(tables)})#{digest}'
+
+
+def _sources(selectable) -> set[str]:
+    """
+    Names of the tables, subqueries and CTEs a FROM element is made of.
+    """
+    if isinstance(selectable, Join):
+        return _sources(selectable.left) | _sources(selectable.right)
+    return {_source_name(selectable)}
+
+
+def _referenced(element: ClauseElement) -> set[str]:
+    return {
+        _source_name(item.table) for item in visitors.iterate(element)
+        if item.__visit_name__ == 'column' and getattr(item, 'table', None) is not None
+    }
+
+
+def _base_column(column, metadata: MetaData) -> Column | None:
+    """
+    Table column an expression stands for, following subquery and CTE columns back to their table.
+    """
+    base = [item for item in getattr(column, 'base_columns', {column}) if isinstance(getattr(item, 'table', None), Table)]
+    if len(base) != 1:
+        return None
+    table = metadata.tables.get(base[0].table.name)
+    return None if table is None else table.c.get(base[0].name)
+
+
+def _key_pair(left: Column, right: Column) -> bool:
+    if left is right:
+        return True
+    return any(key.column is right for key in left.foreign_keys) or any(key.column is left for key in right.foreign_keys)
+
+
+def _join_findings(name: str, join: Join, metadata: MetaData) -> list[Finding]:
+    findings = []
+    referenced = _referenced(join.onclause)
+    left, right = _sources(join.left), _sources(join.right)
+    if not referenced & left or not referenced & right:
+        joined = ', '.join(sorted(right))
+        findings.append(Finding(
+            name, 'missing-join-predicate', joined,
+            f'the condition joining {joined} only references {", ".join(sorted(referenced)) or "no table"}: '
+            f'every row is joined to every row',
+        ))
+    for item in visitors.iterate(join.onclause):
+        if item.__visit_name__ != 'binary' or item.operator is not operators.eq:
+            continue
+        if item.left.__visit_name__ != 'column' or item.right.__visit_name__ != 'column':
+            continue
+        left_column, right_column = _base_column(item.left, metadata), _base_column(item.right, metadata)
+        if left_column is None or right_column is None or left_column.table is right_column.table:
+            continue
+        if not _key_pair(left_column, right_column):
+            subject = f'{left_column.table.name}.{left_column.name} = {right_column.table.name}.{right_column.name}'
+            findings.append(Finding(
+                name, 'non-key-join', subject, f'{subject} is not a foreign key, rows are matched on unrelated values',
+            ))
+    return findings
+
+
+def _implicit_froms(select_: ClauseElement) -> set[str]:
+    """
+    FROM elements a SELECT only gets through its WHERE or ORDER BY clauses.
+    """
+    named = set()
+    for column in select_._raw_columns:
+        for from_ in column._from_objects:
+            named |= _sources(from_)
+    for from_ in select_._from_obj:
+        named |= _sources(from_)
+    final = set()
+    for from_ in select_.get_final_froms():
+        final |= _sources(from_)
+    return final - named
+
+
+def _structure_findings(name: str, statement: Executable, dialect, metadata: MetaData) -> list[Finding]:
+    core = core_statement(statement, dialect)
+    findings = []
+    for element in visitors.iterate(core):
+        if element.__visit_name__ == 'select' and element is not core and element._setup_joins:
+            # ORM joins of a nested statement only become Join elements once it is compiled
+            findings.extend(_structure_findings(name, element, dialect, metadata))
+        elif isinstance(element, Join) and element.onclause is not None:
+            findings.extend(_join_findings(name, element, metadata))
+        elif element.__visit_name__ == 'select':
+            for source in sorted(_implicit_froms(element)):
+                findings.append(Finding(
+                    name, 'implicit-from', source,
+                    f'{source} is only named in the WHERE clause, the FROM list is inferred from it',
+                ))
+    return findings
+
+
+def static_findings(name: str, statement: Executable, dialect, metadata: MetaData) -> list[Finding]:
+    """
+    Joins without a condition between their sides, joins on columns no foreign key relates,
+    tables pulled in by a WHERE clause alone and FROM elements left unjoined.
+    """
+    findings = _structure_findings(name, statement, dialect, metadata)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', exc.SAWarning)
+        statement.compile(dialect=dialect, linting=compiler.COLLECT_CARTESIAN_PRODUCTS | compiler.WARN_LINTING)
+    for warning in caught:
+        message = str(warning.message)
+        if 'cartesian product' in message:
+            findings.append(Finding(name, 'cartesian-product', ', '.join(sorted(re.findall(r'"([^"]+)"', message))),
+                                    message))
+    return list(dict.fromkeys(findings))
+
+
+def table_rows(connection: Connection, metadata: MetaData) -> dict[str, int]:
+    """
+    Row count of every table: the planner's estimate on Postgres, counted elsewhere.
+    """
+    if connection.dialect.name == 'postgresql':
+        return {row.relname: row.reltuples for row in connection.execute(_PG_TABLE_ROWS)}
+    return {
+        name: connection.execute(select(func.count()).select_from(table)).scalar_one()
+        for name, table in metadata.tables.items()
+    }
+
+
+def _pg_nodes(node: dict, inner: bool = False):
+    yield node, inner
+    children = node.get('Plans', [])
+    for index, child in enumerate(children):
+        if node['Node Type'] == 'Nested Loop':
+            child_inner = index == 1
+        else:
+            child_inner = inner and len(children) == 1
+        yield from _pg_nodes(child, child_inner)
+
+
+def _relations(node: dict) -> list[str]:
+    return sorted({item['Relation Name'] for item, _ in _pg_nodes(node) if 'Relation Name' in item})
+
+
+def _postgres_plan_findings(name: str, plan, rows: dict[str, int], large_table_rows: int,
+                            blowup: float) -> list[Finding]:
+    findings = []
+    for node, inner in _pg_nodes(plan[0]['Plan']):
+        kind, relation = node['Node Type'], node.get('Relation Name')
+        if kind == 'Seq Scan' and inner:
+            findings.append(Finding(
+                name, 'nested-scan', relation, f'{relation} is scanned in full once per row of the outer side of a join',
+            ))
+        elif kind == 'Seq Scan' and 'Filter' in node and rows.get(relation, 0) >= large_table_rows:
+            findings.append(Finding(
+                name, 'full-scan', relation, f'{relation} ({rows[relation]} rows) is scanned in full to filter '
+                                             f'on {node["Filter"]}',
+            ))
+        elif kind in _PG_JOINS and node.get('Plans'):
+            widest = max(child['Plan Rows'] for child in node['Plans'])
+            if node['Plan Rows'] >= large_table_rows and node['Plan Rows'] > blowup * max(widest, 1):
+                joined = ' x '.join(_relations(node))
+                findings.append(Finding(
+                    name, 'row-blowup', joined,
+                    f'the join of {joined} is estimated at {node["Plan Rows"]} rows from inputs of at most {widest}',
+                ))
+    return findings
+
+
+def _sqlite_plan_findings(name: str, plan, rows: dict[str, int], filtered: set[str],
+                          large_table_rows: int) -> list[Finding]:
+    findings = []
+    loops: dict[int, int] = {}
+    for _, parent, _, detail in plan:
+        words = detail.split()
+        if words[0] not in ('SCAN', 'SEARCH') or words[1] == 'CONSTANT':
+            continue
+        relation = words[1]
+        loops[parent] = loops.get(parent, 0) + 1
+        if words[0] != 'SCAN':
+            continue
+        if loops[parent] > 1:
+            findings.append(Finding(
+                name, 'nested-scan', relation, f'{relation} is scanned in full once per row of the tables before it',
+            ))
+        elif relation in filtered and rows.get(relation, 0) >= large_table_rows:
+            findings.append(Finding(
+                name, 'full-scan', relation, f'{relation} ({rows[relation]} rows) is scanned in full to be filtered',
+            ))
+    return findings
+
+
+def plan_findings(name: str, sql_obj: BaseSQLQuery, connection: Connection, rows: dict[str, int],
+                  large_table_rows: int = 1000, blowup: float = 10.0) -> list[Finding]:
+    """
+    Checks on the plan of a report: tables scanned in full on the inner side of a join, which makes the report
+    quadratic in their size, large tables scanned in full to be filtered, and joins estimated to return far more
+    rows than they are given. SQLite plans carry no row estimates, so the last check only runs on Postgres.
+    """
+    statement = sql_obj.statement(name)
+    plan = capture_plan(connection, statement, sql_obj.report_params(name))
+    if connection.dialect.name == 'postgresql':
+        return _postgres_plan_findings(name, plan, rows, large_table_rows, blowup)
+    if connection.dialect.name == 'sqlite':
+        usage = column_usage(statement, connection.dialect)
+        filtered = {table for table, _ in usage.filters | usage.wrapped_filters}
+        return _sqlite_plan_findings(name, plan, rows, filtered, large_table_rows)
+    return []
+
+
+def check_reports(sql_obj: BaseSQLQuery, engine: Engine, explain: bool = True, large_table_rows: int = 1000,
+                  blowup: float = 10.0) -> list[Finding]:
+    metadata = sql_obj.base.metadata
+    findings = []
+    for name in sql_obj.reports():
+        findings.extend(static_findings(name, sql_obj.statement(name), engine.dialect, metadata))
+    if explain:
+        with engine.connect() as connection:
+            rows = table_rows(connection, metadata)
+            for name in sql_obj.reports():
+                findings.extend(plan_findings(name, sql_obj, connection, rows, large_table_rows, blowup))
+    return findings
+
+
+def load_baseline(dataset: str, path: str | Path = BASELINE) -> set[str]:
+    try:
+        with open(path) as file:
+            return set(json.load(file).get(dataset, []))
+    except FileNotFoundError:
+        return set()
+
+
+def save_baseline(dataset: str, findings: list[Finding], path: str | Path = BASELINE) -> None:
+    try:
+        with open(path) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        baseline = {}
+    baseline[dataset] = sorted({finding.key for finding in findings})
+    with open(path, 'w') as file:
+        json.dump(baseline, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Flag reports with cartesian joins, unrelated join keys and full scans. '
+                    'Exits with status 1 when a finding is not in the baseline.'
+    )
+    parser.add_argument('dataset', choices=QUERY_CLASSES)
+    parser.add_argument('--url', help='database URL, defaults to the dataset\'s configured database')
+    parser.add_argument('--baseline', default=BASELINE, help='JSON file of the accepted findings per dataset')
+    parser.add_argument('--update-baseline', action='store_true', help='accept the current findings')
+    parser.add_argument('--strict', action='store_true', help='fail on accepted findings as well')
+    parser.add_argument('--no-explain', action='store_true', help='only run the checks that need no database')
+    parser.add_argument('--large-table-rows', type=int, default=1000,
+                        help='tables from this size on are not expected to be scanned to be filtered')
+    parser.add_argument('--blowup', type=float, default=10.0,
+                        help='flag joins estimated to return this many times more rows than their largest input')
+    args = parser.parse_args()
+
+    engine = create_engine_(args.url) if args.url else get_engine(args.dataset)
+    with build_session(engine=engine) as session:
+        sql_obj = QUERY_CLASSES[args.dataset](base=load_base(engine), session=session)
+        findings = check_reports(sql_obj, engine, explain=not args.no_explain,
+                                 large_table_rows=args.large_table_rows, blowup=args.blowup)
+
+    if args.update_baseline:
+        save_baseline(args.dataset, findings, args.baseline)
+        print(f'{len(findings)} findings accepted in {args.baseline}')
+        return
+
+    baseline = load_baseline(args.dataset, args.baseline)
+    new = [finding for finding in findings if args.strict or finding.key not in baseline]
+    for finding in findings:
+        status = 'NEW' if finding in new else 'known'
+        print(f'{status:<6} {finding.report:<32} {finding.check:<24} {finding.detail}')
+    checked = {finding.report for finding in findings}
+    for key in sorted(baseline - {finding.key for finding in findings}):
+        if args.no_explain and key.split(': ')[1] in ('nested-scan', 'full-scan', 'row-blowup'):
+            continue
+        print(f'{"fixed":<6} {key}')
+    print(f'{len(findings)} findings in {len(checked)} reports, {len(new)} not accepted')
+    if new:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
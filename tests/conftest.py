@@ -0,0 +1,25 @@
+import shutil
+
+import pytest
+from sqlalchemy import create_engine
+
+from src.config.embedded import sqlite_file
+
+
+@pytest.fixture
+def sqlite_copy(tmp_path):
+    """
+    Engine of a writable SQLite copy of a dataset, loaded from its bundled dump.
+    """
+    engines = []
+
+    def copy(dataset: str):
+        path = tmp_path / f'{dataset}-{len(engines)}.db'
+        shutil.copyfile(sqlite_file(dataset), path)
+        engine = create_engine(f'sqlite:///{path}')
+        engines.append(engine)
+        return engine
+
+    yield copy
+    for engine in engines:
+        engine.dispose()
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.config.db_setup import async_session_factory, build_session
+from src.config.embedded import sqlite_file
+from src.config.schema_cache import load_base, load_base_async
+from src.sql.datasets import ASYNC_QUERY_CLASSES, QUERY_CLASSES
+from src.sql.result_cache import ResultCache
+
+BUNDLED = [
+    (dataset, name, report_name)
+    for dataset, query_cls in QUERY_CLASSES.items()
+    for name, reports in query_cls.bundles().items()
+    for report_name in reports
+]
+
+
+def shape(result):
+    rows = result if isinstance(result, list) else [result]
+    return type(result), [(type(row), tuple(row._mapping.items())) for row in rows if row is not None]
+
+
+@pytest.mark.parametrize('dataset, name, report_name', BUNDLED)
+def test_report_cached_by_its_bundle_matches_the_report(dataset, name, report_name, monkeypatch):
+    engine = create_engine(f'sqlite:///{sqlite_file(dataset)}')
+    base = load_base(engine)
+    query_cls = QUERY_CLASSES[dataset]
+    with build_session(engine=engine) as session:
+        expected = query_cls(base=base, session=session).run_report(report_name)
+
+        cache = ResultCache()
+        monkeypatch.setattr(query_cls, 'result_cache', cache)
+        sql_obj = query_cls(base=base, session=session)
+        sql_obj.run_bundle(name)
+        cached = sql_obj.run_report(report_name)
+    engine.dispose()
+
+    assert cache.stats()['hits'] == 1
+    assert shape(cached) == shape(expected)
+
+
+@pytest.mark.parametrize('dataset, name, report_name', BUNDLED)
+def test_async_bundle_fills_the_cache_like_the_sync_one(dataset, name, report_name, monkeypatch):
+    query_cls = ASYNC_QUERY_CLASSES[dataset]
+
+    async def run():
+        engine = create_async_engine(f'sqlite+aiosqlite:///{sqlite_file(dataset)}')
+        base = await load_base_async(engine)
+        try:
+            async with async_session_factory(engine)() as session:
+                expected = await query_cls(base=base, session=session).run_report(report_name)
+                monkeypatch.setattr(query_cls, 'result_cache', ResultCache())
+                sql_obj = query_cls(base=base, session=session)
+                await sql_obj.run_bundle(name)
+                return expected, await sql_obj.run_report(report_name)
+        finally:
+            await engine.dispose()
+
+    expected, cached = asyncio.run(run())
+    assert query_cls.result_cache.stats()['hits'] == 1
+    assert shape(cached) == shape(expected)
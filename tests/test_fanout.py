@@ -0,0 +1,129 @@
+from collections import Counter
+
+import pytest
+from sqlalchemy import text
+
+from src.config.db_setup import build_session
+from src.config.embedded import sqlite_file
+from src.config.schema_cache import load_base
+from src.fanout import FanoutExecutor
+from src.sql.datasets import QUERY_CLASSES
+
+
+def rows_of(result) -> list[tuple]:
+    rows = result if isinstance(result, list) else [] if result is None else [result]
+    return [tuple(row) for row in rows]
+
+
+@pytest.fixture(scope='module')
+def executors():
+    executors = {dataset: FanoutExecutor(dataset, [f'sqlite:///{sqlite_file(dataset)}']) for dataset in QUERY_CLASSES}
+    yield executors
+    for executor in executors.values():
+        executor.close()
+
+
+@pytest.mark.parametrize('dataset, name', [
+    (dataset, name) for dataset, query_cls in QUERY_CLASSES.items() for name in query_cls.reports()
+])
+def test_one_shard_fanout_equals_the_report(executors, dataset, name):
+    executor = executors[dataset]
+    engine = next(iter(executor.engines.values()))
+    with build_session(engine=engine) as session:
+        expected = QUERY_CLASSES[dataset](base=load_base(engine), session=session).fast_report(name)
+    result = executor.run(name)
+
+    assert not result.errors
+    assert rows_of(result.rows) == rows_of(expected)
+    if expected:
+        first = expected if not isinstance(expected, list) else expected[0]
+        merged = result.rows if not isinstance(result.rows, list) else result.rows[0]
+        assert merged._fields == first._fields
+
+
+def test_every_shard_failing_returns_the_errors():
+    executor = FanoutExecutor('chinook', ['sqlite:////nonexistent/dir/a.db', 'sqlite:////nonexistent/dir/b.db'])
+    try:
+        result = executor.run('sales_per_country')
+    finally:
+        executor.close()
+    assert result.rows == []
+    assert len(result.errors) == 2
+
+
+def run_on(engine, dataset: str, name: str):
+    with build_session(engine=engine) as session:
+        return QUERY_CLASSES[dataset](base=load_base(engine), session=session).fast_report(name)
+
+
+@pytest.fixture
+def chinook_shards(sqlite_copy):
+    first, second = sqlite_copy('chinook'), sqlite_copy('chinook')
+    # Canada leads the second shard while the USA leads the first one
+    with second.begin() as connection:
+        connection.execute(text(
+            'UPDATE "Invoice" SET "Total" = "Total" * 3 '
+            'WHERE "CustomerId" IN (SELECT "CustomerId" FROM "Customer" WHERE "Country" = \'Canada\')'
+        ))
+    executor = FanoutExecutor('chinook', [str(first.url), str(second.url)])
+    yield executor, [first, second]
+    executor.close()
+
+
+@pytest.fixture
+def northwind_shards(sqlite_copy):
+    first, second = sqlite_copy('northwind'), sqlite_copy('northwind')
+    with second.begin() as connection:
+        connection.execute(text('UPDATE products SET unit_price = 1000 WHERE product_id = 1'))
+    executor = FanoutExecutor('northwind', [str(first.url), str(second.url)])
+    yield executor, [first, second]
+    executor.close()
+
+
+def test_counts_and_totals_are_summed_across_shards(chinook_shards):
+    executor, engines = chinook_shards
+    total = sum(run_on(engine, 'chinook', 'total_sales')[0] for engine in engines)
+    assert executor.run('total_sales').rows[0] == total
+
+    counts = Counter()
+    for engine in engines:
+        counts.update(dict(run_on(engine, 'chinook', 'country_invoices')))
+    assert dict(executor.run('country_invoices').rows) == dict(counts)
+
+
+def test_top_n_is_ranked_on_the_merged_totals(chinook_shards):
+    executor, engines = chinook_shards
+    totals = Counter()
+    for engine in engines:
+        totals.update(dict(run_on(engine, 'chinook', 'sales_per_country')))
+    country, total = totals.most_common(1)[0]
+
+    assert country != run_on(engines[0], 'chinook', 'top_country')[0][0]
+    assert executor.run('top_country').rows == [(country, total)]
+
+
+def test_limit_and_distinct_apply_to_the_merged_rows(northwind_shards):
+    executor, engines = northwind_shards
+    prices = set()
+    for engine in engines:
+        with engine.connect() as connection:
+            prices.update(map(tuple, connection.execute(text('SELECT product_name, unit_price FROM products'))))
+    expected = sorted(prices, key=lambda row: row[1], reverse=True)[:10]
+
+    merged = [tuple(row) for row in executor.run('ten_most_expensive_products').rows]
+    assert merged == expected
+    assert merged[0][1] == 1000
+
+
+def test_distinct_rows_appear_once_across_shards(chinook_shards):
+    executor, engines = chinook_shards
+    merged = executor.run('unique_invoice_countries').rows
+    assert sorted(merged) == sorted(run_on(engines[0], 'chinook', 'unique_invoice_countries'))
+
+
+def test_per_order_reports_keep_each_tenants_orders(northwind_shards):
+    executor, engines = northwind_shards
+    for name in ('order_subtotals', 'employee_sales_by_country'):
+        single = Counter(map(tuple, run_on(engines[0], 'northwind', name)))
+        merged = Counter(map(tuple, executor.run(name).rows))
+        assert merged == Counter({row: 2 * count for row, count in single.items()})
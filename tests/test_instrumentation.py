@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from src.sql.instrumentation import Instrumentation, NPlusOneDetector
+
+
+def run(engine, count: int) -> None:
+    with engine.connect() as connection:
+        for _ in range(count):
+            connection.execute(text('SELECT 1'))
+
+
+def test_watches_count_only_their_detector_and_engine():
+    engine, other = create_engine('sqlite://'), create_engine('sqlite://')
+    first, second = NPlusOneDetector(engine), NPlusOneDetector(engine)
+    elsewhere = NPlusOneDetector(other)
+    try:
+        with first.watch('first') as first_log, elsewhere.watch('elsewhere') as other_log:
+            run(engine, 3)
+            with second.watch('second') as second_log:
+                run(engine, 2)
+            run(other, 4)
+    finally:
+        for detector in (first, second, elsewhere):
+            detector.remove()
+    assert (first_log.total, second_log.total, other_log.total) == (5, 2, 4)
+
+
+def test_reports_are_measured_only_on_their_own_engine():
+    engine, other = create_engine('sqlite://'), create_engine('sqlite://')
+    instrumentation, elsewhere = Instrumentation(engine), Instrumentation(other)
+    try:
+        with instrumentation.measure('report') as metrics, elsewhere.measure('other') as other_metrics:
+            run(engine, 3)
+    finally:
+        instrumentation.remove()
+        elsewhere.remove()
+    assert (metrics.statements, other_metrics.statements) == (3, 0)
+
+
+def test_failed_statement_leaves_no_start_time_behind():
+    engine = create_engine('sqlite://')
+    instrumentation = Instrumentation(engine)
+    try:
+        with engine.connect() as connection:
+            with instrumentation.measure('report') as metrics:
+                with pytest.raises(OperationalError):
+                    connection.execute(text('SELECT * FROM no_such_table'))
+                connection.execute(text('SELECT 1'))
+            assert connection.info[instrumentation.started_key] == []
+    finally:
+        instrumentation.remove()
+    assert metrics.statements == 1
@@ -0,0 +1,34 @@
+import pytest
+from sqlalchemy import select, true
+
+from src.config.db_setup import build_session
+from src.config.embedded import embedded_engine
+from src.config.schema_cache import load_base
+from src.sql.datasets import QUERY_CLASSES
+from src.tools.plan_guard import check_reports, load_baseline, static_findings
+
+
+@pytest.mark.parametrize('dataset', QUERY_CLASSES)
+def test_no_findings_beyond_the_baseline(dataset):
+    engine = embedded_engine(dataset)
+    with build_session(engine=engine) as session:
+        sql_obj = QUERY_CLASSES[dataset](base=load_base(engine), session=session)
+        findings = check_reports(sql_obj, engine)
+
+    new = sorted({finding.key for finding in findings} - load_baseline(dataset))
+    assert not new, 'new plan findings, fix the reports or accept them with --update-baseline:\n' + '\n'.join(new)
+
+
+def test_anonymous_subqueries_have_stable_names():
+    engine = embedded_engine('chinook')
+    base = load_base(engine)
+    customer, invoice = base.classes['Customer'], base.classes['Invoice']
+
+    def findings():
+        totals = select(invoice.CustomerId, invoice.Total).where(invoice.Total > 5).subquery()
+        statement = select(customer.CustomerId, totals.c.Total).join(totals, true())
+        return [finding.key for finding in static_findings('report', statement, engine.dialect, base.metadata)]
+
+    first = findings()
+    assert len(first) == 1 and first[0].startswith('report: missing-join-predicate: anonymous(Invoice)#')
+    assert findings() == first
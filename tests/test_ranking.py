@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy import create_engine
+
+from src.config.db_setup import build_session
+from src.config.embedded import sqlite_file
+from src.config.schema_cache import load_base
+from src.sql.datasets import QUERY_CLASSES
+from src.sql.instrumentation import NPlusOneDetector
+
+
+@pytest.fixture
+def chinook():
+    engine = create_engine(f'sqlite:///{sqlite_file("chinook")}')
+    with build_session(engine=engine) as session:
+        yield QUERY_CLASSES['chinook'](base=load_base(engine), session=session)
+    engine.dispose()
+
+
+@pytest.mark.parametrize('n', [0, -1])
+def test_top_rejects_a_non_positive_n(chinook, n):
+    with pytest.raises(ValueError, match='n must be positive'):
+        chinook.top('top_tracks_per_genre', n=n)
+
+
+def test_top_rejects_an_unknown_partition_column(chinook):
+    with pytest.raises(ValueError, match='not selected by the statement: no_such_column'):
+        chinook.top('top_tracks_per_genre', partition_by=('no_such_column',))
+
+
+def test_custom_ranking_is_watched_for_n_plus_one(chinook, monkeypatch):
+    detector = NPlusOneDetector(chinook.session.get_bind())
+    monkeypatch.setattr(type(chinook), 'n_plus_one', detector)
+    try:
+        chinook.top('top_tracks_per_genre', n=1, partition_by=())
+    finally:
+        detector.remove()
+    assert detector.summary()['top_tracks_per_genre']['calls'] == 1
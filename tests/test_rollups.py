@@ -0,0 +1,105 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select
+
+from src.config.db_setup import build_session
+from src.config.schema_cache import load_base
+from src.sql.datasets import QUERY_CLASSES
+from src.sql.rollups import ROLLUPS, RollupManager
+
+
+def reports_with_rollups(engine, dataset: str, monkeypatch):
+    base = load_base(engine)
+    manager = RollupManager(engine, base.metadata, ROLLUPS[dataset])
+    manager.create()
+    manager.refresh_all(full=True)
+    session = build_session(engine=engine)
+    manager.watch(session)
+    monkeypatch.setattr(QUERY_CLASSES[dataset], 'rollups', manager)
+    return manager, QUERY_CLASSES[dataset](base=base, session=session)
+
+
+def without_rollups(sql_obj, name: str, monkeypatch, **params):
+    with monkeypatch.context() as patch:
+        patch.setattr(type(sql_obj), 'rollups', None)
+        return sql_obj.run_report(name, **params)
+
+
+def test_price_edit_rebuilds_order_subtotals(sqlite_copy, monkeypatch):
+    manager, sql_obj = reports_with_rollups(sqlite_copy('northwind'), 'northwind', monkeypatch)
+    order_details = sql_obj.order_details
+    line = sql_obj.session.scalars(select(order_details).where(order_details.order_id == 10248)).first()
+    line.unit_price += 100
+    sql_obj.session.commit()
+
+    assert manager.check('rollup_order_subtotals') == 'changed'
+    subtotals = dict(sql_obj.order_subtotals())
+    assert manager.check('rollup_order_subtotals') == 'fresh'
+    assert subtotals == dict(without_rollups(sql_obj, 'order_subtotals', monkeypatch))
+
+
+@pytest.mark.parametrize('column, change', [('unit_price', lambda value: value + 1), ('discount', lambda value: 0.25)])
+def test_measure_columns_are_checksummed(sqlite_copy, monkeypatch, column, change):
+    manager, sql_obj = reports_with_rollups(sqlite_copy('northwind'), 'northwind', monkeypatch)
+    line = sql_obj.session.scalars(select(sql_obj.order_details)).first()
+    setattr(line, column, change(getattr(line, column)))
+    sql_obj.session.commit()
+    assert manager.check('rollup_order_subtotals') == 'changed'
+
+
+def test_invoice_moved_to_another_year_rebuilds_customer_year_sales(sqlite_copy, monkeypatch):
+    manager, sql_obj = reports_with_rollups(sqlite_copy('chinook'), 'chinook', monkeypatch)
+    invoice = sql_obj.session.scalars(select(sql_obj.invoice).where(sql_obj.invoice.InvoiceId == 1)).one()
+    invoice.InvoiceDate -= timedelta(days=366)
+    sql_obj.session.commit()
+
+    assert manager.check('rollup_customer_year_sales') == 'changed'
+    for year in (2008, 2009):
+        assert sql_obj.top_2009_agent(year=year) == without_rollups(sql_obj, 'top_2009_agent', monkeypatch, year=year)
+
+
+def test_swapped_invoice_customers_rebuild_customer_year_sales(sqlite_copy, monkeypatch):
+    manager, sql_obj = reports_with_rollups(sqlite_copy('chinook'), 'chinook', monkeypatch)
+    invoice = sql_obj.invoice
+    first, second = sql_obj.session.scalars(
+        select(invoice).where(invoice.CustomerId.in_((4, 37))).order_by(invoice.InvoiceId).limit(2)
+    ).all()
+    first.CustomerId, second.CustomerId = second.CustomerId, first.CustomerId
+    sql_obj.session.commit()
+
+    assert manager.check('rollup_customer_year_sales') == 'changed'
+    assert sql_obj.sales_per_country() == without_rollups(sql_obj, 'sales_per_country', monkeypatch)
+
+
+def test_prices_swapped_between_order_lines_rebuild_order_subtotals(sqlite_copy, monkeypatch):
+    manager, sql_obj = reports_with_rollups(sqlite_copy('northwind'), 'northwind', monkeypatch)
+    order_details = sql_obj.order_details
+    first, second = sql_obj.session.scalars(
+        select(order_details).where(order_details.order_id == 10248).order_by(order_details.product_id).limit(2)
+    ).all()
+    first.unit_price, second.unit_price = second.unit_price, first.unit_price
+    sql_obj.session.commit()
+
+    assert manager.check('rollup_order_subtotals') == 'changed'
+    assert dict(sql_obj.order_subtotals()) == dict(without_rollups(sql_obj, 'order_subtotals', monkeypatch))
+
+
+def test_concurrent_refreshes_apply_new_rows_once(sqlite_copy, monkeypatch):
+    manager, sql_obj = reports_with_rollups(sqlite_copy('northwind'), 'northwind', monkeypatch)
+    sql_obj.session.add(sql_obj.order_details(order_id=99999, product_id=1, unit_price=10, quantity=3, discount=0))
+    sql_obj.session.commit()
+    assert manager.check('rollup_order_subtotals') == 'append'
+
+    barrier = threading.Barrier(4)
+
+    def refresh():
+        barrier.wait()
+        return manager.refresh('rollup_order_subtotals')
+
+    with ThreadPoolExecutor(4) as pool:
+        written = list(pool.map(lambda _: refresh(), range(4)))
+    assert sorted(written) == [0, 0, 0, 1]
+    assert dict(sql_obj.order_subtotals())[99999] == 30
@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+
+from src.config.embedded import embedded_async_engine
+from src.server import ReportServer
+
+
+async def serving(test, **options):
+    engine = embedded_async_engine('chinook')
+    server = ReportServer({'chinook': engine}, **options)
+    listener = await server.start(port=0)
+    try:
+        return await test(server, listener.sockets[0].getsockname()[1])
+    finally:
+        listener.close()
+        await listener.wait_closed()
+        await engine.dispose()
+
+
+async def get(port: int, target: str, headers: str = '') -> tuple[int, dict, bytes]:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n{headers}Connection: close\r\n\r\n'.encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    status_line, *lines = head.decode('latin-1').split('\r\n')
+    return int(status_line.split()[1]), dict(line.split(': ', 1) for line in lines), body
+
+
+def chunks(body: bytes) -> list[bytes]:
+    parts = []
+    while True:
+        size, _, body = body.partition(b'\r\n')
+        if int(size, 16) == 0:
+            return parts
+        parts.append(body[:int(size, 16)])
+        body = body[int(size, 16) + 2:]
+
+
+def test_identical_concurrent_requests_share_one_execution(monkeypatch):
+    execute = ReportServer._execute
+
+    async def slow_execute(self, *args):
+        # Keeps the first execution in flight while the other requests arrive
+        await asyncio.sleep(0.2)
+        return await execute(self, *args)
+
+    monkeypatch.setattr(ReportServer, '_execute', slow_execute)
+
+    async def test(server, port):
+        responses = await asyncio.gather(*(get(port, '/chinook/invoice_totals') for _ in range(8)))
+        assert {status for status, _, _ in responses} == {200}
+        assert len({body for _, _, body in responses}) == 1
+        assert server.stats['executions'] == 1
+        assert server.stats['coalesced'] == 7
+        return json.loads(responses[0][2])
+
+    assert len(asyncio.run(serving(test))['rows']) > 0
+
+
+def test_ndjson_is_streamed_in_chunks():
+    async def test(server, port):
+        whole = await get(port, '/chinook/line_item_track')
+        streamed = await get(port, '/chinook/line_item_track?format=ndjson')
+        return whole, streamed
+
+    (_, _, whole), (status, headers, body) = asyncio.run(serving(test, batch_size=100))
+    assert status == 200
+    assert headers['Transfer-Encoding'] == 'chunked'
+    parts = chunks(body)
+    rows = [json.loads(line) for part in parts for line in part.splitlines()]
+    assert len(parts) == -(-len(rows) // 100) > 1
+    assert rows == json.loads(whole)['rows']
+
+
+@pytest.mark.parametrize('target, headers, status', [
+    ('/chinook/sales_agent_total_sales?no_such_param=1', '', 400),
+    ('/chinook/top_2009_agent?year=last', '', 400),
+    ('/chinook/top_tracks_per_genre?partition_by=no_such_column', '', 400),
+    ('/chinook/invoice_totals?ties=none', '', 400),
+    ('/chinook/no_such_report', '', 404),
+    ('/chinook/invoice_totals', f'X-Padding: {"x" * 70000}\r\n', 431),
+], ids=['unknown parameter', 'invalid value', 'unknown partition', 'not a ranking', 'unknown report', 'long header'])
+def test_bad_requests_are_client_errors(target, headers, status):
+    async def test(server, port):
+        return await get(port, target, headers)
+
+    answered, _, body = asyncio.run(serving(test))
+    assert answered == status
+    assert 'error' in json.loads(body)